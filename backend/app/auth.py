@@ -4,9 +4,71 @@ https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
 """
 import hashlib
 import hmac
+import json
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
 from urllib.parse import parse_qsl
 
 from .config import get_config
+from .metrics import registry
+
+
+class AuthCache:
+    """
+    Кэш уже проверенных initData (ключ — вся строка initData, а не только hash:
+    иначе чужой hash можно было бы приклеить к подменённым полям).
+    Переподключившийся клиент присылает ту же строку и пропускает HMAC и разбор.
+    Запись живёт не дольше ttl_s и не дольше, чем initData остаётся свежим по auth_date.
+    """
+
+    def __init__(self, ttl_s: float = 300.0, max_size: int = 10000):
+        self.ttl_s = ttl_s
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected_stale = 0
+
+    def get(self, init_data: str, now: float) -> dict[str, Any] | None:
+        entry = self._entries.get(init_data)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at < now:
+            del self._entries[init_data]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(init_data)
+        self.hits += 1
+        return user
+
+    def put(self, init_data: str, user: dict[str, Any], expires_at: float) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[init_data] = (expires_at, user)
+        self._entries.move_to_end(init_data)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "cached": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected_stale": self.rejected_stale,
+        }
+
+
+@lru_cache(maxsize=4)
+def _secret_key(token: str) -> bytes:
+    """HMAC("WebAppData", token) зависит только от токена бота — считаем один раз."""
+    return hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
 
 
 def validate_init_data(init_data: str) -> dict | None:
@@ -24,6 +86,11 @@ def validate_init_data(init_data: str) -> dict | None:
             return _parse_init_data_unsafe(init_data)
         return None
 
+    now = time.time()
+    user = auth_cache.get(init_data, now)
+    if user is not None:
+        return user
+
     try:
         parsed = dict(parse_qsl(init_data))
     except Exception:
@@ -36,13 +103,8 @@ def validate_init_data(init_data: str) -> dict | None:
     data_check_string = "\n".join(
         f"{k}={v}" for k, v in sorted(parsed.items())
     )
-    secret_key = hmac.new(
-        b"WebAppData",
-        token.encode(),
-        hashlib.sha256
-    ).digest()
     calculated = hmac.new(
-        secret_key,
+        _secret_key(token),
         data_check_string.encode(),
         hashlib.sha256
     ).hexdigest()
@@ -50,7 +112,26 @@ def validate_init_data(init_data: str) -> dict | None:
     if not hmac.compare_digest(calculated, hash_from_tg):
         return None
 
-    return _parse_user_from_parsed(parsed)
+    expires_at = now + auth_cache.ttl_s
+    max_age = config.auth_max_age_s
+    try:
+        auth_date = int(parsed.get("auth_date", ""))
+    except ValueError:
+        if max_age > 0:
+            return None
+        auth_date = None
+    if max_age > 0:
+        if now - auth_date > max_age:
+            auth_cache.rejected_stale += 1
+            return None
+        expires_at = min(expires_at, auth_date + max_age)
+
+    user = _parse_user_from_parsed(parsed)
+    if user:
+        # Токен возобновления наследует auth_date и не продлевает сессию дальше max_age
+        user["auth_date"] = auth_date
+        auth_cache.put(init_data, user, expires_at)
+    return user
 
 
 def _parse_init_data_unsafe(init_data: str) -> dict | None:
@@ -64,7 +145,6 @@ def _parse_init_data_unsafe(init_data: str) -> dict | None:
 
 def _parse_user_from_parsed(parsed: dict) -> dict | None:
     """Извлекает user из parsed (user — JSON строка)."""
-    import json
     user_str = parsed.get("user")
     if not user_str:
         return None
@@ -76,5 +156,15 @@ def _parse_user_from_parsed(parsed: dict) -> dict | None:
             "last_name": user.get("last_name", ""),
             "username": user.get("username", ""),
         }
-    except (json.JSONDecodeError, TypeError):
+    except (json.JSONDecodeError, TypeError, AttributeError):
         return None
+
+
+auth_cache = AuthCache(
+    ttl_s=get_config().auth_cache_ttl_s,
+    max_size=get_config().auth_cache_max,
+)
+registry.counter_fn(
+    "phonechess_auth_cache_total", "initData cache lookups",
+    lambda: {"hit": auth_cache.hits, "miss": auth_cache.misses}, label="result",
+)
@@ -0,0 +1,94 @@
+"""
+Серверные часы партий: один heap дедлайнов на все активные партии.
+Флаг падает точно в момент дедлайна, не дожидаясь хода игрока.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+ExpireCallback = Callable[[str], Awaitable[None]]
+
+
+class ClockScheduler:
+    """
+    Дедлайны хранятся в heap (deadline, game_id); актуальный дедлайн партии — в _deadlines.
+    Перепланирование при ходе — O(log n): старая запись не удаляется из heap,
+    а отбрасывается при извлечении как устаревшая. Таймер цикла событий один — на вершину heap.
+    """
+
+    def __init__(self, on_expire: ExpireCallback | None = None):
+        self.on_expire = on_expire
+        self._heap: list[tuple[float, str]] = []
+        self._deadlines: dict[str, float] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_at: float | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def start(self) -> None:
+        """Привязать планировщик к текущему циклу событий (вызывать из lifespan)."""
+        self._loop = asyncio.get_running_loop()
+        self._arm()
+
+    def stop(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+        self._timer = None
+        self._timer_at = None
+        self._loop = None
+
+    def schedule(self, game_id: str, deadline: float) -> None:
+        """Установить (или сдвинуть) дедлайн партии; deadline — по time.monotonic()."""
+        self._deadlines[game_id] = deadline
+        heapq.heappush(self._heap, (deadline, game_id))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+        self._arm()
+
+    def cancel(self, game_id: str) -> None:
+        """Снять часы партии (запись в heap удалится лениво)."""
+        self._deadlines.pop(game_id, None)
+
+    def _compact(self) -> None:
+        self._heap = [(d, gid) for gid, d in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def _arm(self) -> None:
+        if self._loop is None or not self._heap:
+            return
+        head = self._heap[0][0]
+        if self._timer_at is not None and self._timer_at <= head:
+            return
+        if self._timer:
+            self._timer.cancel()
+        self._timer_at = head
+        self._timer = self._loop.call_later(max(0.0, head - time.monotonic()), self._fire)
+
+    def _fire(self) -> None:
+        self._timer = None
+        self._timer_at = None
+        now = time.monotonic()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, game_id = heapq.heappop(heap)
+            if self._deadlines.get(game_id) != deadline:
+                continue
+            del self._deadlines[game_id]
+            if self.on_expire:
+                asyncio.ensure_future(self._expire(game_id))
+        self._arm()
+
+    async def _expire(self, game_id: str) -> None:
+        try:
+            await self.on_expire(game_id)
+        except Exception:
+            logger.exception("clock: on_expire failed game_id=%s", game_id)
+
+
+clocks = ClockScheduler()
@@ -0,0 +1,128 @@
+"""
+Связь воркеров через StateBackend.
+- Сообщение пользователю, чей сокет на другом воркере, уходит в канал этого воркера.
+- Ходы в партию, которую держит другой воркер, пересылаются владельцу партии.
+- Вход/выход из очередей пишется в backend и отправляется лидеру матчмейкинга;
+  лидер подбирает пары и рассылает всем воркерам счётчики очередей.
+"""
+import asyncio
+import base64
+import logging
+import os
+import socket
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any
+
+from .config import get_config
+from .constants import TIME_CONTROL_KEYS
+from .state_backend import StateBackend, make_backend
+
+logger = logging.getLogger(__name__)
+
+BROADCAST = "broadcast"
+MATCHMAKER = "matchmaker"
+LEADER_NAME = "matchmaker"
+
+Handler = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class Cluster:
+    def __init__(self, backend: StateBackend, worker_id: str, leader_ttl_s: float = 2.0):
+        self.backend = backend
+        self.worker_id = worker_id
+        self.leader_ttl_s = leader_ttl_s
+        self.is_leader = False
+        # Счётчики очередей от лидера (на лидере — его же, через тот же канал)
+        self.counts: dict[str, int] = dict.fromkeys(TIME_CONTROL_KEYS, 0)
+        self._handlers: dict[str, Handler] = {}
+        self._listener: asyncio.Task | None = None
+
+    @property
+    def channel(self) -> str:
+        return f"worker:{self.worker_id}"
+
+    def on(self, op: str, handler: Handler) -> None:
+        """Зарегистрировать обработчик сообщений вида {"op": op, ...}."""
+        self._handlers[op] = handler
+
+    async def start(self) -> None:
+        subscription = await self.backend.subscribe([self.channel, BROADCAST, MATCHMAKER])
+        self._listener = asyncio.create_task(self._listen(subscription))
+        await self.refresh_leadership()
+
+    async def stop(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+        await self.backend.close()
+
+    async def refresh_leadership(self) -> bool:
+        """Продлить/захватить аренду лидера. True — этот воркер только что стал лидером."""
+        was_leader = self.is_leader
+        try:
+            self.is_leader = await self.backend.acquire_leader(LEADER_NAME, self.worker_id, self.leader_ttl_s)
+        except Exception:
+            logger.exception("cluster: leadership refresh failed")
+            self.is_leader = False
+        if self.is_leader != was_leader:
+            logger.info("cluster: worker %s leader=%s", self.worker_id, self.is_leader)
+        return self.is_leader and not was_leader
+
+    async def elsewhere(self, user_id: str) -> bool:
+        """Сокет пользователя открыт на другом воркере."""
+        worker_id = await self.backend.get_presence(user_id)
+        return worker_id is not None and worker_id != self.worker_id
+
+    async def deliver(self, user_id: str, msg_type: str, text: str | bytes) -> bool:
+        """Доставить сериализованное сообщение (текст или бинарный кадр) пользователю на другом воркере."""
+        worker_id = await self.backend.get_presence(user_id)
+        if worker_id is None or worker_id == self.worker_id:
+            return False
+        message = {"op": "deliver", "user_id": user_id, "msg_type": msg_type}
+        if isinstance(text, bytes):
+            message["b64"] = base64.b64encode(text).decode()
+        else:
+            message["text"] = text
+        await self.backend.publish(f"worker:{worker_id}", message)
+        return True
+
+    async def forward_to_owner(self, game_id: str, user_id: str, raw: str, lag_ms: int = 0) -> bool:
+        """
+        Переслать сообщение по партии воркеру-владельцу. False — партия не на другом воркере.
+        lag_ms — медианный RTT игрока: его меряет воркер, к которому он подключён.
+        """
+        owner = await self.backend.get_game_owner(game_id)
+        if owner is None or owner == self.worker_id:
+            return False
+        await self.backend.publish(
+            f"worker:{owner}", {"op": "ws_message", "user_id": user_id, "raw": raw, "lag_ms": lag_ms}
+        )
+        return True
+
+    async def to_matchmaker(self, message: dict[str, Any]) -> None:
+        await self.backend.publish(MATCHMAKER, message)
+
+    async def broadcast(self, message: dict[str, Any]) -> None:
+        await self.backend.publish(BROADCAST, message)
+
+    async def _listen(self, subscription: AsyncIterator[tuple[str, dict[str, Any]]]) -> None:
+        async for channel, message in subscription:
+            # Очередь матчмейкинга обрабатывает только лидер
+            if channel == MATCHMAKER and not self.is_leader:
+                continue
+            handler = self._handlers.get(message.get("op"))
+            if handler is None:
+                continue
+            try:
+                await handler(message)
+            except Exception:
+                logger.exception("cluster: handler %s failed", message.get("op"))
+
+
+def _make_cluster() -> Cluster:
+    config = get_config()
+    worker_id = config.worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    return Cluster(make_backend(config.state_backend, config.redis_url), worker_id)
+
+
+cluster = _make_cluster()
@@ -0,0 +1,27 @@
+"""
+Кодирование сообщений WebSocket. Payload сериализуется один раз и переиспользуется
+для всех получателей. Если установлен orjson — используется он, иначе stdlib json.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+
+def encode(payload: dict[str, Any]) -> str:
+    """Payload -> текст JSON-фрейма (компактно, без экранирования не-ASCII)."""
+    if orjson:
+        return orjson.dumps(payload).decode()
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode(raw: str | bytes) -> Any:
+    """Текст или байты фрейма -> объект. Ошибка разбора — ValueError."""
+    if orjson:
+        return orjson.loads(raw)
+    return json.loads(raw)
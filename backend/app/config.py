@@ -8,5 +8,65 @@ def get_config():
     return type("Config", (), {
         "telegram_bot_token": os.environ.get("TELEGRAM_BOT_TOKEN", ""),
         "debug": os.environ.get("DEBUG", "0").lower() in ("1", "true", "yes"),
+        # initData: максимальный возраст по auth_date (0 — не проверять), кэш проверенных строк
+        "auth_max_age_s": int(os.environ.get("AUTH_MAX_AGE_S", "86400")),
+        "auth_cache_ttl_s": float(os.environ.get("AUTH_CACHE_TTL_S", "300")),
+        "auth_cache_max": int(os.environ.get("AUTH_CACHE_MAX", "10000")),
         "allowed_origins": os.environ.get("ALLOWED_ORIGINS", "*").split(","),
+        # Завершённые партии: сколько держать целиком, сколько и как долго хранить в архиве
+        "game_archive_grace_s": float(os.environ.get("GAME_ARCHIVE_GRACE_S", "60")),
+        "game_archive_max": int(os.environ.get("GAME_ARCHIVE_MAX", "10000")),
+        "game_archive_ttl_s": float(os.environ.get("GAME_ARCHIVE_TTL_S", "3600")),
+        # Матчмейкинг: период тика и окно рейтинга (база + расширение в секунду ожидания, потолок)
+        "match_tick_ms": int(os.environ.get("MATCH_TICK_MS", "200")),
+        "match_window_base": float(os.environ.get("MATCH_WINDOW_BASE", "50")),
+        "match_window_per_s": float(os.environ.get("MATCH_WINDOW_PER_S", "25")),
+        "match_window_max": float(os.environ.get("MATCH_WINDOW_MAX", "1000")),
+        # Минимальный интервал между рассылками queue_counts
+        "queue_counts_interval_ms": int(os.environ.get("QUEUE_COUNTS_INTERVAL_MS", "500")),
+        # Исходящая очередь подключения: при таком числе неотправленных сообщений клиент отключается
+        "ws_outbox_high_water": int(os.environ.get("WS_OUTBOX_HIGH_WATER", "256")),
+        # Heartbeat: раз в интервал ping каждому подключению (0 — выключен); не ответивший
+        # на прошлый ping отключается. Компенсация задержки сети на часах — не больше N мс за ход
+        "ws_ping_interval_s": float(os.environ.get("WS_PING_INTERVAL_S", "15")),
+        "lag_compensation_max_ms": int(os.environ.get("LAG_COMPENSATION_MAX_MS", "300")),
+        # Защита цикла приёма: максимальный размер сообщения, лимит сообщений на подключение
+        # (в секунду и всплеск), сколько отброшенных сообщений допускается до отключения
+        "ws_max_message_bytes": int(os.environ.get("WS_MAX_MESSAGE_BYTES", "8192")),
+        "ws_rate_limit": os.environ.get("WS_RATE_LIMIT", "1").lower() in ("1", "true", "yes"),
+        "ws_rate_per_s": float(os.environ.get("WS_RATE_PER_S", "30")),
+        "ws_rate_burst": float(os.environ.get("WS_RATE_BURST", "60")),
+        "ws_abuse_strikes": float(os.environ.get("WS_ABUSE_STRIKES", "50")),
+        # Проверка ходов: inline (в цикле событий), thread/process (всегда в пуле), auto (в пул
+        # потоков, пока задержка цикла событий выше порога); размер пула
+        "move_executor": os.environ.get("MOVE_EXECUTOR", "inline"),
+        "move_workers": int(os.environ.get("MOVE_WORKERS", "4")),
+        "move_offload_lag_ms": float(os.environ.get("MOVE_OFFLOAD_LAG_MS", "20")),
+        # Кэш ранних позиций: сколько позиций держать и до какого полухода кэшировать (0 — выключен)
+        "position_cache_max": int(os.environ.get("POSITION_CACHE_MAX", "10000")),
+        "position_cache_max_ply": int(os.environ.get("POSITION_CACHE_MAX_PLY", "12")),
+        # Рейтинг Эло: коэффициент K (одинаковый для всех партий — пересчёт по истории сходится с живым)
+        "rating_k": float(os.environ.get("RATING_K", "20")),
+        # Премув: сколько мс списывать с часов за ход, сделанный сразу после хода соперника
+        "premove_ms": int(os.environ.get("PREMOVE_MS", "100")),
+        # Зрители: не больше N на партию, обновления им — с задержкой
+        "spectators_max_per_game": int(os.environ.get("SPECTATORS_MAX_PER_GAME", "5000")),
+        "spectator_delay_ms": int(os.environ.get("SPECTATOR_DELAY_MS", "500")),
+        # Отключение: окно переподключения (сообщения копятся, партия сохраняется, из очередей —
+        # сразу; по истечении — поражение в партии), срок токена возобновления
+        # (цепочка токенов — не дольше auth_max_age_s от auth_date) и сколько сообщений
+        # держать для отключённого
+        "disconnect_grace_s": float(os.environ.get("DISCONNECT_GRACE_S", "60")),
+        "resume_token_ttl_s": int(os.environ.get("RESUME_TOKEN_TTL_S", "600")),
+        "resume_buffer_max": int(os.environ.get("RESUME_BUFFER_MAX", "256")),
+        # Общее состояние воркеров: memory (один процесс) или redis (несколько воркеров/нод)
+        "state_backend": os.environ.get("STATE_BACKEND", "memory"),
+        "redis_url": os.environ.get("REDIS_URL", "redis://localhost:6379/0"),
+        # Постоянный id воркера: по нему после рестарта воркер находит свои незавершённые партии
+        # (с redis и DATABASE_URL обязателен; пусто — случайный, годится для одного процесса)
+        "worker_id": os.environ.get("WORKER_ID", ""),
+        # Постоянное хранение (пусто — отключено) и пачки отложенной записи: раз в N мс или по M строк
+        "database_url": os.environ.get("DATABASE_URL", "sqlite:///data/phonechess.db"),
+        "db_flush_interval_ms": int(os.environ.get("DB_FLUSH_INTERVAL_MS", "200")),
+        "db_flush_max_rows": int(os.environ.get("DB_FLUSH_MAX_ROWS", "500")),
     })()
@@ -6,15 +6,25 @@ class TimeControl(TypedDict):
     initial_seconds: int
     increment_seconds: int
     key: str
+    pool: str  # рейтинговый пул: blitz или rapid
 
 
 TIME_CONTROLS: list[TimeControl] = [
-    {"key": "3+0", "initial_seconds": 3 * 60, "increment_seconds": 0},
-    {"key": "3+2", "initial_seconds": 3 * 60, "increment_seconds": 2},
-    {"key": "5+0", "initial_seconds": 5 * 60, "increment_seconds": 0},
-    {"key": "5+3", "initial_seconds": 5 * 60, "increment_seconds": 3},
-    {"key": "10+0", "initial_seconds": 10 * 60, "increment_seconds": 0},
-    {"key": "15+10", "initial_seconds": 15 * 60, "increment_seconds": 10},
+    {"key": "3+0", "initial_seconds": 3 * 60, "increment_seconds": 0, "pool": "blitz"},
+    {"key": "3+2", "initial_seconds": 3 * 60, "increment_seconds": 2, "pool": "blitz"},
+    {"key": "5+0", "initial_seconds": 5 * 60, "increment_seconds": 0, "pool": "blitz"},
+    {"key": "5+3", "initial_seconds": 5 * 60, "increment_seconds": 3, "pool": "blitz"},
+    {"key": "10+0", "initial_seconds": 10 * 60, "increment_seconds": 0, "pool": "rapid"},
+    {"key": "15+10", "initial_seconds": 15 * 60, "increment_seconds": 10, "pool": "rapid"},
 ]
 
 TIME_CONTROL_KEYS = [tc["key"] for tc in TIME_CONTROLS]
+# Режим по ключу: одна запись на режим, партии ссылаются на неё, а не на копии
+TIME_CONTROL_BY_KEY: dict[str, TimeControl] = {tc["key"]: tc for tc in TIME_CONTROLS}
+
+# Рейтинговые пулы (у каждого — своя колонка <pool>_rating в users) и пул каждого режима
+RATING_POOLS = ("blitz", "rapid")
+POOL_OF = {tc["key"]: tc["pool"] for tc in TIME_CONTROLS}
+
+# Стартовый рейтинг Эло в каждом пуле
+DEFAULT_RATING = 1500
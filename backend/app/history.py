@@ -0,0 +1,130 @@
+"""
+История партий пользователя и экспорт PGN (из постоянного хранилища).
+- Страницы истории — по курсору (finished_at, id) последней партии: следующая страница
+  берётся диапазоном по индексу, поэтому стоит одинаково на любой глубине истории.
+- Экспорт PGN — асинхронный генератор: партии читаются страницами по EXPORT_PAGE_SIZE
+  и отдаются по одной, весь файл в памяти не собирается.
+"""
+import base64
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+import chess
+
+from .constants import TIME_CONTROL_BY_KEY
+from .persistence import FinishedGame, HistoryCursor, persistence
+
+# Размер страницы истории: по умолчанию и максимум
+HISTORY_LIMIT = 20
+HISTORY_LIMIT_MAX = 100
+# Сколько партий читать из хранилища за раз при экспорте
+EXPORT_PAGE_SIZE = 200
+
+
+def encode_cursor(g: FinishedGame) -> str:
+    """Непрозрачный курсор «после этой партии» для следующей страницы."""
+    return base64.urlsafe_b64encode(f"{g.finished_at!r}:{g.id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(text: str) -> HistoryCursor:
+    """Разобрать курсор; ValueError, если он испорчен."""
+    try:
+        finished_at, game_id = base64.urlsafe_b64decode(text + "=" * (-len(text) % 4)).decode().split(":", 1)
+        return float(finished_at), game_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("bad cursor") from e
+
+
+def _summary(g: FinishedGame) -> dict[str, Any]:
+    return {
+        "game_id": g.id,
+        "time_control": g.time_control_key,
+        "white_id": g.white_id,
+        "black_id": g.black_id,
+        "white_username": g.white_username,
+        "black_username": g.black_username,
+        "result": g.result,
+        "created_at": g.created_at,
+        "finished_at": g.finished_at,
+    }
+
+
+async def history_page(user_id: str, cursor: str | None = None, limit: int = HISTORY_LIMIT) -> dict[str, Any]:
+    """Страница истории: {"games": [...], "next_cursor": str | None}."""
+    before = decode_cursor(cursor) if cursor else None
+    limit = max(1, min(limit, HISTORY_LIMIT_MAX))
+    games = await persistence.repo.history(user_id, before, limit)
+    return {
+        "games": [_summary(g) for g in games],
+        "next_cursor": encode_cursor(games[-1]) if len(games) == limit else None,
+    }
+
+
+async def game_record(game_id: str) -> dict[str, Any] | None:
+    """Завершённая партия с ходами для пошагового просмотра: SAN, UCI и часы после каждого хода."""
+    g = await persistence.repo.load_game(game_id)
+    if g is None:
+        return None
+    board = chess.Board()
+    moves = []
+    for uci, white_ms, black_ms in g.moves:
+        move = chess.Move.from_uci(uci)
+        moves.append({"san": board.san(move), "uci": uci, "white_remaining_ms": white_ms, "black_remaining_ms": black_ms})
+        board.push(move)
+    return {**_summary(g), "moves": moves}
+
+
+def _clk(ms: int) -> str:
+    s = max(0, ms) // 1000
+    return f"{s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}"
+
+
+def game_pgn(g: FinishedGame) -> str:
+    """PGN одной партии (с %clk после каждого хода); ходы — из g.moves."""
+    tc = TIME_CONTROL_BY_KEY.get(g.time_control_key)
+    lines = [
+        '[Event "PhoneChess {}"]'.format(g.time_control_key),
+        '[Site "PhoneChess"]',
+        '[Date "{}"]'.format(time.strftime("%Y.%m.%d", time.gmtime(g.created_at))),
+        '[White "{}"]'.format(g.white_username.replace("\\", "\\\\").replace('"', '\\"')),
+        '[Black "{}"]'.format(g.black_username.replace("\\", "\\\\").replace('"', '\\"')),
+        '[Result "{}"]'.format(g.result),
+        '[TimeControl "{}"]'.format(f"{tc['initial_seconds']}+{tc['increment_seconds']}" if tc else "-"),
+        "",
+    ]
+    board = chess.Board()
+    tokens = []
+    for ply, (uci, white_ms, black_ms) in enumerate(g.moves):
+        move = chess.Move.from_uci(uci)
+        if ply % 2 == 0:
+            tokens.append(f"{ply // 2 + 1}.")
+        tokens.append(board.san(move))
+        tokens.append("{[%clk " + _clk(white_ms if ply % 2 == 0 else black_ms) + "]}")
+        board.push(move)
+    tokens.append(g.result)
+    # Строки ходов не длиннее 80 символов, как принято в PGN
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+async def export_pgn(user_id: str) -> AsyncIterator[str]:
+    """Все партии пользователя в PGN от новых к старым — по одной партии за раз."""
+    before: HistoryCursor | None = None
+    while True:
+        games = await persistence.repo.history(user_id, before, EXPORT_PAGE_SIZE)
+        if not games:
+            return
+        await persistence.repo.load_moves(games)
+        for g in games:
+            yield game_pgn(g)
+        if len(games) < EXPORT_PAGE_SIZE:
+            return
+        before = (games[-1].finished_at, games[-1].id)
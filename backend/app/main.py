@@ -1,15 +1,35 @@
 """
 PhoneChess API и WebSocket.
 """
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, Header, HTTPException, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
+from .auth import auth_cache, validate_init_data
+from .clock import clocks
+from .cluster import cluster
 from .config import get_config
-from .ws_handlers import ws_auth_and_loop
+from .constants import RATING_POOLS
+from .history import HISTORY_LIMIT, HISTORY_LIMIT_MAX, export_pgn, game_record, history_page
+from .matchmaking import matchmaker
+from .metrics import registry
+from .offload import move_offload
+from .persistence import persistence
+from .positions import position_cache
+from .ratelimit import guard
+from .ratings import ratings
+from .sessions import resume_tokens, session_timers
+from .spectators import spectators
+from .store import store
+from .ws_handlers import matchmaking_loop, restore_games, ws_auth_and_loop
+from .ws_manager import manager
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,7 +38,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="PhoneChess API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await cluster.start()
+    await persistence.open()
+    if persistence.repo is not None:
+        logger.info("ratings: loaded %d rated players", ratings.load(await persistence.repo.load_ratings()))
+    clocks.start()
+    session_timers.start()
+    manager.start_heartbeat()
+    move_offload.start()
+    logger.info("positions: warmed %d opening positions", await asyncio.to_thread(position_cache.warm))
+    await restore_games()
+    persistence.start()
+    tasks = [
+        asyncio.create_task(store.run_sweeper()),
+        asyncio.create_task(matchmaking_loop()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    clocks.stop()
+    session_timers.stop()
+    manager.stop_heartbeat()
+    move_offload.stop()
+    await persistence.close()
+    await cluster.stop()
+
+
+app = FastAPI(title="PhoneChess API", lifespan=lifespan)
 config = get_config()
 
 app.add_middleware(
@@ -35,6 +84,105 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/stats")
+def stats():
+    return {
+        "games": store.stats(),
+        "matchmaking": matchmaker.stats(),
+        "ws": manager.stats(),
+        "auth": auth_cache.stats(),
+        "persistence": persistence.stats(),
+        "spectators": spectators.stats(),
+        "ratelimit": guard.stats(),
+        "resume_tokens": resume_tokens.stats(),
+        "moves": move_offload.stats(),
+        "positions": position_cache.stats(),
+        "ratings": ratings.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Метрики в текстовом формате Prometheus."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def _require_history() -> None:
+    if not persistence.enabled:
+        raise HTTPException(503, "game history storage is disabled")
+
+
+def _require_owner(user_id: str, authorization: str | None) -> None:
+    """
+    /api/users/{user_id}/… — только сам пользователь: user_id — его Telegram id, и без проверки
+    любой мог бы перебирать чужие партии и рейтинги. Authorization: «tma <initData>»
+    (как в Telegram Mini Apps) или «Bearer <resume_token>» из сообщения session.
+    """
+    scheme, _, credentials = (authorization or "").partition(" ")
+    user = None
+    if scheme.lower() == "tma":
+        user = validate_init_data(credentials)
+    elif scheme.lower() == "bearer":
+        user = resume_tokens.verify(credentials, time.time())
+    if not user:
+        raise HTTPException(401, "authorization required", headers={"WWW-Authenticate": "tma"})
+    if str(user["id"]) != user_id:
+        raise HTTPException(403, "forbidden")
+
+
+@app.get("/api/users/{user_id}/games")
+async def user_games(
+    user_id: str,
+    cursor: str | None = None,
+    limit: int = Query(HISTORY_LIMIT, ge=1, le=HISTORY_LIMIT_MAX),
+    authorization: str | None = Header(None),
+):
+    """История партий пользователя от новых к старым; next_cursor — для следующей страницы."""
+    _require_owner(user_id, authorization)
+    _require_history()
+    try:
+        return await history_page(user_id, cursor, limit)
+    except ValueError:
+        raise HTTPException(400, "bad cursor")
+
+
+@app.get("/api/users/{user_id}/games.pgn")
+async def user_games_pgn(user_id: str, authorization: str | None = Header(None)):
+    """Все партии пользователя одним PGN-файлом (потоком, по партии за раз)."""
+    _require_owner(user_id, authorization)
+    _require_history()
+    return StreamingResponse(
+        export_pgn(user_id),
+        media_type="application/x-chess-pgn",
+        headers={"Content-Disposition": f'attachment; filename="phonechess_{user_id}.pgn"'},
+    )
+
+
+@app.get("/api/games/{game_id}")
+async def finished_game(game_id: str):
+    """Завершённая партия с ходами и часами — для пошагового просмотра."""
+    _require_history()
+    game = await game_record(game_id)
+    if game is None:
+        raise HTTPException(404, "game not found")
+    return game
+
+
+@app.get("/api/users/{user_id}/rating")
+def user_rating(user_id: str, authorization: str | None = Header(None)):
+    """Рейтинг и место пользователя в каждом пуле (rank — null, если в пуле ещё не играл)."""
+    _require_owner(user_id, authorization)
+    return ratings.user(user_id)
+
+
+@app.get("/api/leaderboard/{pool}")
+def leaderboard(pool: str, limit: int = Query(10, ge=1, le=100)):
+    """Лучшие игроки пула (blitz/rapid)."""
+    if pool not in RATING_POOLS:
+        raise HTTPException(404, "unknown rating pool")
+    return {"pool": pool, "players": ratings.leaderboard(pool, limit)}
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     logger.info("WS: connection attempt from %s", ws.client)
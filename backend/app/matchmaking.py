@@ -0,0 +1,217 @@
+"""
+Матчмейкинг по рейтингу: ожидающие хранятся в FIFO-очередях по режимам
+и в отсортированном по рейтингу индексе. Пары подбираются пакетно, раз в тик,
+в окне рейтинга, которое расширяется с временем ожидания.
+"""
+import itertools
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from sortedcontainers import SortedList
+
+from .config import get_config
+from .constants import DEFAULT_RATING, TIME_CONTROL_KEYS
+from .metrics import Histogram, registry
+from .ratings import ratings
+
+# Границы гистограмм: разница рейтингов в паре и ожидание в секундах
+RATING_DIFF_BUCKETS = [0, 25, 50, 100, 150, 200, 300, 500, 1000]
+WAIT_BUCKETS = [0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120]
+
+_seq = itertools.count()
+
+
+@dataclass(eq=False, slots=True)
+class QueuedPlayer:
+    user_id: str
+    telegram_id: int
+    username: str
+    rating: int = DEFAULT_RATING
+    joined_at: float = field(default_factory=time.monotonic)
+    seq: int = field(default_factory=lambda: next(_seq))
+    active: bool = True  # False — вышел из очереди, узел удалится из deque лениво
+
+    @property
+    def sort_key(self) -> tuple[int, int]:
+        return (self.rating, self.seq)
+
+
+class PlayerQueues:
+    """
+    FIFO-очереди по режимам: deque узлов плюс индекс user_id -> (режим, узел).
+    Вход, выход и выход из всех очередей — O(1): покинувший узел помечается
+    неактивным и выбрасывается при извлечении (или при уплотнении deque).
+    Пользователь стоит не более чем в одной очереди.
+    """
+
+    def __init__(self, keys: list[str]):
+        self._queues: dict[str, deque[QueuedPlayer]] = {key: deque() for key in keys}
+        self._sizes: dict[str, int] = dict.fromkeys(keys, 0)
+        self._index: dict[str, tuple[str, QueuedPlayer]] = {}
+
+    def counts(self) -> dict[str, int]:
+        return dict(self._sizes)
+
+    def queue_of(self, user_id: str) -> str | None:
+        entry = self._index.get(user_id)
+        return entry[0] if entry else None
+
+    def waiting(self, time_control_key: str) -> list[QueuedPlayer]:
+        """Активные игроки очереди от самого давнего."""
+        return [p for p in self._queues[time_control_key] if p.active]
+
+    def push(self, time_control_key: str, player: QueuedPlayer) -> None:
+        self.remove(player.user_id)
+        self._queues[time_control_key].append(player)
+        self._sizes[time_control_key] += 1
+        self._index[player.user_id] = (time_control_key, player)
+
+    def pop(self, time_control_key: str) -> QueuedPlayer | None:
+        """Первый активный игрок очереди или None."""
+        queue = self._queues[time_control_key]
+        while queue:
+            player = queue.popleft()
+            if player.active:
+                player.active = False
+                self._sizes[time_control_key] -= 1
+                del self._index[player.user_id]
+                return player
+        return None
+
+    def remove(self, user_id: str, time_control_key: str | None = None) -> QueuedPlayer | None:
+        """Убрать пользователя (из указанной очереди или из любой). Возвращает его узел."""
+        entry = self._index.get(user_id)
+        if entry is None or (time_control_key is not None and entry[0] != time_control_key):
+            return None
+        key, player = entry
+        del self._index[user_id]
+        player.active = False
+        self._sizes[key] -= 1
+        queue = self._queues[key]
+        if len(queue) > 2 * self._sizes[key] + 32:
+            self._queues[key] = deque(p for p in queue if p.active)
+        return player
+
+
+class Matchmaker:
+    """
+    Пейринг раз в тик. Для каждого ожидающего (от самого давнего) ищется ближайший
+    по рейтингу соперник в том же режиме: это соседи в SortedList, поиск O(log n).
+    Пара принимается, если разница укладывается в окно ожидающего:
+    window_base + window_per_s * ожидание, но не больше window_max.
+    """
+
+    def __init__(
+        self,
+        keys: list[str],
+        window_base: float,
+        window_per_s: float,
+        window_max: float,
+        rating_of: Callable[[str, str], int] | None = None,
+    ):
+        self.window_base = window_base
+        self.window_per_s = window_per_s
+        self.window_max = window_max
+        # (user_id, time_control_key) -> рейтинг; подменяется рейтинговой системой
+        self.rating_of = rating_of or (lambda user_id, time_control_key: DEFAULT_RATING)
+        self.queues = PlayerQueues(keys)
+        # Рейтинговая «лестница» режима: ключи (rating, seq), игрок — по seq
+        self._by_rating: dict[str, SortedList] = {key: SortedList() for key in keys}
+        self._players: dict[int, QueuedPlayer] = {}
+        self.rating_diff = Histogram(RATING_DIFF_BUCKETS)
+        self.wait_s = Histogram(WAIT_BUCKETS)
+        self.pairs = 0
+
+    def counts(self) -> dict[str, int]:
+        return self.queues.counts()
+
+    def clear(self) -> None:
+        keys = list(self._by_rating)
+        self.queues = PlayerQueues(keys)
+        self._by_rating = {key: SortedList() for key in keys}
+        self._players.clear()
+
+    def join(self, time_control_key: str, player: QueuedPlayer) -> None:
+        self.leave(player.user_id)
+        player.rating = self.rating_of(player.user_id, time_control_key)
+        self.queues.push(time_control_key, player)
+        self._by_rating[time_control_key].add(player.sort_key)
+        self._players[player.seq] = player
+
+    def leave(self, user_id: str, time_control_key: str | None = None) -> bool:
+        key = self.queues.queue_of(user_id)
+        player = self.queues.remove(user_id, time_control_key)
+        if player is None:
+            return False
+        self._unindex(key, player)
+        return True
+
+    def window(self, player: QueuedPlayer, now: float) -> float:
+        return min(self.window_max, self.window_base + self.window_per_s * (now - player.joined_at))
+
+    def tick(self, now: float | None = None) -> list[tuple[str, QueuedPlayer, QueuedPlayer]]:
+        """Подобрать пары во всех режимах. Возвращает [(режим, ожидавший дольше, соперник)]."""
+        if now is None:
+            now = time.monotonic()
+        pairs = []
+        for key, ladder in self._by_rating.items():
+            if len(ladder) < 2:
+                continue
+            for player in self.queues.waiting(key):
+                if not player.active:
+                    continue
+                opponent = self._nearest(ladder, player)
+                if opponent is None or abs(opponent.rating - player.rating) > self.window(player, now):
+                    continue
+                for p in (player, opponent):
+                    self.queues.remove(p.user_id)
+                    self._unindex(key, p)
+                    self.wait_s.observe(now - p.joined_at)
+                self.rating_diff.observe(abs(opponent.rating - player.rating))
+                self.pairs += 1
+                pairs.append((key, player, opponent))
+                if len(ladder) < 2:
+                    break
+        return pairs
+
+    def _nearest(self, ladder: SortedList, player: QueuedPlayer) -> QueuedPlayer | None:
+        i = ladder.index(player.sort_key)
+        best = None
+        for j in (i - 1, i + 1):
+            if 0 <= j < len(ladder):
+                candidate = self._players[ladder[j][1]]
+                if best is None or abs(candidate.rating - player.rating) < abs(best.rating - player.rating):
+                    best = candidate
+        return best
+
+    def _unindex(self, time_control_key: str, player: QueuedPlayer) -> None:
+        del self._players[player.seq]
+        self._by_rating[time_control_key].remove(player.sort_key)
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.counts(),
+            "pairs": self.pairs,
+            "rating_diff": self.rating_diff.snapshot(),
+            "wait_s": self.wait_s.snapshot(),
+        }
+
+
+def _make_matchmaker() -> Matchmaker:
+    config = get_config()
+    return Matchmaker(
+        TIME_CONTROL_KEYS,
+        window_base=config.match_window_base,
+        window_per_s=config.match_window_per_s,
+        window_max=config.match_window_max,
+        rating_of=ratings.rating_of,
+    )
+
+
+matchmaker = _make_matchmaker()
+# Очереди полностью видны только лидеру матчмейкинга; на остальных воркерах — нули
+registry.gauge("phonechess_queue_waiting", "Players waiting in the matchmaker", matchmaker.counts, label="time_control")
+registry.add_histogram("phonechess_match_wait_seconds", "Time in queue before a pair was found", matchmaker.wait_s)
+registry.add_histogram("phonechess_match_rating_diff", "Rating difference within a pair", matchmaker.rating_diff)
@@ -0,0 +1,156 @@
+"""
+Простые метрики в памяти процесса: гистограммы с фиксированными границами, счётчики
+и реестр, который отдаёт всё в текстовом формате Prometheus (/metrics).
+"""
+import bisect
+from collections.abc import Callable
+
+
+class Histogram:
+    """Счётчики по корзинам «значение <= граница» плюс сумма и количество наблюдений."""
+
+    def __init__(self, buckets: list[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя корзина — +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class LabeledCounter:
+    """Счётчик с одной меткой: значение метки -> количество."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.values: dict[str, float] = {}
+
+    def inc(self, value: str, n: float = 1) -> None:
+        self.values[value] = self.values.get(value, 0) + n
+
+
+class _Callback:
+    """Значение, которое считает другой модуль: число или словарь «значение метки -> число»."""
+
+    __slots__ = ("fn", "label")
+
+    def __init__(self, fn: Callable[[], float | dict[str, float]], label: str):
+        self.fn = fn
+        self.label = label
+
+
+# Задержки в секундах: от 50 мкс до 2.5 с
+LATENCY_BUCKETS = [0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5]
+
+
+def _labels(pairs: dict[str, str]) -> str:
+    if not pairs:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in pairs.items())
+    return "{" + inner + "}"
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Registry:
+    """
+    Реестр метрик для /metrics. Гистограммы и счётчики живут здесь и обновляются на горячем
+    пути (O(1)/O(log корзин)); gauge и counter из уже существующих stats() — колбэки,
+    которые вызываются только при чтении /metrics.
+    """
+
+    def __init__(self):
+        # имя -> (тип, описание, [(метки, источник)])
+        self._families: dict[str, tuple[str, str, list[tuple[dict[str, str], Histogram | LabeledCounter | _Callback]]]] = {}
+
+    def _family(self, name: str, kind: str, help_text: str) -> list:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (kind, help_text, [])
+        return family[2]
+
+    def histogram(self, name: str, help_text: str, buckets: list[float] = LATENCY_BUCKETS, **labels: str) -> Histogram:
+        return self.add_histogram(name, help_text, Histogram(buckets), **labels)
+
+    def add_histogram(self, name: str, help_text: str, hist: Histogram, **labels: str) -> Histogram:
+        """Зарегистрировать уже существующую гистограмму (например, из matchmaker)."""
+        self._family(name, "histogram", help_text).append((labels, hist))
+        return hist
+
+    def counter(self, name: str, help_text: str, label: str) -> LabeledCounter:
+        counter = LabeledCounter(label)
+        self._family(name, "counter", help_text).append(({}, counter))
+        return counter
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float | dict[str, float]], label: str = "") -> None:
+        """fn возвращает число или, если задан label, словарь «значение метки -> число»."""
+        self._family(name, "gauge", help_text).append(({}, _Callback(fn, label)))
+
+    def counter_fn(self, name: str, help_text: str, fn: Callable[[], float | dict[str, float]], label: str = "") -> None:
+        """Счётчик, значение которого уже ведёт другой модуль (читается при запросе)."""
+        self._family(name, "counter", help_text).append(({}, _Callback(fn, label)))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for name, (kind, help_text, items) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, source in items:
+                if isinstance(source, Histogram):
+                    _render_histogram(lines, name, labels, source)
+                elif isinstance(source, LabeledCounter):
+                    for value, n in source.values.items():
+                        lines.append(f"{name}{_labels({source.label: value})} {_num(n)}")
+                else:
+                    _render_callback(lines, name, source)
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _render_histogram(lines: list[str], name: str, labels: dict[str, str], hist: Histogram) -> None:
+    cumulative = 0
+    bounds = [*hist.buckets, float("inf")]
+    for bound, count in zip(bounds, hist.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': _num(bound)})} {cumulative}")
+    lines.append(f"{name}_sum{_labels(labels)} {_num(hist.total)}")
+    lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+
+def _render_callback(lines: list[str], name: str, source: _Callback) -> None:
+    value = source.fn()
+    if isinstance(value, dict):
+        for key, v in value.items():
+            lines.append(f"{name}{_labels({source.label or 'key': key})} {_num(v)}")
+    else:
+        lines.append(f"{name} {_num(value)}")
+
+
+registry = Registry()
@@ -0,0 +1,139 @@
+"""
+Компактное кодирование ходов: 16 бит на ход (from, to, превращение)
+и varint для времени на ход в миллисекундах. Тот же формат — в Game,
+в архиве партий и в бинарном кадре WebSocket (encode_moves_frame).
+"""
+import struct
+import sys
+import uuid
+from array import array
+
+import chess
+
+
+def pack_move(move: chess.Move) -> int:
+    """Биты 0–5 — from, 6–11 — to, 12–14 — фигура превращения (0 — нет)."""
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def unpack_move(code: int) -> chess.Move:
+    promotion = (code >> 12) & 0x7
+    return chess.Move(code & 0x3F, (code >> 6) & 0x3F, promotion or None)
+
+
+def codes_to_bytes(codes: array) -> bytes:
+    """Коды ходов в little-endian uint16, независимо от платформы."""
+    if sys.byteorder == "big":
+        codes = array("H", codes)
+        codes.byteswap()
+    return codes.tobytes()
+
+
+def bytes_to_codes(data: bytes) -> array:
+    codes = array("H")
+    codes.frombytes(data)
+    if sys.byteorder == "big":
+        codes.byteswap()
+    return codes
+
+
+def pack_moves(moves: list[chess.Move]) -> bytes:
+    return codes_to_bytes(array("H", [pack_move(m) for m in moves]))
+
+
+def unpack_moves(data: bytes) -> list[chess.Move]:
+    return [unpack_move(c) for c in bytes_to_codes(data)]
+
+
+def append_varint(out: bytearray, v: int) -> None:
+    """Дописать неотрицательное целое в LEB128."""
+    while v >= 0x80:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+
+def encode_varints(values: list[int]) -> bytes:
+    """Неотрицательные целые в LEB128: время хода < 16 с занимает 1–2 байта."""
+    out = bytearray()
+    for v in values:
+        append_varint(out, v)
+    return bytes(out)
+
+
+def decode_varints(data: bytes) -> list[int]:
+    values = []
+    value = shift = 0
+    for b in data:
+        value |= (b & 0x7F) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+def skip_varints(data: bytes, count: int) -> int:
+    """Смещение в data после первых count значений."""
+    pos = 0
+    while count > 0:
+        if not data[pos] & 0x80:
+            count -= 1
+        pos += 1
+    return pos
+
+
+# Бинарный кадр с ходами партии (ответ на subscribe_game с "binary": true), little-endian:
+#   u8 тип кадра, u8 результат, u16 since, u16 число ходов, u32 seq,
+#   u32 часы белых (мс), u32 часы чёрных (мс), 16 байт UUID партии,
+#   далее ходы по u16 и время каждого хода varint'ами.
+# Позицию (FEN) клиент получает, проигрывая ходы.
+FRAME_GAME_MOVES = 1
+_FRAME_HEADER = struct.Struct("<BBHHIII16s")
+_RESULT_CODES = {None: 0, "1-0": 1, "0-1": 2, "1/2-1/2": 3}
+_RESULTS = {v: k for k, v in _RESULT_CODES.items()}
+
+
+def encode_moves_frame(
+    game_id: str,
+    seq: int,
+    since: int,
+    codes: array,
+    clock_deltas: bytes,
+    white_remaining_ms: int,
+    black_remaining_ms: int,
+    result: str | None,
+) -> bytes:
+    """Кадр с ходами codes[since:] (clock_deltas — время всех ходов партии)."""
+    header = _FRAME_HEADER.pack(
+        FRAME_GAME_MOVES,
+        _RESULT_CODES[result],
+        since,
+        len(codes) - since,
+        seq,
+        white_remaining_ms,
+        black_remaining_ms,
+        uuid.UUID(game_id).bytes,
+    )
+    tail = codes_to_bytes(codes[since:])
+    return header + tail + bytes(clock_deltas[skip_varints(clock_deltas, since):])
+
+
+def decode_moves_frame(frame: bytes) -> dict:
+    """Обратное преобразование (для клиентов на Python, тестов и бенчмарков)."""
+    kind, result, since, count, seq, white_ms, black_ms, game_id = _FRAME_HEADER.unpack_from(frame)
+    if kind != FRAME_GAME_MOVES:
+        raise ValueError(f"unknown frame type {kind}")
+    pos = _FRAME_HEADER.size
+    codes = bytes_to_codes(frame[pos:pos + 2 * count])
+    return {
+        "game_id": str(uuid.UUID(bytes=game_id)),
+        "seq": seq,
+        "since": since,
+        "moves": [unpack_move(c) for c in codes],
+        "times_ms": decode_varints(frame[pos + 2 * count:]),
+        "white_remaining_ms": white_ms,
+        "black_remaining_ms": black_ms,
+        "result": _RESULTS[result],
+    }
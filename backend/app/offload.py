@@ -0,0 +1,152 @@
+"""
+Вынос тяжёлой проверки ходов из цикла событий.
+- ordered(key) — очередь на ключ (партию): ходы одной партии строго по порядку,
+  разные партии не ждут друг друга.
+- run() — функция в пуле потоков или процессов.
+- Режим auto: в пул, только пока цикл событий «горячий» (задержка LoopLag выше порога);
+  в спокойном состоянии выгоднее считать на месте — без передачи в поток.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any
+
+from .config import get_config
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+MODES = ("inline", "thread", "process", "auto")
+
+LOOP_LAG_S = registry.histogram(
+    "phonechess_event_loop_lag_seconds", "How late the event loop wakes up a periodic timer"
+)
+
+
+class LoopLag:
+    """Задержка цикла событий: насколько позже обещанного просыпается sleep(interval_s)."""
+
+    def __init__(self, interval_s: float = 0.05):
+        self.interval_s = interval_s
+        self.lag_s = 0.0  # сглаженная (EWMA)
+        self.max_s = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            lag = max(0.0, time.perf_counter() - started - self.interval_s)
+            self.lag_s += (lag - self.lag_s) * 0.2
+            self.max_s = max(self.max_s, lag)
+            LOOP_LAG_S.observe(lag)
+
+
+class MoveOffload:
+    """
+    inline — всё в цикле событий (как раньше); thread/process — analyze_move всегда в пуле;
+    auto — в пул потоков, когда задержка цикла выше lag_threshold_s.
+    Пул процессов даёт настоящий параллелизм на нескольких ядрах, но каждая доска
+    туда и обратно проходит через pickle; пул потоков дешевле, но делит GIL с циклом.
+    """
+
+    def __init__(self, mode: str = "inline", workers: int = 4, lag_threshold_s: float = 0.02):
+        if mode not in MODES:
+            raise ValueError(f"unsupported MOVE_EXECUTOR: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.lag_threshold_s = lag_threshold_s
+        self.lag = LoopLag()
+        self._pool: Executor | None = None
+        # Последний ход в очереди каждой партии: следующий ждёт его завершения
+        self._tails: dict[str, asyncio.Future] = {}
+        # Метрики
+        self.offloaded = 0
+        self.inline = 0
+
+    def start(self) -> None:
+        """Создать пул и запустить замер задержки цикла (вызывать из lifespan)."""
+        if self.mode == "auto" and (os.cpu_count() or 1) < 2:
+            # На одном ядре пул только добавляет переключения (bench_offload): считаем на месте
+            logger.info("moves: single CPU, MOVE_EXECUTOR=auto stays inline")
+        elif self.mode in ("thread", "auto"):
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="moves")
+        elif self.mode == "process":
+            # spawn: форк процесса с работающим циклом событий и потоками небезопасен
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.lag.start()
+
+    def stop(self) -> None:
+        self.lag.stop()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def should_offload(self) -> bool:
+        offload = self._pool is not None and (self.mode != "auto" or self.lag.lag_s > self.lag_threshold_s)
+        if offload:
+            self.offloaded += 1
+        else:
+            self.inline += 1
+        return offload
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    @asynccontextmanager
+    async def ordered(self, key: str) -> AsyncIterator[None]:
+        """Выполнить блок после всех ранее вошедших с тем же ключом."""
+        prev = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            if prev is not None:
+                await prev
+            yield
+        finally:
+            if prev is not None and not prev.done():
+                # Нас отменили в ожидании: следующий всё равно должен дождаться предыдущего
+                prev.add_done_callback(lambda _: done.done() or done.set_result(None))
+            else:
+                done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "offloaded": self.offloaded,
+            "inline": self.inline,
+            "in_flight_games": len(self._tails),
+            "loop_lag_ms": round(self.lag.lag_s * 1000, 2),
+            "loop_lag_max_ms": round(self.lag.max_s * 1000, 2),
+        }
+
+
+def _make_offload() -> MoveOffload:
+    config = get_config()
+    return MoveOffload(
+        mode=config.move_executor,
+        workers=config.move_workers,
+        lag_threshold_s=config.move_offload_lag_ms / 1000,
+    )
+
+
+move_offload = _make_offload()
+registry.counter_fn(
+    "phonechess_moves_analyzed_total", "Moves validated, by where the work ran",
+    lambda: {"pool": move_offload.offloaded, "inline": move_offload.inline}, label="where",
+)
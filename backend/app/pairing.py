@@ -5,29 +5,40 @@
 import random
 import time
 import uuid
-from collections import defaultdict
+from array import array
+from collections.abc import Generator
 from dataclasses import dataclass, field
 
 import chess
+import chess.polyglot
 from chess import Board
 
-from .constants import TIME_CONTROL_KEYS, TIME_CONTROLS, TimeControl
-
-
-@dataclass
-class QueuedPlayer:
-    user_id: str
-    telegram_id: int
-    username: str
-
-
-@dataclass
-class MoveRecord:
-    san: str
-    time_ms: int  # время на ход в миллисекундах
-
-
-@dataclass
+from .clock import clocks
+from .cluster import cluster
+from .config import get_config
+from .constants import POOL_OF, TIME_CONTROL_BY_KEY, TIME_CONTROL_KEYS, TIME_CONTROLS, TimeControl
+from .matchmaking import QueuedPlayer, matchmaker
+from .metrics import registry
+from .movecodec import (
+    append_varint,
+    bytes_to_codes,
+    decode_varints,
+    encode_moves_frame,
+    pack_move,
+    unpack_move,
+)
+from .offload import move_offload
+from .persistence import StoredGame, persistence
+from .positions import MoveAnalysis, analyze_move, position_cache
+from .ratings import ratings
+from .store import ArchivedGame, store
+
+
+def _move_codes() -> array:
+    return array("H")
+
+
+@dataclass(slots=True)
 class Game:
     id: str
     time_control_key: str
@@ -35,20 +46,94 @@ class Game:
     black_id: str
     white_username: str
     black_username: str
-    fen: str = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
-    moves: list[MoveRecord] = field(default_factory=list)
+    # Ходы по 16 бит (movecodec.pack_move) и время на каждый ход varint'ами;
+    # SAN не хранится — восстанавливается проигрыванием, когда нужен клиенту
+    move_codes: array = field(default_factory=_move_codes, repr=False)
+    clock_deltas: bytearray = field(default_factory=bytearray, repr=False)
     is_private: bool = False
     white_remaining_ms: int = 0
     black_remaining_ms: int = 0
     last_clock_at: float = 0.0  # unix timestamp когда часы последний раз обновлялись
     result: str | None = None  # None | "1-0" | "0-1" | "1/2-1/2"
+    seq: int = 0  # номер последнего game_update: клиент по разрывам видит пропуски
+    # Живая доска: не парсим FEN на каждом ходу. Стек отмены python-chess не держим —
+    # ходы не откатываются, а история есть в move_codes
+    board: Board = field(default_factory=Board, repr=False)
+    # Счётчик позиций по Zobrist-ключу с последнего необратимого хода (для троекратного повторения)
+    position_counts: dict[int, int] = field(default_factory=dict, repr=False)
+    key: int = field(default=0, repr=False)  # Zobrist-ключ текущей позиции
+    # Премувы: цвет -> ход, который сделать сразу после ответа соперника (не больше одного на игрока)
+    premoves: dict[bool, chess.Move] = field(default_factory=dict, repr=False)
+    # Итог партии для рейтинга: user_id -> (новый рейтинг, изменение); None — пока не завершена
+    rating_changes: dict[str, tuple[int, int]] | None = field(default=None, repr=False)
+    # Поправка на сеть для каждого цвета, мс (медианный RTT игрока на его последнем ходу,
+    # не больше LAG_COMPENSATION_MAX_MS): на столько позже падает флаг и меньше списывается за ход
+    white_lag_ms: int = field(default=0, repr=False)
+    black_lag_ms: int = field(default=0, repr=False)
+    _fen: str | None = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        # Одна строка ключа на режим, а не копия из каждого сообщения/строки БД
+        tc = TIME_CONTROL_BY_KEY.get(self.time_control_key)
+        if tc is not None:
+            self.time_control_key = tc["key"]
+        self.key = chess.polyglot.zobrist_hash(self.board)
+        self.position_counts[self.key] = 1
+
+    @property
+    def fen(self) -> str:
+        """FEN текущей позиции (кэшируется до следующего хода)."""
+        if self._fen is None:
+            self._fen = self.board.fen()
+        return self._fen
+
+    @property
+    def ply(self) -> int:
+        """Сколько ходов сделано."""
+        return len(self.move_codes)
+
+    def push(self, move: chess.Move, time_ms: int) -> int:
+        """
+        Сделать ход на живой доске, записать его в историю и обновить инкрементальное состояние.
+        Возвращает сколько раз встречалась получившаяся позиция.
+        """
+        board = self.board
+        board.push(move)
+        board.clear_stack()
+        return self.adopt(board, move, chess.polyglot.zobrist_hash(board), time_ms)
+
+    def adopt(self, board: Board, move: chess.Move, key: int, time_ms: int) -> int:
+        """
+        Принять доску после хода move (key — её Zobrist-ключ), уже посчитанную
+        analyze_move, возможно в пуле. Возвращает сколько раз встречалась позиция.
+        """
+        self.board = board
+        self.key = key
+        self.move_codes.append(pack_move(move))
+        append_varint(self.clock_deltas, time_ms)
+        self._fen = None
+        if board.halfmove_clock == 0:
+            # Взятие или ход пешкой: прежние позиции больше не повторятся
+            self.position_counts.clear()
+        count = self.position_counts.get(key, 0) + 1
+        self.position_counts[key] = count
+        return count
+
+    def move_list(self, since: int = 0) -> list[dict]:
+        """Ходы начиная с since в виде [{"san", "time_ms"}]: SAN получаем проигрыванием партии."""
+        board = Board()
+        times = decode_varints(self.clock_deltas)
+        out = []
+        for i, code in enumerate(self.move_codes):
+            move = unpack_move(code)
+            if i >= since:
+                out.append({"san": board.san(move), "time_ms": times[i]})
+            board.push(move)
+        return out
 
     @property
     def time_control(self) -> TimeControl:
-        for tc in TIME_CONTROLS:
-            if tc["key"] == self.time_control_key:
-                return tc
-        return TIME_CONTROLS[0]
+        return TIME_CONTROL_BY_KEY.get(self.time_control_key, TIME_CONTROLS[0])
 
     def _init_clocks(self) -> None:
         tc = self.time_control
@@ -57,51 +142,130 @@ class Game:
         self.last_clock_at = time.monotonic()
 
 
-# Глобальное состояние (in-memory)
-_queues: dict[str, list[QueuedPlayer]] = defaultdict(list)
-_games: dict[str, Game] = {}
+# Насколько клиент может отстать, чтобы на subscribe_game получить дельту, а не снимок
+DELTA_MAX_MOVES = 40
+# Сколько времени списывается за премув (ход делается сразу, без раздумий)
+PREMOVE_MS = get_config().premove_ms
+# Компенсация задержки сети: не больше стольких мс за ход не списывается с часов
+LAG_COMPENSATION_MAX_MS = get_config().lag_compensation_max_ms
+LAG_COMPENSATION_S = registry.histogram(
+    "phonechess_lag_compensation_seconds", "Network lag not charged to the mover's clock",
+    buckets=[0.01, 0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 1],
+)
+PREMOVES = registry.counter("phonechess_premoves_total", "Premoves by outcome", label="result")
+
+# Глобальное состояние (in-memory): ожидающие — в matchmaker, партии — в store
+# Живая партия каждого игрока на этом воркере: user_id -> game_id
+_live_by_user: dict[str, str] = {}
 
 
 def get_queue_counts() -> dict[str, int]:
-    """Количество ожидающих по каждому режиму."""
-    return {key: len(_queues[key]) for key in TIME_CONTROL_KEYS}
+    """Количество ожидающих по каждому режиму (по всем воркерам, как его разослал лидер)."""
+    return cluster.counts
+
+
+def waiting_counts() -> dict[str, int]:
+    """Ожидающие в matchmaker этого воркера (полные данные — только на лидере)."""
+    return matchmaker.counts()
+
+
+def reset_queues(entries: list[dict]) -> None:
+    """Пересобрать очереди из общего состояния (когда воркер становится лидером)."""
+    matchmaker.clear()
+    for e in entries:
+        join_queue(e["time_control"], e["user_id"], e["telegram_id"], e["username"])
 
 
-def join_queue(time_control_key: str, user_id: str, telegram_id: int, username: str) -> Game | None:
+def join_queue(time_control_key: str, user_id: str, telegram_id: int, username: str) -> bool:
     """
-    Добавить в очередь или сразу создать партию, если есть ждущий.
-    Возвращает Game если пара найдена, иначе None.
+    Встать в очередь режима (из прежней очереди пользователь уходит).
+    Пару подбирает периодический run_pairing_tick. Возвращает True если встал.
     """
     if time_control_key not in TIME_CONTROL_KEYS:
-        return None
-    queue = _queues[time_control_key]
+        return False
     player = QueuedPlayer(user_id=user_id, telegram_id=telegram_id, username=username)
-    if queue:
-        opponent = queue.pop(0)
+    matchmaker.join(time_control_key, player)
+    return True
+
+
+def run_pairing_tick() -> list[tuple[str, QueuedPlayer, QueuedPlayer]]:
+    """Пакетный пейринг по рейтингу. Возвращает пары [(режим, белые, чёрные)]."""
+    pairs = []
+    for time_control_key, player, opponent in matchmaker.tick():
         if random.random() < 0.5:
-            game = _create_game(time_control_key, player, opponent)
+            pairs.append((time_control_key, player, opponent))
         else:
-            game = _create_game(time_control_key, opponent, player)
-        _games[game.id] = game
-        return game
-    queue.append(player)
-    return None
+            pairs.append((time_control_key, opponent, player))
+    return pairs
+
+
+def start_game(time_control_key: str, white: QueuedPlayer, black: QueuedPlayer) -> Game:
+    """Создать партию на этом воркере и запустить часы."""
+    game = _create_game(time_control_key, white, black)
+    store.add(game)
+    _index_players(game)
+    _schedule_clock(game)
+    persistence.record_game(game, cluster.worker_id)
+    return game
+
+
+def _index_players(g: Game) -> None:
+    _live_by_user[g.white_id] = g.id
+    _live_by_user[g.black_id] = g.id
+
+
+def top_game_entry(g: Game, rating: float | None = None) -> tuple[float, dict]:
+    """
+    Средний рейтинг и запись живой партии для «топ партий» лобби (state_backend.top_games_add).
+    rating — по умолчанию из текущих рейтингов игроков.
+    """
+    if rating is None:
+        rating_of = matchmaker.rating_of
+        rating = (rating_of(g.white_id, g.time_control_key) + rating_of(g.black_id, g.time_control_key)) / 2
+    return rating, {
+        "time_control": g.time_control_key,
+        "white_username": g.white_username,
+        "black_username": g.black_username,
+    }
+
+
+def recover_games(stored: list[StoredGame]) -> list[Game]:
+    """
+    Восстановить незавершённые партии после рестарта. Время простоя сервера
+    ни одной стороне не засчитывается: часы продолжают идти с момента восстановления.
+    """
+    games = []
+    for s in stored:
+        g = Game(
+            id=s.id,
+            time_control_key=s.time_control_key,
+            white_id=s.white_id,
+            black_id=s.black_id,
+            white_username=s.white_username,
+            black_username=s.black_username,
+            white_remaining_ms=s.white_remaining_ms,
+            black_remaining_ms=s.black_remaining_ms,
+        )
+        for uci, time_ms, white_ms, black_ms in s.moves:
+            g.push(chess.Move.from_uci(uci), time_ms)
+            g.white_remaining_ms, g.black_remaining_ms = white_ms, black_ms
+        g.seq = g.ply
+        g.last_clock_at = time.monotonic()
+        store.add(g)
+        _index_players(g)
+        _schedule_clock(g)
+        games.append(g)
+    return games
 
 
 def leave_queue(time_control_key: str, user_id: str) -> bool:
     """Убрать из очереди. Возвращает True если был в очереди."""
-    queue = _queues.get(time_control_key, [])
-    for i, p in enumerate(queue):
-        if p.user_id == user_id:
-            queue.pop(i)
-            return True
-    return False
+    return matchmaker.leave(user_id, time_control_key)
 
 
 def leave_all_queues(user_id: str) -> None:
     """Убрать пользователя из всех очередей."""
-    for key in TIME_CONTROL_KEYS:
-        leave_queue(key, user_id)
+    matchmaker.leave(user_id)
 
 
 def _create_game(time_control_key: str, white: QueuedPlayer, black: QueuedPlayer) -> Game:
@@ -118,24 +282,87 @@ def _create_game(time_control_key: str, white: QueuedPlayer, black: QueuedPlayer
 
 
 def get_game(game_id: str) -> Game | None:
-    return _games.get(game_id)
+    g = store.get(game_id)
+    if isinstance(g, ArchivedGame):
+        return _restore(g)
+    return g
+
+
+def _restore(a: ArchivedGame) -> Game:
+    """Развернуть архивную партию обратно в Game (только для чтения, в хранилище не кладётся)."""
+    g = Game(
+        id=a.id,
+        time_control_key=a.time_control_key,
+        white_id=a.white_id,
+        black_id=a.black_id,
+        white_username=a.white_username,
+        black_username=a.black_username,
+        is_private=a.is_private,
+        white_remaining_ms=a.white_remaining_ms,
+        black_remaining_ms=a.black_remaining_ms,
+        result=a.result,
+        seq=a.seq,
+    )
+    for code, time_ms in zip(bytes_to_codes(a.moves), decode_varints(a.clock_deltas)):
+        g.push(unpack_move(code), time_ms)
+    return g
 
 
-def game_state_payload(g: Game) -> dict:
-    """Собрать payload game_state для отправки клиенту."""
+def game_state_payload(g: Game, since: int | None = None) -> dict:
+    """
+    Собрать payload для subscribe_game. Если клиент сообщил, сколько ходов у него уже есть
+    (since), и отстал не больше чем на DELTA_MAX_MOVES — game_delta только с недостающими
+    ходами, иначе полный game_state.
+    """
+    total = g.ply
+    if since is not None and 0 <= since <= total and total - since <= DELTA_MAX_MOVES:
+        return {
+            "type": "game_delta",
+            "since": since,
+            "fen": g.fen,
+            "white_remaining_ms": g.white_remaining_ms,
+            "black_remaining_ms": g.black_remaining_ms,
+            "moves": g.move_list(since),
+            "result": g.result,
+            "seq": g.seq,
+        }
     return {
         "type": "game_state",
         "fen": g.fen,
         "white_remaining_ms": g.white_remaining_ms,
         "black_remaining_ms": g.black_remaining_ms,
-        "moves": [{"san": m.san, "time_ms": m.time_ms} for m in g.moves],
+        "moves": g.move_list(),
         "result": g.result,
+        "seq": g.seq,
     }
 
 
-def get_game_for_user(game_id: str, user_id: str) -> Game | None:
-    """Партия существует и пользователь в ней участник."""
-    g = _games.get(game_id)
+def game_moves_frame(g: Game, since: int | None = None) -> bytes:
+    """
+    Бинарный ответ на subscribe_game: ходы начиная с since (или все) в формате
+    movecodec — без JSON и без SAN; ограничение DELTA_MAX_MOVES не нужно.
+    """
+    since = since if since is not None and 0 <= since <= g.ply else 0
+    return encode_moves_frame(
+        g.id,
+        g.seq,
+        since,
+        g.move_codes,
+        g.clock_deltas,
+        g.white_remaining_ms,
+        g.black_remaining_ms,
+        g.result,
+    )
+
+
+def has_game(game_id: str) -> bool:
+    """Партия (живая или архивная) на этом воркере — без разворачивания архива."""
+    return game_id in store
+
+
+def get_game_for_user(game_id: str, user_id: str, live: bool = False) -> Game | None:
+    """Партия существует и пользователь в ней участник. live — только живая, архив не разворачивается."""
+    g = store.get_live(game_id) if live else get_game(game_id)
     if not g or (g.white_id != user_id and g.black_id != user_id):
         return None
     return g
@@ -143,40 +370,150 @@ def get_game_for_user(game_id: str, user_id: str) -> Game | None:
 
 def resign_game(game_id: str, user_id: str) -> dict | None:
     """Сдача партии. Возвращает payload для broadcast или None."""
-    g = get_game_for_user(game_id, user_id)
+    g = get_game_for_user(game_id, user_id, live=True)
+    if not g or g.result is not None:
+        return None
+    _finish(g, "0-1" if user_id == g.white_id else "1-0")
+    return _next_update(g)
+
+
+def abandon_game(user_id: str) -> tuple[Game, dict] | None:
+    """
+    Игрок отключился и не вернулся за окно переподключения: поражение в его живой
+    партии на этом воркере. Возвращает (партия, payload для broadcast) или None.
+    """
+    game_id = _live_by_user.get(user_id)
+    g = store.get_live(game_id) if game_id else None
+    update = resign_game(game_id, user_id) if g else None
+    return (g, update) if update else None
+
+
+def flag_game(game_id: str) -> dict | None:
+    """
+    Падение флага по таймеру часов. Возвращает payload для broadcast
+    или None, если партия уже завершена или время ещё не вышло.
+    """
+    g = store.get_live(game_id)
     if not g or g.result is not None:
         return None
-    g.result = "0-1" if user_id == g.white_id else "1-0"
+    if _remaining_after(g, time.monotonic()) > 0:
+        # Таймер сработал чуть раньше дедлайна — перепланировать
+        _schedule_clock(g)
+        return None
+    _flag(g)
+    return _next_update(g)
+
+
+def _next_update(g: Game) -> dict:
+    """Payload game_update без хода (сдача, флаг) со следующим seq."""
+    g.seq += 1
     return {
         "fen": g.fen,
         "white_remaining_ms": g.white_remaining_ms,
         "black_remaining_ms": g.black_remaining_ms,
         "result": g.result,
+        "seq": g.seq,
     }
 
 
-def apply_move(game_id: str, user_id: str, from_sq: str, to_sq: str, promotion: str | None = None) -> dict | None:
+def _finish(g: Game, result: str) -> None:
+    """Завершить партию и снять её часы."""
+    g.result = result
+    g.premoves.clear()
+    clocks.cancel(g.id)
+    store.mark_finished(g.id)
+    for user_id in (g.white_id, g.black_id):
+        if _live_by_user.get(user_id) == g.id:
+            del _live_by_user[user_id]
+    persistence.record_result(g)
+    g.rating_changes = ratings.record_game(g)
+    pool = POOL_OF[g.time_control_key]
+    for user_id, (rating, _) in g.rating_changes.items():
+        persistence.record_rating(user_id, pool, rating)
+
+
+def _lag_allowance(g: Game, color: chess.Color) -> int:
+    return g.white_lag_ms if color == chess.WHITE else g.black_lag_ms
+
+
+def _remaining_after(g: Game, now: float) -> int:
+    """Сколько мс останется у стороны, чей ход, к моменту now (с поправкой на её сеть)."""
+    remaining = g.white_remaining_ms if g.board.turn == chess.WHITE else g.black_remaining_ms
+    return remaining + _lag_allowance(g, g.board.turn) - int((now - g.last_clock_at) * 1000)
+
+
+def _schedule_clock(g: Game) -> None:
+    remaining = g.white_remaining_ms if g.board.turn == chess.WHITE else g.black_remaining_ms
+    clocks.schedule(g.id, g.last_clock_at + (remaining + _lag_allowance(g, g.board.turn)) / 1000)
+
+
+def _set_lag_allowance(g: Game, color: chess.Color, lag_ms: int) -> None:
+    """Обновить поправку стороны по её текущему RTT; дедлайн её часов сдвигается вместе с ней."""
+    lag_ms = min(max(0, lag_ms), LAG_COMPENSATION_MAX_MS)
+    if lag_ms == _lag_allowance(g, color):
+        return
+    if color == chess.WHITE:
+        g.white_lag_ms = lag_ms
+    else:
+        g.black_lag_ms = lag_ms
+    if g.board.turn == color:
+        _schedule_clock(g)
+
+
+def _flag(g: Game) -> None:
+    """У стороны, чей ход, вышло время. Ничья, если у соперника не хватает материала для мата."""
+    loser = g.board.turn
+    if loser == chess.WHITE:
+        g.white_remaining_ms = 0
+    else:
+        g.black_remaining_ms = 0
+    if g.board.has_insufficient_material(not loser):
+        _finish(g, "1/2-1/2")
+    else:
+        _finish(g, "0-1" if loser == chess.WHITE else "1-0")
+
+
+def _prepare_move(
+    game_id: str, user_id: str, from_sq: str, to_sq: str, promotion: str | None, now: float, lag_ms: int = 0
+) -> tuple[Game, chess.Move] | dict | None:
     """
-    Применить ход. Возвращает dict для broadcast (game_update) или None при ошибке.
+    Дешёвые проверки до analyze_move: участник, очередь хода, формат хода, флаг.
+    Возвращает (партия, ход), payload падения флага или None.
     """
-    g = get_game_for_user(game_id, user_id)
+    g = get_game_for_user(game_id, user_id, live=True)
     if not g or g.result is not None:
         return None
-    board = Board(g.fen)
-    if board.turn != (chess.WHITE if user_id == g.white_id else chess.BLACK):
+    color = chess.WHITE if user_id == g.white_id else chess.BLACK
+    if g.board.turn != color:
         return None
-    uci = from_sq + to_sq + (promotion or "")
     try:
-        move = chess.Move.from_uci(uci)
+        move = chess.Move.from_uci(from_sq + to_sq + (promotion or ""))
     except ValueError:
         return None
-    if move not in board.legal_moves:
-        return None
-    now = time.monotonic()
-    elapsed_ms = int((now - g.last_clock_at) * 1000)
-    tc = g.time_control
-    inc_ms = tc["increment_seconds"] * 1000
-    if board.turn == chess.WHITE:
+    _set_lag_allowance(g, color, lag_ms)
+    if _remaining_after(g, now) <= 0:
+        # Ход пришёл после дедлайна (и поправки на сеть), но раньше таймера часов
+        _flag(g)
+        return _next_update(g)
+    return g, move
+
+
+def _commit_move(g: Game, a: MoveAnalysis, now: float, elapsed_ms: int | None = None) -> dict:
+    """
+    Часы, история, конец партии и payload game_update — в цикле событий, O(1).
+    elapsed_ms — сколько списать с часов вместо прошедшего времени (премув).
+    Иначе с прошедшего времени снимается поправка на сеть ходившего: ход соперника шёл
+    к нему и его ход к серверу.
+    """
+    mover = not a.board.turn
+    if elapsed_ms is None:
+        elapsed_ms = int((now - g.last_clock_at) * 1000)
+        lag_ms = min(_lag_allowance(g, mover), elapsed_ms)
+        if lag_ms > 0:
+            elapsed_ms -= lag_ms
+            LAG_COMPENSATION_S.observe(lag_ms / 1000)
+    inc_ms = g.time_control["increment_seconds"] * 1000
+    if mover == chess.WHITE:
         white_used = min(g.white_remaining_ms, elapsed_ms)
         g.white_remaining_ms = max(0, g.white_remaining_ms - white_used + inc_ms)
         move_time_ms = white_used
@@ -185,24 +522,151 @@ def apply_move(game_id: str, user_id: str, from_sq: str, to_sq: str, promotion:
         g.black_remaining_ms = max(0, g.black_remaining_ms - black_used + inc_ms)
         move_time_ms = black_used
     g.last_clock_at = now
-    san = board.san(move)
-    board.push(move)
-    g.fen = board.fen()
-    g.moves.append(MoveRecord(san=san, time_ms=move_time_ms))
-    if board.is_checkmate():
-        g.result = "1-0" if board.turn == chess.BLACK else "0-1"
-    elif board.is_stalemate() or board.is_insufficient_material() or board.can_claim_fifty_moves() or board.can_claim_threefold_repetition():
-        g.result = "1/2-1/2"
-    elif g.white_remaining_ms <= 0 or g.black_remaining_ms <= 0:
-        g.result = "0-1" if g.white_remaining_ms <= 0 else "1-0"
-    uci = move.uci()
+    repetitions = g.adopt(a.board, a.move, a.key, move_time_ms)
+    uci = a.move.uci()
+    persistence.record_move(g, uci, move_time_ms)
+    if a.outcome == "checkmate":
+        _finish(g, "1-0" if mover == chess.WHITE else "0-1")
+    elif a.outcome == "draw" or repetitions >= 3:
+        _finish(g, "1/2-1/2")
+    else:
+        _schedule_clock(g)
+    g.seq += 1
     return {
         "fen": g.fen,
         "white_remaining_ms": g.white_remaining_ms,
         "black_remaining_ms": g.black_remaining_ms,
-        "san": san,
+        "san": a.san,
         "move_time_ms": move_time_ms,
         "result": g.result,
         "from": uci[:2],
         "to": uci[2:4],
+        "seq": g.seq,
+    }
+
+
+def set_premove(g: Game, user_id: str, from_sq: str | None, to_sq: str | None, promotion: str | None = None) -> bool:
+    """
+    Запомнить премув игрока (заменяет прежний); без from/to — отменить.
+    Легальность проверяется, когда соперник походит. Возвращает False, если премув не принят.
+    """
+    color = chess.WHITE if user_id == g.white_id else chess.BLACK
+    if g.result is not None:
+        return False
+    if not from_sq or not to_sq:
+        g.premoves.pop(color, None)
+        return True
+    if g.board.turn == color:
+        return False
+    try:
+        g.premoves[color] = chess.Move.from_uci(from_sq + to_sq + (promotion or ""))
+    except ValueError:
+        return False
+    PREMOVES.inc("stored")
+    return True
+
+
+def _take_premove(g: Game) -> chess.Move | None:
+    """Премув стороны, чья очередь ходить (снимается: срабатывает один раз)."""
+    return g.premoves.pop(g.board.turn, None) if g.result is None else None
+
+
+def _with_premove(update: dict, premove: MoveAnalysis | None, premove_update: dict | None) -> dict:
+    """
+    Один game_update на ход соперника и сработавший премув: позиция, часы и seq — после
+    обоих ходов, san/from/to — ход соперника, premove — ход по премуву
+    (или {"rejected": true}, если он оказался нелегален).
+    """
+    if premove is None:
+        PREMOVES.inc("rejected")
+        return {**update, "premove": {"rejected": True}}
+    PREMOVES.inc("applied")
+    return {
+        **premove_update,
+        "san": update["san"],
+        "move_time_ms": update["move_time_ms"],
+        "from": update["from"],
+        "to": update["to"],
+        "premove": {
+            "san": premove_update["san"],
+            "move_time_ms": premove_update["move_time_ms"],
+            "from": premove_update["from"],
+            "to": premove_update["to"],
+        },
     }
+
+
+def _move_steps(g: Game, move: chess.Move, now: float) -> Generator[chess.Move, MoveAnalysis | None, dict | None]:
+    """
+    Ход и премув соперника после проверок _prepare_move — одна логика для apply_move и
+    apply_move_async. Генератор отдаёт ход, который нужно проверить (analyze_move), получает
+    MoveAnalysis (None — ход нелегален или партия уже не та) и возвращает payload game_update.
+    """
+    a = yield move
+    if a is None:
+        return None
+    update = _commit_move(g, a, now)
+    premove = _take_premove(g)
+    if premove is None:
+        return update
+    a = yield premove
+    return _with_premove(update, a, _commit_move(g, a, now, PREMOVE_MS) if a else None)
+
+
+def apply_move(
+    game_id: str, user_id: str, from_sq: str, to_sq: str, promotion: str | None = None, lag_ms: int = 0
+) -> dict | None:
+    """
+    Применить ход (и премув соперника, если он есть), проверяя в цикле событий. Возвращает dict
+    для broadcast (game_update) или None при ошибке. lag_ms — медианный RTT игрока (см. _set_lag_allowance).
+    """
+    now = time.monotonic()
+    prepared = _prepare_move(game_id, user_id, from_sq, to_sq, promotion, now, lag_ms)
+    if not isinstance(prepared, tuple):
+        return prepared
+    g, move = prepared
+    steps = _move_steps(g, move, now)
+    try:
+        move = next(steps)
+        while True:
+            move = steps.send(position_cache.analyze(g.board, g.key, g.ply, move))
+    except StopIteration as e:
+        return e.value
+
+
+async def _analyze_async(g: Game, move: chess.Move) -> MoveAnalysis | None:
+    """
+    analyze_move на месте или в пуле (move_offload решает, нужно ли). Ранние ходы
+    считаются на месте: через кэш позиций они дешевле передачи в пул.
+    """
+    if g.ply <= position_cache.max_ply or not move_offload.should_offload():
+        return position_cache.analyze(g.board, g.key, g.ply, move)
+    ply = g.ply
+    a = await move_offload.run(analyze_move, g.board.copy(stack=False), move)
+    if a is None or g.result is not None or g.ply != ply:
+        # Пока ход считался, партия завершилась (флаг, сдача)
+        return None
+    return a
+
+
+async def apply_move_async(
+    game_id: str, user_id: str, from_sq: str, to_sq: str, promotion: str | None = None, lag_ms: int = 0
+) -> dict | None:
+    """
+    То же, что apply_move, но analyze_move может уйти в пул.
+    Ходы одной партии идут строго по очереди, разные партии — параллельно. Время хода
+    считается по моменту прихода: ожидание в пуле игроку не засчитывается.
+    """
+    now = time.monotonic()
+    async with move_offload.ordered(game_id):
+        prepared = _prepare_move(game_id, user_id, from_sq, to_sq, promotion, now, lag_ms)
+        if not isinstance(prepared, tuple):
+            return prepared
+        g, move = prepared
+        steps = _move_steps(g, move, now)
+        try:
+            move = next(steps)
+            while True:
+                move = steps.send(await _analyze_async(g, move))
+        except StopIteration as e:
+            return e.value
@@ -0,0 +1,577 @@
+"""
+Постоянное хранение пользователей, партий и ходов.
+Запись — вне горячего пути: события копятся в очереди WriteBehind и пишутся
+пачками раз в flush_interval_s или по достижении max_batch строк.
+GameRepository — интерфейс хранилища; SqliteRepository — локальная реализация
+(для PostgreSQL достаточно реализовать тот же интерфейс).
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from .config import get_config
+from .constants import DEFAULT_RATING, RATING_POOLS
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Запись по строке: если столько первых строк подряд не записалось, недоступно само хранилище
+ISOLATE_PROBE = 20
+
+
+@dataclass
+class WriteBatch:
+    """Пачка строк на одну транзакцию. Порядок применения: users, games, moves, results, ratings."""
+
+    # (user_id, telegram_id, username, seen_at)
+    users: list[tuple[str, int, str, float]] = field(default_factory=list)
+    # (id, time_control, white_id, black_id, white_username, black_username,
+    #  white_remaining_ms, black_remaining_ms, worker_id, created_at)
+    games: list[tuple[str, str, str, str, str, str, int, int, str, float]] = field(default_factory=list)
+    # (game_id, ply, uci, time_ms, white_remaining_ms, black_remaining_ms)
+    moves: list[tuple[str, int, str, int, int, int]] = field(default_factory=list)
+    # (result, white_remaining_ms, black_remaining_ms, finished_at, game_id)
+    results: list[tuple[str, int, int, float, str]] = field(default_factory=list)
+    # (pool, rating, user_id)
+    ratings: list[tuple[str, int, str]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.users) + len(self.games) + len(self.moves) + len(self.results) + len(self.ratings)
+
+    def rows(self) -> Iterator["WriteBatch"]:
+        """Каждая строка отдельной пачкой, в порядке применения (для поиска строки, на которой падает запись)."""
+        for name in ("users", "games", "moves", "results", "ratings"):
+            for row in getattr(self, name):
+                yield WriteBatch(**{name: [row]})
+
+
+@dataclass
+class StoredGame:
+    """Незавершённая партия из хранилища (для восстановления после рестарта)."""
+
+    id: str
+    time_control_key: str
+    white_id: str
+    black_id: str
+    white_username: str
+    black_username: str
+    white_remaining_ms: int
+    black_remaining_ms: int
+    # (uci, time_ms, white_remaining_ms, black_remaining_ms) по порядку
+    moves: list[tuple[str, int, int, int]] = field(default_factory=list)
+
+
+@dataclass
+class FinishedGame:
+    """Завершённая партия из хранилища (история и экспорт PGN)."""
+
+    id: str
+    time_control_key: str
+    white_id: str
+    black_id: str
+    white_username: str
+    black_username: str
+    result: str
+    created_at: float
+    finished_at: float
+    # (uci, white_remaining_ms, black_remaining_ms) по порядку; загружаются только по запросу
+    moves: list[tuple[str, int, int]] = field(default_factory=list)
+
+
+# Курсор истории: (finished_at, id) последней отданной партии; следующая страница — строго раньше
+HistoryCursor = tuple[float, str]
+# Результат для пересчёта рейтингов: (time_control, white_id, black_id, result, finished_at, id)
+ResultRow = tuple[str, str, str, str, float, str]
+
+
+class GameRepository(ABC):
+    """Интерфейс постоянного хранилища."""
+
+    @abstractmethod
+    async def open(self) -> None:
+        """Подключиться и создать схему, если её нет."""
+
+    @abstractmethod
+    async def write(self, batch: WriteBatch) -> None:
+        """Записать пачку одной транзакцией."""
+
+    @abstractmethod
+    async def load_unfinished(self, worker_id: str | None = None) -> list[StoredGame]:
+        """Партии без результата (только этого воркера, если worker_id задан)."""
+
+    @abstractmethod
+    async def history(self, user_id: str, before: HistoryCursor | None, limit: int) -> list[FinishedGame]:
+        """Завершённые партии пользователя от новых к старым, строго до курсора (без ходов)."""
+
+    @abstractmethod
+    async def load_game(self, game_id: str) -> FinishedGame | None:
+        """Завершённая партия вместе с ходами."""
+
+    @abstractmethod
+    async def load_moves(self, games: list[FinishedGame]) -> None:
+        """Заполнить moves у пачки партий одним запросом."""
+
+    @abstractmethod
+    async def load_ratings(self) -> list[tuple[str, str, dict[str, int]]]:
+        """[(user_id, username, {пул: рейтинг})] — только пулы, где рейтинг не стартовый."""
+
+    @abstractmethod
+    async def results_page(self, after: HistoryCursor | None, limit: int) -> list[ResultRow]:
+        """Результаты всех партий в порядке завершения, строго после курсора."""
+
+    async def close(self) -> None:
+        pass
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    telegram_id INTEGER UNIQUE NOT NULL,
+    username TEXT NOT NULL DEFAULT '',
+    blitz_rating INTEGER NOT NULL DEFAULT {rating},
+    rapid_rating INTEGER NOT NULL DEFAULT {rating},
+    created_at REAL NOT NULL,
+    last_seen_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS games (
+    id TEXT PRIMARY KEY,
+    time_control TEXT NOT NULL,
+    white_id TEXT NOT NULL,
+    black_id TEXT NOT NULL,
+    white_username TEXT NOT NULL,
+    black_username TEXT NOT NULL,
+    white_remaining_ms INTEGER NOT NULL,
+    black_remaining_ms INTEGER NOT NULL,
+    result TEXT,
+    worker_id TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS games_unfinished ON games (worker_id) WHERE result IS NULL;
+CREATE INDEX IF NOT EXISTS games_white_history ON games (white_id, finished_at, id) WHERE result IS NOT NULL;
+CREATE INDEX IF NOT EXISTS games_black_history ON games (black_id, finished_at, id) WHERE result IS NOT NULL;
+CREATE INDEX IF NOT EXISTS games_finished ON games (finished_at, id) WHERE result IS NOT NULL;
+CREATE TABLE IF NOT EXISTS moves (
+    game_id TEXT NOT NULL,
+    ply INTEGER NOT NULL,
+    uci TEXT NOT NULL,
+    time_ms INTEGER NOT NULL,
+    white_remaining_ms INTEGER NOT NULL,
+    black_remaining_ms INTEGER NOT NULL,
+    PRIMARY KEY (game_id, ply)
+) WITHOUT ROWID;
+""".format(rating=DEFAULT_RATING)
+
+
+class SqliteRepository(GameRepository):
+    """
+    SQLite в режиме WAL. Вызовы sqlite3 блокирующие — выполняются в потоке
+    через asyncio.to_thread; WriteBehind пишет одной пачкой за раз. Чтение истории идёт
+    через отдельное соединение (WAL не блокирует его записью), по одному запросу за раз.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._reader: sqlite3.Connection | None = None
+        self._read_lock = threading.Lock()
+
+    async def open(self) -> None:
+        await asyncio.to_thread(self._open)
+
+    def _open(self) -> None:
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SQLITE_SCHEMA)
+        self._db = db
+        # У :memory: второе соединение было бы другой базой
+        self._reader = db if self.path == ":memory:" else sqlite3.connect(self.path, check_same_thread=False)
+
+    async def write(self, batch: WriteBatch) -> None:
+        await asyncio.to_thread(self._write, batch)
+
+    def _write(self, batch: WriteBatch) -> None:
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "INSERT INTO users (user_id, telegram_id, username, created_at, last_seen_at)"
+                " VALUES (?1, ?2, ?3, ?4, ?4)"
+                " ON CONFLICT (user_id) DO UPDATE SET username = excluded.username,"
+                " last_seen_at = excluded.last_seen_at",
+                batch.users,
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO games (id, time_control, white_id, black_id, white_username,"
+                " black_username, white_remaining_ms, black_remaining_ms, worker_id, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch.games,
+            )
+            db.executemany("INSERT OR REPLACE INTO moves VALUES (?, ?, ?, ?, ?, ?)", batch.moves)
+            db.executemany(
+                "UPDATE games SET result = ?, white_remaining_ms = ?, black_remaining_ms = ?,"
+                " finished_at = ? WHERE id = ?",
+                batch.results,
+            )
+            for pool in RATING_POOLS:
+                rows = [(rating, user_id) for p, rating, user_id in batch.ratings if p == pool]
+                if rows:
+                    db.executemany(f"UPDATE users SET {pool}_rating = ? WHERE user_id = ?", rows)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    async def load_unfinished(self, worker_id: str | None = None) -> list[StoredGame]:
+        return await asyncio.to_thread(self._load_unfinished, worker_id)
+
+    def _load_unfinished(self, worker_id: str | None) -> list[StoredGame]:
+        db = self._db
+        sql = (
+            "SELECT id, time_control, white_id, black_id, white_username, black_username,"
+            " white_remaining_ms, black_remaining_ms FROM games WHERE result IS NULL"
+        )
+        rows = db.execute(sql + " AND worker_id = ?", (worker_id,)) if worker_id else db.execute(sql)
+        games = {row[0]: StoredGame(*row) for row in rows}
+        for game_id, g in games.items():
+            g.moves = db.execute(
+                "SELECT uci, time_ms, white_remaining_ms, black_remaining_ms FROM moves"
+                " WHERE game_id = ? ORDER BY ply",
+                (game_id,),
+            ).fetchall()
+        return list(games.values())
+
+    async def history(self, user_id: str, before: HistoryCursor | None, limit: int) -> list[FinishedGame]:
+        return await asyncio.to_thread(self._history, user_id, before, limit)
+
+    def _history(self, user_id: str, before: HistoryCursor | None, limit: int) -> list[FinishedGame]:
+        # Каждая половина UNION — диапазон по своему индексу (игрок, finished_at, id) с LIMIT:
+        # страница стоит O(limit) при любой длине истории, в отличие от OFFSET
+        cols = (
+            "SELECT id, time_control, white_id, black_id, white_username, black_username,"
+            " result, created_at, finished_at FROM games"
+        )
+        after = " AND (finished_at, id) < (?, ?)" if before else ""
+        half = f"{cols} WHERE {{side}} = ? AND result IS NOT NULL{after} ORDER BY finished_at DESC, id DESC LIMIT ?"
+        args = (user_id, *before, limit) if before else (user_id, limit)
+        sql = (
+            f"SELECT * FROM ({half.format(side='white_id')}) UNION ALL SELECT * FROM ({half.format(side='black_id')})"
+            " ORDER BY finished_at DESC, id DESC LIMIT ?"
+        )
+        with self._read_lock:
+            rows = self._reader.execute(sql, (*args, *args, limit)).fetchall()
+        return [FinishedGame(*row) for row in rows]
+
+    async def load_game(self, game_id: str) -> FinishedGame | None:
+        return await asyncio.to_thread(self._load_game, game_id)
+
+    def _load_game(self, game_id: str) -> FinishedGame | None:
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT id, time_control, white_id, black_id, white_username, black_username,"
+                " result, created_at, finished_at FROM games WHERE id = ? AND result IS NOT NULL",
+                (game_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        g = FinishedGame(*row)
+        self._load_moves([g])
+        return g
+
+    async def load_moves(self, games: list[FinishedGame]) -> None:
+        await asyncio.to_thread(self._load_moves, games)
+
+    def _load_moves(self, games: list[FinishedGame]) -> None:
+        by_id = {g.id: g for g in games}
+        if not by_id:
+            return
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT game_id, uci, white_remaining_ms, black_remaining_ms FROM moves"
+                f" WHERE game_id IN ({','.join('?' * len(by_id))}) ORDER BY game_id, ply",
+                tuple(by_id),
+            ).fetchall()
+        for game_id, uci, white_ms, black_ms in rows:
+            by_id[game_id].moves.append((uci, white_ms, black_ms))
+
+    async def load_ratings(self) -> list[tuple[str, str, dict[str, int]]]:
+        return await asyncio.to_thread(self._load_ratings)
+
+    def _load_ratings(self) -> list[tuple[str, str, dict[str, int]]]:
+        columns = ", ".join(f"{pool}_rating" for pool in RATING_POOLS)
+        where = " OR ".join(f"{pool}_rating != {DEFAULT_RATING}" for pool in RATING_POOLS)
+        with self._read_lock:
+            rows = self._reader.execute(f"SELECT user_id, username, {columns} FROM users WHERE {where}").fetchall()
+        return [
+            (user_id, username, {p: r for p, r in zip(RATING_POOLS, values) if r != DEFAULT_RATING})
+            for user_id, username, *values in rows
+        ]
+
+    async def results_page(self, after: HistoryCursor | None, limit: int) -> list[ResultRow]:
+        return await asyncio.to_thread(self._results_page, after, limit)
+
+    def _results_page(self, after: HistoryCursor | None, limit: int) -> list[ResultRow]:
+        sql = "SELECT time_control, white_id, black_id, result, finished_at, id FROM games WHERE result IS NOT NULL"
+        if after:
+            sql += " AND (finished_at, id) > (?, ?)"
+        with self._read_lock:
+            return self._reader.execute(sql + " ORDER BY finished_at, id LIMIT ?", (*(after or ()), limit)).fetchall()
+
+    async def close(self) -> None:
+        if self._reader is not None and self._reader is not self._db:
+            await asyncio.to_thread(self._reader.close)
+        self._reader = None
+        if self._db is not None:
+            await asyncio.to_thread(self._db.close)
+            self._db = None
+
+
+def make_repository(url: str) -> GameRepository | None:
+    """sqlite:///путь/к/файлу (или sqlite:///:memory:); пустая строка — без хранения."""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SqliteRepository(url[len("sqlite:///"):])
+    raise ValueError(f"unsupported DATABASE_URL: {url}")
+
+
+class WriteBehind:
+    """
+    Очередь записи: методы record_* только добавляют строку в текущую пачку (O(1),
+    без ввода-вывода); фоновая задача сбрасывает пачку в хранилище. При ошибке пачка
+    возвращается в очередь и повторяется; после max_retries неудач подряд пишется по строке:
+    строки, которые не записываются и по одной, выбрасываются (одна «ядовитая» строка не
+    держит всю очередь). Если по одной не записалась ни одна — хранилище недоступно, ничего
+    не выбрасывается. Сверх max_pending строк новые события теряются.
+    Запись идёт одной пачкой за раз: следующий сброс ждёт завершения предыдущего.
+    """
+
+    def __init__(
+        self,
+        repo: GameRepository | None,
+        flush_interval_s: float = 0.2,
+        max_batch: int = 500,
+        max_pending: int = 200_000,
+        max_retries: int = 3,
+    ):
+        self.repo = repo
+        self.flush_interval_s = flush_interval_s
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self._retries = 0  # неудачных сбросов подряд
+        self._batch = WriteBatch()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        # Метрики
+        self.batches = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+        self.discarded = 0  # строки, которые не записались и по одной
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.repo is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._batch)
+
+    def _accept(self) -> bool:
+        if self.repo is None:
+            return False
+        pending = len(self._batch)
+        if pending >= self.max_pending:
+            self.dropped += 1
+            return False
+        if pending + 1 >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    def record_user(self, user_id: str, telegram_id: int, username: str) -> None:
+        if self._accept():
+            self._batch.users.append((user_id, telegram_id, username, time.time()))
+
+    def record_game(self, g: Any, worker_id: str) -> None:
+        if self._accept():
+            self._batch.games.append((
+                g.id, g.time_control_key, g.white_id, g.black_id, g.white_username,
+                g.black_username, g.white_remaining_ms, g.black_remaining_ms, worker_id, time.time(),
+            ))
+
+    def record_move(self, g: Any, uci: str, time_ms: int) -> None:
+        if self._accept():
+            self._batch.moves.append(
+                (g.id, g.ply, uci, time_ms, g.white_remaining_ms, g.black_remaining_ms)
+            )
+
+    def record_rating(self, user_id: str, pool: str, rating: int) -> None:
+        if self._accept():
+            self._batch.ratings.append((pool, rating, user_id))
+
+    def record_result(self, g: Any) -> None:
+        if self._accept():
+            self._batch.results.append(
+                (g.result, g.white_remaining_ms, g.black_remaining_ms, time.time(), g.id)
+            )
+
+    async def open(self) -> None:
+        if self.repo is not None:
+            await self.repo.open()
+
+    def start(self) -> None:
+        """Запустить фоновую задачу записи (вызывать из lifespan)."""
+        if self.repo is not None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        """Сброс раз в flush_interval_s или раньше, если набралось max_batch."""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self.repo is None or not self._batch:
+            return
+        batch, self._batch = self._batch, WriteBatch()
+        started = time.perf_counter()
+        try:
+            await self.repo.write(batch)
+        except Exception:
+            self.failures += 1
+            self._retries += 1
+            if self._retries < self.max_retries:
+                logger.exception("persistence: write of %d rows failed, will retry", len(batch))
+                self._requeue(batch)
+            else:
+                logger.exception("persistence: write of %d rows failed %d times, writing row by row",
+                                 len(batch), self._retries)
+                self._retries = 0
+                await self._write_rows(batch)
+            return
+        self._retries = 0
+        ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.rows_written += len(batch)
+        self.last_flush_ms = ms
+        self.max_flush_ms = max(self.max_flush_ms, ms)
+
+    async def _write_rows(self, batch: WriteBatch) -> None:
+        """
+        Записать пачку по строке. Строка, которая не записалась, когда соседние записываются, —
+        ядовитая: выбрасывается. ISOLATE_PROBE неудач подряд (или ни одной записанной строки) —
+        сбой хранилища: эти строки и остаток пачки возвращаются в очередь.
+        """
+        rows = list(batch.rows())
+        written = 0
+        failed: list[tuple[int, Exception]] = []  # неудачи подряд с последней записанной строки
+        discarded: list[tuple[int, Exception]] = []
+        for i, row in enumerate(rows):
+            try:
+                await self.repo.write(row)
+            except Exception as e:
+                failed.append((i, e))
+                if len(failed) >= ISOLATE_PROBE:
+                    break
+                continue
+            written += 1
+            discarded.extend(failed)
+            failed.clear()
+        else:
+            if written:
+                discarded.extend(failed)
+                failed.clear()
+        if failed:
+            logger.warning("persistence: storage unavailable, %d rows stay queued", len(rows) - failed[0][0])
+            rest = WriteBatch()
+            for row in rows[failed[0][0]:]:
+                self._merge(rest, row)
+            self._requeue(rest)
+        for i, e in discarded:
+            logger.error("persistence: discarding row that cannot be written: %r (%s)", rows[i], e)
+        self.discarded += len(discarded)
+        if written:
+            self.batches += 1
+            self.rows_written += written
+
+    @staticmethod
+    def _merge(into: WriteBatch, batch: WriteBatch) -> None:
+        into.users.extend(batch.users)
+        into.games.extend(batch.games)
+        into.moves.extend(batch.moves)
+        into.results.extend(batch.results)
+        into.ratings.extend(batch.ratings)
+
+    def _requeue(self, batch: WriteBatch) -> None:
+        """Вернуть неудавшуюся пачку в начало очереди (порядок строк сохраняется)."""
+        current = self._batch
+        self._batch = WriteBatch(
+            users=batch.users + current.users,
+            games=batch.games + current.games,
+            moves=batch.moves + current.moves,
+            results=batch.results + current.results,
+            ratings=batch.ratings + current.ratings,
+        )
+
+    async def close(self) -> None:
+        """Дождаться текущей записи, дописать остаток и закрыть хранилище (при остановке)."""
+        if self.repo is None:
+            return
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        await self.repo.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending": self.pending,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "discarded": self.discarded,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+def _make_persistence() -> WriteBehind:
+    config = get_config()
+    return WriteBehind(
+        make_repository(config.database_url),
+        flush_interval_s=config.db_flush_interval_ms / 1000,
+        max_batch=config.db_flush_max_rows,
+    )
+
+
+persistence = _make_persistence()
+registry.gauge("phonechess_db_pending_rows", "Rows waiting for the next write-behind flush", lambda: persistence.pending)
+registry.counter_fn("phonechess_db_rows_written_total", "Rows written to the database", lambda: persistence.rows_written)
+registry.counter_fn("phonechess_db_failures_total", "Failed write-behind flushes", lambda: persistence.failures)
+registry.counter_fn(
+    "phonechess_db_discarded_rows_total", "Rows discarded after failing to write on their own",
+    lambda: persistence.discarded,
+)
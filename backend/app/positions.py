@@ -0,0 +1,195 @@
+"""
+Анализ хода и кэш ранних позиций.
+Почти все партии начинаются с одних и тех же позиций, поэтому для первых max_ply полуходов
+по Zobrist-ключу позиции кэшируется каждый сыгранный из неё ход: SAN, ключ позиции
+после него и признак конца партии. При попадании ход применяется без генерации ходов,
+SAN и проверок мата/пата. Кэш прогревается при старте
+по небольшой дебютной книге.
+"""
+import logging
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+import chess
+import chess.polyglot
+from chess import Board
+
+from .config import get_config
+from .metrics import registry
+from .movecodec import pack_move
+
+logger = logging.getLogger(__name__)
+
+# Популярные дебютные линии (SAN): по ним прогревается кэш
+OPENING_BOOK = (
+    "e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6 O-O Be7",
+    "e4 e5 Nf3 Nc6 Bc4 Bc5 c3 Nf6 d3 d6",
+    "e4 e5 Nf3 Nc6 Bc4 Nf6 Ng5 d5 exd5 Na5",
+    "e4 e5 Nf3 Nc6 d4 exd4 Nxd4 Nf6 Nxc6 bxc6",
+    "e4 e5 Nf3 Nf6 Nxe5 d6 Nf3 Nxe4 d4 d5",
+    "e4 e5 Nc3 Nf6 f4 d5 fxe5 Nxe4 Nf3 Be7",
+    "e4 e5 f4 exf4 Nf3 g5 h4 g4 Ne5 Nf6",
+    "e4 c5 Nf3 d6 d4 cxd4 Nxd4 Nf6 Nc3 a6",
+    "e4 c5 Nf3 Nc6 d4 cxd4 Nxd4 g6 Nc3 Bg7",
+    "e4 c5 Nc3 Nc6 g3 g6 Bg2 Bg7 d3 d6",
+    "e4 e6 d4 d5 Nc3 Nf6 Bg5 Be7 e5 Nfd7",
+    "e4 c6 d4 d5 Nc3 dxe4 Nxe4 Bf5 Ng3 Bg6",
+    "e4 d5 exd5 Qxd5 Nc3 Qa5 d4 Nf6 Nf3 Bf5",
+    "e4 d6 d4 Nf6 Nc3 g6 f4 Bg7 Nf3 O-O",
+    "d4 d5 c4 e6 Nc3 Nf6 Bg5 Be7 e3 O-O",
+    "d4 d5 c4 c6 Nf3 Nf6 Nc3 dxc4 a4 Bf5",
+    "d4 d5 c4 dxc4 Nf3 Nf6 e3 e6 Bxc4 c5",
+    "d4 d5 Bf4 Nf6 e3 c5 c3 Nc6 Nd2 e6",
+    "d4 Nf6 c4 g6 Nc3 Bg7 e4 d6 Nf3 O-O",
+    "d4 Nf6 c4 e6 Nc3 Bb4 e3 O-O Bd3 d5",
+    "d4 Nf6 c4 e6 Nf3 b6 g3 Bb7 Bg2 Be7",
+    "d4 Nf6 c4 c5 d5 b5 cxb5 a6 bxa6 Bxa6",
+    "d4 f5 g3 Nf6 Bg2 g6 Nf3 Bg7 O-O O-O",
+    "c4 e5 Nc3 Nf6 Nf3 Nc6 g3 d5 cxd5 Nxd5",
+    "c4 c5 Nc3 Nc6 g3 g6 Bg2 Bg7 Nf3 Nf6",
+    "Nf3 d5 g3 Nf6 Bg2 e6 O-O Be7 d3 O-O",
+    "Nf3 Nf6 c4 g6 Nc3 Bg7 e4 d6 d4 O-O",
+    "e4 e5 Qh5 Nc6 Bc4 g6 Qf3 Nf6 Ne2 Bg7",
+    "e4 e5 Bc4 Nf6 d3 c6 Nf3 d5 Bb3 Bd6",
+    "e4 Nf6 e5 Nd5 d4 d6 Nf3 g6 Bc4 Nb6",
+)
+
+
+class MoveAnalysis(NamedTuple):
+    """Результат analyze_move: доска после хода и всё, что для неё дорого считать."""
+
+    move: chess.Move
+    san: str
+    board: Board
+    key: int  # Zobrist-ключ позиции после хода
+    # None | "checkmate" | "draw" (пат, мало материала, 50 ходов); повторение — при фиксации
+    outcome: str | None
+
+
+def _terminal(board: Board) -> str | None:
+    """Конец партии, который зависит только от позиции (без правила 50 ходов и повторений)."""
+    if not any(board.generate_legal_moves()):
+        return "checkmate" if board.is_check() else "draw"
+    if board.is_insufficient_material():
+        return "draw"
+    return None
+
+
+def analyze_move(board: Board, move: chess.Move) -> MoveAnalysis | None:
+    """
+    Вся тяжёлая часть хода (python-chess): легальность, SAN, ход, проверки конца партии.
+    Не трогает ничего, кроме переданной доски, поэтому годится для пула потоков или процессов
+    (тогда передаётся копия доски). None — ход нелегален, доска не изменена.
+    """
+    if move not in board.legal_moves:
+        return None
+    san = board.san(move)
+    board.push(move)
+    board.clear_stack()
+    outcome = _terminal(board) or ("draw" if board.halfmove_clock >= 100 else None)
+    return MoveAnalysis(move, san, board, chess.polyglot.zobrist_hash(board), outcome)
+
+
+class CachedMove(NamedTuple):
+    san: str
+    key: int  # ключ позиции после хода
+    # Конец партии после хода; в первых max_ply полуходах правило 50 ходов не наступает
+    outcome: str | None
+
+
+class PositionCache:
+    """
+    LRU по Zobrist-ключу позиции: ключ -> {код хода -> CachedMove}. Только для первых
+    max_ply полуходов: дальше позиции почти не повторяются между партиями.
+    Позиция попадает в кэш со второй встречи (до этого её ключ лишь помечается в _seen),
+    иначе случайные позиции вытесняли бы дебютные. Нелегальные ходы не кэшируются.
+    Доступ — только из цикла событий (в пулах потоков/процессов кэш не используется).
+    """
+
+    def __init__(self, max_size: int = 10_000, max_ply: int = 12):
+        self.max_size = max_size
+        self.max_ply = max_ply if max_size > 0 else -1
+        self._entries: OrderedDict[int, dict[int, CachedMove]] = OrderedDict()
+        self._seen: set[int] = set()
+        # Метрики: hits — ход применён без генерации ходов вообще
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _moves(self, key: int) -> dict[int, CachedMove] | None:
+        """Ходы позиции из кэша (создаёт запись при второй встрече позиции)."""
+        moves = self._entries.get(key)
+        if moves is not None:
+            self._entries.move_to_end(key)
+            return moves
+        if key not in self._seen:
+            if len(self._seen) >= self.max_size:
+                self._seen.clear()
+            self._seen.add(key)
+            return None
+        self._seen.discard(key)
+        moves = self._entries[key] = {}
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return moves
+
+    def analyze(self, board: Board, key: int, ply: int, move: chess.Move) -> MoveAnalysis | None:
+        """
+        analyze_move через кэш. board — доска партии (на легальном ходе в ней делается push),
+        key — её Zobrist-ключ, ply — сколько ходов уже сделано.
+        """
+        if ply > self.max_ply:
+            return analyze_move(board, move)
+        moves = self._moves(key)
+        code = pack_move(move)
+        cached = moves.get(code) if moves is not None else None
+        if cached is None:
+            self.misses += 1
+            a = analyze_move(board, move)
+            if a is not None and moves is not None:
+                moves[code] = CachedMove(a.san, a.key, a.outcome)
+            return a
+        self.hits += 1
+        board.push(move)
+        board.clear_stack()
+        return MoveAnalysis(move, cached.san, board, cached.key, cached.outcome)
+
+    def warm(self, book: tuple[str, ...] = OPENING_BOOK) -> int:
+        """Заполнить кэш позициями книги со всеми ходами из них. Возвращает число позиций."""
+        for line in book:
+            board = Board()
+            for ply, san in enumerate(line.split()):
+                if ply > self.max_ply:
+                    break
+                moves = self._entries.setdefault(chess.polyglot.zobrist_hash(board), {})
+                for move in board.legal_moves:
+                    code = pack_move(move)
+                    if code not in moves:
+                        a = analyze_move(board.copy(stack=False), move)
+                        moves[code] = CachedMove(a.san, a.key, a.outcome)
+                board.push_san(san)
+        return len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "positions": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+def _make_cache() -> PositionCache:
+    config = get_config()
+    return PositionCache(max_size=config.position_cache_max, max_ply=config.position_cache_max_ply)
+
+
+position_cache = _make_cache()
+registry.counter_fn(
+    "phonechess_position_cache_total", "Early-game move lookups in the position cache",
+    lambda: {"hit": position_cache.hits, "miss": position_cache.misses},
+    label="result",
+)
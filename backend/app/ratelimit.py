@@ -0,0 +1,167 @@
+"""
+Защита цикла приёма WebSocket: лимит размера сообщения, token bucket на подключение
+(общий и по типу сообщения) и отключение злоупотребляющих клиентов.
+Проверка идёт до json.loads: тип берётся из сырой строки регулярным выражением.
+"""
+import re
+from collections import Counter
+from typing import Any
+
+from .config import get_config
+from .metrics import registry
+
+# "type":"<тип>" как ключ объекта: внутри строки кавычки были бы экранированы и не совпали бы
+_TYPE_RE = re.compile(r'"type"\s*:\s*"([a-z_]{1,32})"')
+
+# Лимиты по типу сообщения: (токенов в секунду, ёмкость). Остальные типы делят OTHER.
+RATE_POLICY: dict[str, tuple[float, float]] = {
+    "make_move": (10, 20),
+    "premove": (10, 20),
+    "join_queue": (1, 5),
+    "leave_queue": (1, 5),
+    "subscribe_game": (2, 5),
+    "watch_game": (2, 5),
+    "unwatch_game": (2, 5),
+    "top_games": (1, 3),
+    "resign": (1, 3),
+    "pong": (1, 3),
+}
+OTHER = "other"
+OTHER_POLICY = (5, 10)
+
+# Закрытие соединения: 1008 — нарушение политики, 1009 — слишком большое сообщение
+CLOSE_ABUSE = 1008
+CLOSE_TOO_BIG = 1009
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def allow(self, now: float) -> bool:
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+
+class ConnectionLimiter:
+    """
+    Лимитер одного подключения. admit() возвращает тип сообщения, если его можно
+    обрабатывать, иначе None. Каждое отброшенное сообщение тратит «штраф» из отдельного
+    bucket; когда штрафы кончились — abusive, клиента пора отключать.
+    """
+
+    __slots__ = ("guard", "total", "buckets", "strikes", "dropped", "abusive", "close_code")
+
+    def __init__(self, guard: "MessageGuard", now: float):
+        self.guard = guard
+        self.total = TokenBucket(guard.rate, guard.burst, now)
+        self.buckets: dict[str, TokenBucket] = {}
+        self.strikes = TokenBucket(guard.strike_refill, guard.strikes, now)
+        self.dropped = 0
+        self.abusive = False
+        self.close_code = CLOSE_ABUSE
+
+    def check_size(self, raw: str) -> bool:
+        """Только размер (для первого сообщения auth). False — закрыть с CLOSE_TOO_BIG."""
+        max_bytes = self.guard.max_bytes
+        # Лимит — в байтах UTF-8: символ занимает до 4 байт, кодируем только на границе
+        if not self.guard.enabled or len(raw) * 4 <= max_bytes or (
+            len(raw) <= max_bytes and len(raw.encode()) <= max_bytes
+        ):
+            return True
+        self.guard.dropped["oversized"] += 1
+        self.abusive = True
+        self.close_code = CLOSE_TOO_BIG
+        return False
+
+    def admit(self, raw: str, now: float) -> str | None:
+        guard = self.guard
+        if not self.check_size(raw):
+            # Сообщение больше лимита легальный клиент не шлёт — отключаем сразу
+            return None
+        m = _TYPE_RE.search(raw)
+        if m is None:
+            return self._reject("malformed", now)
+        msg_type = m.group(1)
+        if not guard.enabled:
+            return msg_type
+        # Тип присылает клиент: в счётчики и метки — только ключи RATE_POLICY и OTHER
+        key = msg_type if msg_type in RATE_POLICY else OTHER
+        if not self.total.allow(now):
+            return self._reject(key, now)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            rate, capacity = RATE_POLICY.get(key, OTHER_POLICY)
+            bucket = self.buckets[key] = TokenBucket(rate, capacity, now)
+        if not bucket.allow(now):
+            return self._reject(key, now)
+        return msg_type
+
+    def _reject(self, reason: str, now: float) -> None:
+        """Отбросить сообщение и списать штраф. reason — из конечного набора (метка метрики)."""
+        self.dropped += 1
+        self.guard.dropped[reason] += 1
+        if self.guard.enabled and not self.strikes.allow(now):
+            self.abusive = True
+        return None
+
+
+class MessageGuard:
+    """Настройки и общие счётчики; на каждое подключение — свой ConnectionLimiter."""
+
+    def __init__(
+        self,
+        max_bytes: int = 8192,
+        rate: float = 30,
+        burst: float = 60,
+        strikes: float = 50,
+        strike_refill: float = 1,
+        enabled: bool = True,
+    ):
+        self.max_bytes = max_bytes
+        self.rate = rate
+        self.burst = burst
+        self.strikes = strikes
+        self.strike_refill = strike_refill
+        self.enabled = enabled
+        self.dropped: Counter[str] = Counter()
+        self.disconnects = 0
+
+    def limiter(self, now: float) -> ConnectionLimiter:
+        return ConnectionLimiter(self, now)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "dropped_total": sum(self.dropped.values()),
+            "dropped": dict(self.dropped),
+            "disconnects": self.disconnects,
+        }
+
+
+def _make_guard() -> MessageGuard:
+    config = get_config()
+    return MessageGuard(
+        max_bytes=config.ws_max_message_bytes,
+        rate=config.ws_rate_per_s,
+        burst=config.ws_rate_burst,
+        strikes=config.ws_abuse_strikes,
+        enabled=config.ws_rate_limit,
+    )
+
+
+guard = _make_guard()
+registry.counter_fn(
+    "phonechess_ws_dropped_total", "Messages dropped by the rate limiter", lambda: dict(guard.dropped), label="reason"
+)
+registry.counter_fn("phonechess_ws_abuse_disconnects_total", "Clients disconnected for abuse", lambda: guard.disconnects)
@@ -0,0 +1,212 @@
+"""
+Рейтинги Эло по пулам (blitz, rapid — см. constants.POOL_OF).
+- Каждый результат сразу пересчитывает рейтинги двух игроков (целые, сумма сохраняется).
+- В пуле кроме словаря рейтингов — SortedList (−рейтинг, user_id): место игрока
+  и топ-N за O(log n), без сортировки на каждый запрос.
+- В пуле только сыгравшие в нём хотя бы одну партию; у остальных стартовый рейтинг и нет места.
+- audit — пересчёт всех рейтингов с нуля по сохранённым результатам (для сверки).
+Запуск сверки: python -m app.ratings [--apply]
+"""
+import asyncio
+import itertools
+import sys
+from collections.abc import Iterable
+from typing import Any
+
+from sortedcontainers import SortedList
+
+from .config import get_config
+from .constants import DEFAULT_RATING, POOL_OF, RATING_POOLS
+from .metrics import registry
+from .persistence import WriteBatch, make_repository
+
+# Очки белых по результату партии
+WHITE_SCORE = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+# Сколько результатов читать из хранилища за раз при пересчёте
+RECOMPUTE_PAGE_SIZE = 5000
+
+
+def elo_delta(rating: int, opponent: int, score: float, k: float) -> int:
+    """Изменение рейтинга игрока с рейтингом rating после партии с opponent (score — его очки)."""
+    expected = 1 / (1 + 10 ** ((opponent - rating) / 400))
+    return round(k * (score - expected))
+
+
+class RatingPool:
+    """Рейтинги одного пула: user_id -> рейтинг плюс упорядоченная лестница для мест и топа."""
+
+    def __init__(self) -> None:
+        self._ratings: dict[str, int] = {}
+        self._ladder = SortedList()  # (−рейтинг, user_id): первый — лучший
+
+    def __len__(self) -> int:
+        return len(self._ratings)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._ratings
+
+    def get(self, user_id: str) -> int:
+        return self._ratings.get(user_id, DEFAULT_RATING)
+
+    def set(self, user_id: str, rating: int) -> None:
+        old = self._ratings.get(user_id)
+        if old == rating:
+            return
+        if old is not None:
+            self._ladder.remove((-old, user_id))
+        self._ratings[user_id] = rating
+        self._ladder.add((-rating, user_id))
+
+    def rank(self, user_id: str) -> int | None:
+        """Место в пуле (1 — лучший; при равном рейтинге место общее) или None."""
+        rating = self._ratings.get(user_id)
+        if rating is None:
+            return None
+        return self._ladder.bisect_left((-rating, "")) + 1
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        """Первые n игроков: [(user_id, рейтинг)]."""
+        return [(user_id, -neg) for neg, user_id in itertools.islice(self._ladder, n)]
+
+    def items(self) -> Iterable[tuple[str, int]]:
+        return self._ratings.items()
+
+
+class Ratings:
+    """Пулы рейтингов и имена игроков (для таблицы лидеров)."""
+
+    def __init__(self, k: float = 20):
+        self.k = k
+        self.pools: dict[str, RatingPool] = {pool: RatingPool() for pool in RATING_POOLS}
+        self.names: dict[str, str] = {}
+        # Метрики
+        self.rated_games = 0
+
+    def rating_of(self, user_id: str, time_control_key: str) -> int:
+        """Рейтинг игрока в пуле режима (для матчмейкинга)."""
+        return self.pools[POOL_OF[time_control_key]].get(user_id)
+
+    def load(self, rows: Iterable[tuple[str, str, dict[str, int]]]) -> int:
+        """Заполнить из хранилища: [(user_id, username, {пул: рейтинг})]. Возвращает число игроков."""
+        n = 0
+        for user_id, username, by_pool in rows:
+            for pool, rating in by_pool.items():
+                self.pools[pool].set(user_id, rating)
+            if username:
+                self.names[user_id] = username
+            n += 1
+        return n
+
+    def record(
+        self, time_control_key: str, white_id: str, black_id: str, result: str
+    ) -> dict[str, tuple[int, int]]:
+        """
+        Учесть результат партии. Возвращает {user_id: (новый рейтинг, изменение)}
+        (пусто, если результат не рейтинговый).
+        """
+        score = WHITE_SCORE.get(result)
+        if score is None or white_id == black_id:
+            return {}
+        pool = self.pools[POOL_OF[time_control_key]]
+        white, black = pool.get(white_id), pool.get(black_id)
+        delta = elo_delta(white, black, score, self.k)
+        pool.set(white_id, white + delta)
+        pool.set(black_id, black - delta)
+        self.rated_games += 1
+        return {white_id: (white + delta, delta), black_id: (black - delta, -delta)}
+
+    def record_game(self, g: Any) -> dict[str, tuple[int, int]]:
+        """record по завершённой партии (Game из pairing)."""
+        self.names[g.white_id] = g.white_username
+        self.names[g.black_id] = g.black_username
+        return self.record(g.time_control_key, g.white_id, g.black_id, g.result)
+
+    def apply(self, pool: str, updates: dict[str, int]) -> None:
+        """Принять готовые рейтинги от воркера, где закончилась партия."""
+        for user_id, rating in updates.items():
+            self.pools[pool].set(user_id, rating)
+
+    def user(self, user_id: str) -> dict[str, Any]:
+        """Рейтинг и место игрока во всех пулах."""
+        return {
+            pool: {"rating": p.get(user_id), "rank": p.rank(user_id), "players": len(p)}
+            for pool, p in self.pools.items()
+        }
+
+    def leaderboard(self, pool: str, n: int) -> list[dict[str, Any]]:
+        out = []
+        rank = 0
+        for i, (user_id, rating) in enumerate(self.pools[pool].top(n)):
+            # Места с начала лестницы: при равном рейтинге — то же место, что у предыдущего
+            if not out or rating != out[-1]["rating"]:
+                rank = i + 1
+            out.append({"user_id": user_id, "username": self.names.get(user_id, ""), "rating": rating, "rank": rank})
+        return out
+
+    def stats(self) -> dict[str, Any]:
+        return {"rated_games": self.rated_games, "players": {pool: len(p) for pool, p in self.pools.items()}}
+
+
+async def audit(repo: Any, k: float, apply: bool = False) -> dict[str, Any]:
+    """
+    Пересчитать рейтинги по всей истории в хранилище и сравнить с сохранёнными.
+    apply — записать пересчитанные рейтинги в users.
+    """
+    fresh = Ratings(k)
+    after = None
+    while True:
+        page = await repo.results_page(after, RECOMPUTE_PAGE_SIZE)
+        for time_control_key, white_id, black_id, result, _, _ in page:
+            fresh.record(time_control_key, white_id, black_id, result)
+        if len(page) < RECOMPUTE_PAGE_SIZE:
+            break
+        after = (page[-1][4], page[-1][5])
+    stored = Ratings(k)
+    stored.load(await repo.load_ratings())
+    mismatched = 0
+    max_diff = 0
+    batch = WriteBatch()
+    for pool in RATING_POOLS:
+        fresh_pool, stored_pool = fresh.pools[pool], stored.pools[pool]
+        # Сохранённые рейтинги игроков без партий в истории должны вернуться к стартовому
+        users = itertools.chain(
+            (user_id for user_id, _ in fresh_pool.items()),
+            (user_id for user_id, _ in stored_pool.items() if user_id not in fresh_pool),
+        )
+        for user_id in users:
+            rating = fresh_pool.get(user_id)
+            diff = abs(rating - stored_pool.get(user_id))
+            if diff:
+                mismatched += 1
+                max_diff = max(max_diff, diff)
+                batch.ratings.append((pool, rating, user_id))
+    if apply and batch.ratings:
+        await repo.write(batch)
+    return {"games": fresh.rated_games, "mismatched": mismatched, "max_diff": max_diff, "applied": apply}
+
+
+def _make_ratings() -> Ratings:
+    return Ratings(k=get_config().rating_k)
+
+
+ratings = _make_ratings()
+registry.counter_fn("phonechess_rated_games_total", "Game results applied to ratings", lambda: ratings.rated_games)
+registry.gauge(
+    "phonechess_rated_players", "Players with a rating in the pool",
+    lambda: {pool: len(p) for pool, p in ratings.pools.items()}, label="pool",
+)
+
+
+async def _main(apply: bool) -> None:
+    repo = make_repository(get_config().database_url)
+    if repo is None:
+        sys.exit("DATABASE_URL is empty")
+    await repo.open()
+    try:
+        print(await audit(repo, ratings.k, apply))
+    finally:
+        await repo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main("--apply" in sys.argv[1:]))
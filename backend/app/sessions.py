@@ -0,0 +1,89 @@
+"""
+Возобновляемые сессии.
+- После auth клиент получает короткоживущий токен возобновления (HMAC от секрета бота):
+  при переподключении он заменяет полную проверку initData и годится на любом воркере.
+- Отключившийся пользователь сразу выходит из очередей, но его партия ждёт: сообщения
+  для него копятся (WSManager.park), а по истечении окна переподключения срабатывает
+  session_timers — поражение в партии.
+"""
+import base64
+import hashlib
+import hmac
+import os
+from typing import Any
+
+from .clock import ClockScheduler
+from .config import get_config
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class ResumeTokens:
+    """
+    Токен: base64url("telegram_id:expires_at:auth_date:username") + "." + base64url(HMAC-SHA256[:16]).
+    Без состояния на сервере: проверка — одна HMAC, без разбора initData.
+    auth_date — когда Telegram подписал initData, с которым вошли; при возобновлении переходит
+    в новый токен без изменений, поэтому цепочка токенов живёт не дольше max_age_s от него
+    (как и сам initData, см. auth_max_age_s).
+    """
+
+    def __init__(self, secret: bytes, ttl_s: int, max_age_s: int = 0):
+        self.secret = secret
+        self.ttl_s = ttl_s
+        self.max_age_s = max_age_s
+        # Метрики
+        self.issued = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def _sign(self, payload: bytes) -> str:
+        return _b64(hmac.new(self.secret, payload, hashlib.sha256).digest()[:16])
+
+    def issue(self, telegram_id: int, username: str, now: float, auth_date: int | None = None) -> str:
+        """auth_date — из initData или из токена, по которому вошли (None — вход без initData, DEBUG)."""
+        if auth_date is None:
+            auth_date = int(now)
+        expires_at = int(now) + self.ttl_s
+        if self.max_age_s > 0:
+            expires_at = min(expires_at, auth_date + self.max_age_s)
+        payload = f"{telegram_id}:{expires_at}:{auth_date}:{username}".encode()
+        self.issued += 1
+        return _b64(payload) + "." + self._sign(payload)
+
+    def verify(self, token: str, now: float) -> dict[str, Any] | None:
+        """Пользователь в том же виде, что возвращает validate_init_data, или None."""
+        try:
+            body, sig = token.split(".", 1)
+            payload = _unb64(body)
+            if not hmac.compare_digest(sig, self._sign(payload)):
+                raise ValueError("bad signature")
+            telegram_id, expires_at, auth_date, username = payload.decode().split(":", 3)
+            if int(expires_at) < now:
+                raise ValueError("expired")
+        except (ValueError, UnicodeDecodeError):
+            self.rejected += 1
+            return None
+        self.accepted += 1
+        return {"id": int(telegram_id), "username": username, "auth_date": int(auth_date)}
+
+    def stats(self) -> dict[str, int]:
+        return {"issued": self.issued, "accepted": self.accepted, "rejected": self.rejected}
+
+
+def _make_tokens() -> ResumeTokens:
+    config = get_config()
+    token = config.telegram_bot_token
+    # Без токена бота (DEBUG) секрет случайный: токены действуют только в этом процессе
+    secret = hmac.new(b"PhoneChessResume", token.encode(), hashlib.sha256).digest() if token else os.urandom(32)
+    return ResumeTokens(secret, config.resume_token_ttl_s, config.auth_max_age_s)
+
+
+resume_tokens = _make_tokens()
+# Дедлайны окна переподключения по user_id (тот же heap-планировщик, что у часов партий)
+session_timers = ClockScheduler()
@@ -0,0 +1,122 @@
+"""
+Зрители партий: у каждой партии свой канал зрителей, обновление сериализуется один раз
+(тем же текстом, что и игрокам) и с небольшой задержкой раскладывается всем зрителям.
+Индекс «топ партий» для лобби — в общем состоянии воркеров (state_backend.TopGames).
+"""
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from .config import get_config
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SendEncoded = Callable[[str, str, str | bytes], Awaitable[bool]]
+
+FANOUT_S = registry.histogram(
+    "phonechess_broadcast_seconds", "Serialize and enqueue one update for all recipients", kind="spectators"
+)
+
+
+class SpectatorHub:
+    """
+    Каналы зрителей: game_id -> множество user_id. Пользователь смотрит не больше одной партии.
+    Отправка — через send (WSManager.send_encoded), назначается при подключении обработчиков.
+    """
+
+    def __init__(self, max_per_game: int = 5000, delay_s: float = 0.5):
+        self.max_per_game = max_per_game
+        self.delay_s = delay_s
+        self.send: SendEncoded | None = None
+        self._watchers: dict[str, set[str]] = {}
+        self._watching: dict[str, str] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # Метрики
+        self.rejected_full = 0
+        self.fanouts = 0
+        self.messages = 0
+
+    def count(self, game_id: str) -> int:
+        watchers = self._watchers.get(game_id)
+        return len(watchers) if watchers else 0
+
+    def watch(self, game_id: str, user_id: str) -> bool:
+        """Подписать зрителя (из прежнего канала он уходит). False — канал заполнен."""
+        if self._watching.get(user_id) == game_id:
+            return True
+        watchers = self._watchers.get(game_id)
+        if watchers is not None and len(watchers) >= self.max_per_game:
+            self.rejected_full += 1
+            return False
+        self.unwatch(user_id)
+        self._watchers.setdefault(game_id, set()).add(user_id)
+        self._watching[user_id] = game_id
+        return True
+
+    def unwatch(self, user_id: str) -> None:
+        game_id = self._watching.pop(user_id, None)
+        if game_id is None:
+            return
+        watchers = self._watchers.get(game_id)
+        if watchers is not None:
+            watchers.discard(user_id)
+            if not watchers:
+                del self._watchers[game_id]
+
+    def close(self, game_id: str) -> None:
+        """Закрыть канал (партия завершена, итог разослан)."""
+        for user_id in self._watchers.pop(game_id, ()):
+            self._watching.pop(user_id, None)
+
+    def publish(self, game_id: str, msg_type: str, text: str | bytes, last: bool = False) -> None:
+        """
+        Разослать уже сериализованное обновление зрителям партии через delay_s.
+        last — партия завершена: после этой рассылки канал закрывается.
+        """
+        if not self._watchers.get(game_id) or self.send is None:
+            return
+        task = asyncio.create_task(self._fanout(game_id, msg_type, text, last))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fanout(self, game_id: str, msg_type: str, text: str | bytes, last: bool) -> None:
+        if self.delay_s > 0:
+            await asyncio.sleep(self.delay_s)
+        # Состав канала — на момент отправки (кто ушёл за время задержки, не получит)
+        watchers = list(self._watchers.get(game_id, ()))
+        if last:
+            self.close(game_id)
+        self.fanouts += 1
+        started = time.perf_counter()
+        for user_id in watchers:
+            try:
+                if await self.send(user_id, msg_type, text):
+                    self.messages += 1
+            except Exception:
+                logger.exception("spectators: send to %s failed", user_id)
+        FANOUT_S.observe(time.perf_counter() - started)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "channels": len(self._watchers),
+            "spectators": len(self._watching),
+            "max_channel": max((len(w) for w in self._watchers.values()), default=0),
+            "rejected_full": self.rejected_full,
+            "fanouts": self.fanouts,
+            "messages": self.messages,
+        }
+
+
+def _make_hub() -> SpectatorHub:
+    config = get_config()
+    return SpectatorHub(
+        max_per_game=config.spectators_max_per_game,
+        delay_s=config.spectator_delay_ms / 1000,
+    )
+
+
+spectators = _make_hub()
+registry.gauge("phonechess_spectators", "Users watching a game", lambda: len(spectators._watching))
@@ -0,0 +1,303 @@
+"""
+Общее состояние воркеров: очереди ожидания, владельцы партий, присутствие
+пользователей, «топ партий» лобби, лидерство матчмейкера и pub/sub между воркерами.
+InMemoryBackend — для одного процесса, RedisBackend — для нескольких воркеров/нод.
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from typing import Any
+
+from sortedcontainers import SortedList
+
+from .codec import decode, encode
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - redis нужен только для STATE_BACKEND=redis
+    redis_asyncio = None
+
+# Захват или продление аренды лидера одной операцией: между проверкой владельца и PEXPIRE
+# аренда не может истечь и достаться другому воркеру.
+# KEYS[1] — ключ аренды, ARGV[1] — worker_id, ARGV[2] — срок в мс
+ACQUIRE_LEADER_LUA = """
+if redis.call("SET", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    return 1
+end
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    redis.call("PEXPIRE", KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class StateBackend(ABC):
+    """Интерфейс общего состояния. Все значения — JSON-совместимые dict."""
+
+    # Очереди ожидания: один пользователь — не более одной записи
+    @abstractmethod
+    async def queue_put(self, user_id: str, entry: dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    async def queue_remove(self, user_id: str, time_control_key: str | None = None) -> bool: ...
+
+    @abstractmethod
+    async def queue_entries(self) -> dict[str, dict[str, Any]]: ...
+
+    # Партии: какой воркер держит живую доску и часы
+    @abstractmethod
+    async def set_game_owner(self, game_id: str, worker_id: str, ttl_s: float) -> None: ...
+
+    @abstractmethod
+    async def get_game_owner(self, game_id: str) -> str | None: ...
+
+    # Присутствие: на каком воркере открыт сокет пользователя
+    @abstractmethod
+    async def set_presence(self, user_id: str, worker_id: str) -> None: ...
+
+    @abstractmethod
+    async def clear_presence(self, user_id: str, worker_id: str) -> None: ...
+
+    @abstractmethod
+    async def get_presence(self, user_id: str) -> str | None: ...
+
+    # «Топ партий» лобби: живые партии всех воркеров по убыванию среднего рейтинга
+    @abstractmethod
+    async def top_games_add(self, game_id: str, rating: float, info: dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    async def top_games_remove(self, game_id: str) -> None: ...
+
+    @abstractmethod
+    async def top_games(self, k: int) -> list[dict[str, Any]]: ...
+
+    # Лидерство (аренда на ttl_s): кто ведёт матчмейкинг
+    @abstractmethod
+    async def acquire_leader(self, name: str, worker_id: str, ttl_s: float) -> bool: ...
+
+    # Pub/sub
+    @abstractmethod
+    async def publish(self, channel: str, message: dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    async def subscribe(self, channels: list[str]) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+        """Подписаться (к возврату подписка уже активна) и получить поток (канал, сообщение)."""
+
+    async def close(self) -> None:
+        pass
+
+
+class TopGames:
+    """Живые партии по убыванию среднего рейтинга: SortedList ключей (-рейтинг, game_id)."""
+
+    def __init__(self):
+        self._order = SortedList()
+        self._entries: dict[str, dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, game_id: str, rating: float, info: dict[str, Any]) -> None:
+        self.remove(game_id)
+        self._entries[game_id] = {"game_id": game_id, "rating": rating, **info}
+        self._order.add((-rating, game_id))
+
+    def remove(self, game_id: str) -> None:
+        entry = self._entries.pop(game_id, None)
+        if entry is not None:
+            self._order.remove((-entry["rating"], game_id))
+
+    def top(self, k: int) -> list[dict[str, Any]]:
+        return [self._entries[game_id] for _, game_id in self._order.islice(0, k)]
+
+
+class InMemoryBackend(StateBackend):
+    """Состояние в памяти процесса; pub/sub — через asyncio.Queue подписчиков."""
+
+    def __init__(self):
+        self._queue: dict[str, dict[str, Any]] = {}
+        self._owners: dict[str, tuple[str, float]] = {}
+        self._presence: dict[str, str] = {}
+        self._leaders: dict[str, tuple[str, float]] = {}
+        self._top = TopGames()
+        self._subscribers: dict[str, list[asyncio.Queue]] = defaultdict(list)
+
+    async def queue_put(self, user_id: str, entry: dict[str, Any]) -> None:
+        self._queue[user_id] = entry
+
+    async def queue_remove(self, user_id: str, time_control_key: str | None = None) -> bool:
+        entry = self._queue.get(user_id)
+        if entry is None or (time_control_key is not None and entry["time_control"] != time_control_key):
+            return False
+        del self._queue[user_id]
+        return True
+
+    async def queue_entries(self) -> dict[str, dict[str, Any]]:
+        return dict(self._queue)
+
+    async def set_game_owner(self, game_id: str, worker_id: str, ttl_s: float) -> None:
+        self._owners[game_id] = (worker_id, time.monotonic() + ttl_s)
+
+    async def get_game_owner(self, game_id: str) -> str | None:
+        owner = self._owners.get(game_id)
+        if owner is None:
+            return None
+        if owner[1] < time.monotonic():
+            del self._owners[game_id]
+            return None
+        return owner[0]
+
+    async def set_presence(self, user_id: str, worker_id: str) -> None:
+        self._presence[user_id] = worker_id
+
+    async def clear_presence(self, user_id: str, worker_id: str) -> None:
+        if self._presence.get(user_id) == worker_id:
+            del self._presence[user_id]
+
+    async def get_presence(self, user_id: str) -> str | None:
+        return self._presence.get(user_id)
+
+    async def top_games_add(self, game_id: str, rating: float, info: dict[str, Any]) -> None:
+        self._top.add(game_id, rating, info)
+
+    async def top_games_remove(self, game_id: str) -> None:
+        self._top.remove(game_id)
+
+    async def top_games(self, k: int) -> list[dict[str, Any]]:
+        return self._top.top(k)
+
+    async def acquire_leader(self, name: str, worker_id: str, ttl_s: float) -> bool:
+        now = time.monotonic()
+        holder = self._leaders.get(name)
+        if holder is None or holder[0] == worker_id or holder[1] < now:
+            self._leaders[name] = (worker_id, now + ttl_s)
+            return True
+        return False
+
+    async def publish(self, channel: str, message: dict[str, Any]) -> None:
+        for q in self._subscribers.get(channel, ()):
+            q.put_nowait((channel, message))
+
+    async def subscribe(self, channels: list[str]) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+        q: asyncio.Queue = asyncio.Queue()
+        for channel in channels:
+            self._subscribers[channel].append(q)
+
+        async def stream():
+            try:
+                while True:
+                    yield await q.get()
+            finally:
+                for channel in channels:
+                    self._subscribers[channel].remove(q)
+
+        return stream()
+
+
+class RedisBackend(StateBackend):
+    """
+    Состояние в Redis: очередь и присутствие — хэши, владелец партии — ключ с TTL,
+    «топ партий» — sorted set по рейтингу плюс хэш с записями, лидерство — SET NX PX с продлением (Lua-скрипт), доставка между воркерами — PUBLISH/SUBSCRIBE.
+    """
+
+    def __init__(self, url: str, prefix: str = "phonechess:"):
+        if redis_asyncio is None:
+            raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package")
+        self._redis = redis_asyncio.from_url(url)
+        self._prefix = prefix
+        self._acquire_leader = self._redis.register_script(ACQUIRE_LEADER_LUA)
+
+    def _key(self, name: str) -> str:
+        return self._prefix + name
+
+    async def queue_put(self, user_id: str, entry: dict[str, Any]) -> None:
+        await self._redis.hset(self._key("queue"), user_id, encode(entry))
+
+    async def queue_remove(self, user_id: str, time_control_key: str | None = None) -> bool:
+        key = self._key("queue")
+        if time_control_key is not None:
+            raw = await self._redis.hget(key, user_id)
+            if raw is None or decode(raw)["time_control"] != time_control_key:
+                return False
+        return bool(await self._redis.hdel(key, user_id))
+
+    async def queue_entries(self) -> dict[str, dict[str, Any]]:
+        raw = await self._redis.hgetall(self._key("queue"))
+        return {user_id.decode(): decode(entry) for user_id, entry in raw.items()}
+
+    async def set_game_owner(self, game_id: str, worker_id: str, ttl_s: float) -> None:
+        await self._redis.set(self._key(f"game:{game_id}"), worker_id, px=int(ttl_s * 1000))
+
+    async def get_game_owner(self, game_id: str) -> str | None:
+        owner = await self._redis.get(self._key(f"game:{game_id}"))
+        return owner.decode() if owner is not None else None
+
+    async def set_presence(self, user_id: str, worker_id: str) -> None:
+        await self._redis.hset(self._key("presence"), user_id, worker_id)
+
+    async def clear_presence(self, user_id: str, worker_id: str) -> None:
+        key = self._key("presence")
+        current = await self._redis.hget(key, user_id)
+        if current is not None and current.decode() == worker_id:
+            await self._redis.hdel(key, user_id)
+
+    async def get_presence(self, user_id: str) -> str | None:
+        worker_id = await self._redis.hget(self._key("presence"), user_id)
+        return worker_id.decode() if worker_id is not None else None
+
+    async def top_games_add(self, game_id: str, rating: float, info: dict[str, Any]) -> None:
+        entry = encode({"game_id": game_id, "rating": rating, **info})
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key("top_games:info"), game_id, entry)
+            pipe.zadd(self._key("top_games"), {game_id: rating})
+            await pipe.execute()
+
+    async def top_games_remove(self, game_id: str) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self._key("top_games"), game_id)
+            pipe.hdel(self._key("top_games:info"), game_id)
+            await pipe.execute()
+
+    async def top_games(self, k: int) -> list[dict[str, Any]]:
+        game_ids = await self._redis.zrevrange(self._key("top_games"), 0, k - 1)
+        if not game_ids:
+            return []
+        entries = await self._redis.hmget(self._key("top_games:info"), game_ids)
+        # Партия могла завершиться между двумя запросами
+        return [decode(entry) for entry in entries if entry is not None]
+
+    async def acquire_leader(self, name: str, worker_id: str, ttl_s: float) -> bool:
+        px = int(ttl_s * 1000)
+        return bool(await self._acquire_leader(keys=[self._key(f"leader:{name}")], args=[worker_id, px]))
+
+    async def publish(self, channel: str, message: dict[str, Any]) -> None:
+        await self._redis.publish(self._key(channel), encode(message))
+
+    async def subscribe(self, channels: list[str]) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(*(self._key(c) for c in channels))
+        skip = len(self._prefix)
+
+        async def stream():
+            try:
+                async for msg in pubsub.listen():
+                    if msg["type"] == "message":
+                        yield msg["channel"].decode()[skip:], decode(msg["data"])
+            finally:
+                await pubsub.aclose()
+
+        return stream()
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def make_backend(kind: str, redis_url: str) -> StateBackend:
+    if kind == "redis":
+        return RedisBackend(redis_url)
+    if kind == "memory":
+        return InMemoryBackend()
+    raise ValueError(f"unknown STATE_BACKEND: {kind}")
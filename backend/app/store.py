@@ -0,0 +1,184 @@
+"""
+Хранилище партий. Живые партии — в памяти как есть; завершённые после
+грейс-периода упаковываются в ArchivedGame (ходы по 16 бит + varint времени)
+и вытесняются по LRU с TTL от последнего обращения.
+"""
+import asyncio
+import gc
+import logging
+import random
+import sys
+import time
+from collections import OrderedDict
+from typing import Any
+
+from .config import get_config
+from .metrics import registry
+from .movecodec import codes_to_bytes
+
+logger = logging.getLogger(__name__)
+
+# Сколько объектов брать для оценки среднего размера партии
+_SIZE_SAMPLE = 32
+
+
+class ArchivedGame:
+    """Компактная форма завершённой партии."""
+
+    __slots__ = (
+        "id",
+        "time_control_key",
+        "white_id",
+        "black_id",
+        "white_username",
+        "black_username",
+        "is_private",
+        "result",
+        "seq",
+        "white_remaining_ms",
+        "black_remaining_ms",
+        "moves",
+        "clock_deltas",
+        "touched_at",
+    )
+
+    def __init__(self, g: Any, now: float):
+        self.id = g.id
+        self.time_control_key = g.time_control_key
+        self.white_id = g.white_id
+        self.black_id = g.black_id
+        self.white_username = g.white_username
+        self.black_username = g.black_username
+        self.is_private = g.is_private
+        self.result = g.result
+        self.seq = g.seq
+        self.white_remaining_ms = g.white_remaining_ms
+        self.black_remaining_ms = g.black_remaining_ms
+        self.moves = codes_to_bytes(g.move_codes)
+        self.clock_deltas = bytes(g.clock_deltas)
+        self.touched_at = now
+
+
+class GameStore:
+    def __init__(self, grace_s: float, max_archived: int, archive_ttl_s: float):
+        self.grace_s = grace_s
+        self.max_archived = max_archived
+        self.archive_ttl_s = archive_ttl_s
+        self._live: dict[str, Any] = {}
+        # game_id -> момент завершения, в порядке завершения
+        self._finished: dict[str, float] = {}
+        # LRU: в начале — давно не запрашиваемые
+        self._archived: OrderedDict[str, ArchivedGame] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._live) + len(self._archived)
+
+    def __contains__(self, game_id: str) -> bool:
+        """Партия на этом воркере (живая или в архиве); LRU архива не трогает."""
+        return game_id in self._live or game_id in self._archived
+
+    def add(self, g: Any) -> None:
+        self._live[g.id] = g
+
+    def remove(self, game_id: str) -> None:
+        self._live.pop(game_id, None)
+        self._finished.pop(game_id, None)
+        self._archived.pop(game_id, None)
+
+    def get_live(self, game_id: str) -> Any:
+        """Только живая партия (Game) или None: для ходов и сдачи архив не нужен."""
+        return self._live.get(game_id)
+
+    def get(self, game_id: str) -> Any:
+        """Живая партия (Game), ArchivedGame или None."""
+        g = self._live.get(game_id)
+        if g is not None:
+            return g
+        a = self._archived.get(game_id)
+        if a is not None:
+            a.touched_at = time.monotonic()
+            self._archived.move_to_end(game_id)
+        return a
+
+    def mark_finished(self, game_id: str) -> None:
+        """Партия завершена: через grace_s её можно архивировать."""
+        if game_id in self._live:
+            self._finished.setdefault(game_id, time.monotonic())
+
+    def sweep(self, now: float | None = None) -> None:
+        """Архивировать завершённые партии после грейс-периода и вытеснить старый архив."""
+        if now is None:
+            now = time.monotonic()
+        due = now - self.grace_s
+        while self._finished:
+            game_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > due:
+                break
+            del self._finished[game_id]
+            g = self._live.pop(game_id, None)
+            if g is not None:
+                self._archived[game_id] = ArchivedGame(g, now)
+        expired = now - self.archive_ttl_s
+        while self._archived:
+            a = next(iter(self._archived.values()))
+            if len(self._archived) <= self.max_archived and a.touched_at > expired:
+                break
+            self._archived.popitem(last=False)
+
+    async def run_sweeper(self, interval_s: float = 5.0) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("store: sweep failed")
+
+    def stats(self) -> dict[str, int]:
+        """Счётчики памяти: средний размер партии оценивается по выборке."""
+        live_each = _sample_bytes(list(self._live.values()))
+        archived_each = _sample_bytes(list(self._archived.values()))
+        return {
+            "live_games": len(self._live),
+            "finished_pending_archive": len(self._finished),
+            "archived_games": len(self._archived),
+            "bytes_per_live_game": live_each,
+            "bytes_per_archived_game": archived_each,
+            "live_bytes": live_each * len(self._live),
+            "archived_bytes": archived_each * len(self._archived),
+        }
+
+
+def _sample_bytes(objs: list[Any]) -> int:
+    if not objs:
+        return 0
+    sample = random.sample(objs, min(len(objs), _SIZE_SAMPLE))
+    return sum(deep_sizeof(o) for o in sample) // len(sample)
+
+
+def deep_sizeof(obj: Any) -> int:
+    """Размер объекта вместе со всем, на что он ссылается (общие синглтоны не считаем)."""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, type) or o is None:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return total
+
+
+def _make_store() -> GameStore:
+    config = get_config()
+    return GameStore(
+        grace_s=config.game_archive_grace_s,
+        max_archived=config.game_archive_max,
+        archive_ttl_s=config.game_archive_ttl_s,
+    )
+
+
+store = _make_store()
+registry.gauge("phonechess_live_games", "Games in memory that are not archived yet", lambda: len(store._live))
+registry.gauge("phonechess_archived_games", "Finished games kept in the archive", lambda: len(store._archived))
@@ -1,47 +1,351 @@
 """
 Обработка сообщений WebSocket: auth, join_queue, leave_queue.
 При матче — создание партии и отправка matched обоим игрокам.
+При обрыве сессия откладывается на окно переподключения (sessions.py).
 """
-import json
+import asyncio
+import base64
 import logging
+import random
+import time
 from typing import Any
 
 from fastapi import WebSocket
 from starlette.websockets import WebSocketDisconnect
 
 from .auth import validate_init_data
+from .clock import clocks
+from .cluster import cluster
+from .codec import decode, encode
 from .config import get_config
+from .constants import POOL_OF
+from .matchmaking import QueuedPlayer
+from .metrics import registry
 from .pairing import (
-    apply_move,
+    Game,
+    abandon_game,
+    apply_move_async,
+    flag_game,
+    get_game,
+    game_moves_frame,
     game_state_payload,
     get_game_for_user,
     get_queue_counts,
+    has_game,
     join_queue,
     leave_all_queues,
     leave_queue,
+    recover_games,
+    reset_queues,
     resign_game,
+    run_pairing_tick,
+    set_premove,
+    start_game,
+    top_game_entry,
+    waiting_counts,
 )
+from .persistence import persistence
+from .ratings import ratings
+from .ratelimit import guard
+from .sessions import resume_tokens, session_timers
+from .spectators import spectators
 from .ws_manager import manager
 
 logger = logging.getLogger(__name__)
 
+# Сообщения по партии: обрабатывает воркер, который держит партию
+GAME_MESSAGES = ("subscribe_game", "make_move", "premove", "resign", "watch_game", "unwatch_game")
+# Сколько партий максимум отдаём в списке top_games
+TOP_GAMES_MAX = 50
+# Сколько держать в общем состоянии запись «партия -> воркер-владелец»
+GAME_OWNER_TTL_S = 24 * 3600
+# Типы сообщений для счётчика; прочие считаются как other (метка не должна расти от мусора)
+MESSAGE_TYPES = ("auth", "join_queue", "leave_queue", "top_games", "pong", *GAME_MESSAGES)
+
+# Метрики горячего пути
+MESSAGES = registry.counter("phonechess_ws_messages_total", "Messages received from clients", label="type")
+APPLY_MOVE_S = registry.histogram("phonechess_apply_move_seconds", "Move validation and application, including time queued for the pool")
+MOVE_LATENCY_S = registry.histogram(
+    "phonechess_move_latency_seconds", "From receiving make_move to the update being queued for both players"
+)
+BROADCAST_S = registry.histogram(
+    "phonechess_broadcast_seconds", "Serialize and enqueue one update for all recipients", kind="game_update"
+)
+
 
 def _user_id(telegram_id: int) -> str:
     return str(telegram_id)
 
 
-async def handle_ws_message(ws: WebSocket, raw: str, user_id: str) -> bool:
+async def _send_game_update(g: Game, update: dict[str, Any]) -> None:
+    """Один encode на обоих игроков и всех зрителей партии (им — с задержкой)."""
+    started = time.perf_counter()
+    if update["result"] is not None and g.rating_changes:
+        update = {**update, "ratings": await _publish_ratings(g)}
+    if update["result"] is not None:
+        await cluster.backend.top_games_remove(g.id)
+    text = encode({"type": "game_update", "game_id": g.id, **update})
+    await manager.send_encoded(g.white_id, "game_update", text)
+    await manager.send_encoded(g.black_id, "game_update", text)
+    spectators.publish(g.id, "game_update", text, last=update["result"] is not None)
+    BROADCAST_S.observe(time.perf_counter() - started)
+
+
+async def _publish_ratings(g: Game) -> dict[str, Any]:
+    """Разослать новые рейтинги игроков всем воркерам; вернуть их для game_update (по цветам)."""
+    changes = g.rating_changes
+    await cluster.broadcast({
+        "op": "ratings",
+        "pool": POOL_OF[g.time_control_key],
+        "ratings": {user_id: rating for user_id, (rating, _) in changes.items()},
+    })
+    return {
+        color: {"rating": changes[user_id][0], "delta": changes[user_id][1]}
+        for color, user_id in (("white", g.white_id), ("black", g.black_id))
+    }
+
+
+async def on_clock_expired(game_id: str) -> None:
+    """Колбэк планировщика часов: флаг упал, сообщить обоим игрокам."""
+    update = flag_game(game_id)
+    if update:
+        g = get_game(game_id)
+        logger.info("WS: flag game_id=%s result=%s", game_id, update["result"])
+        await _send_game_update(g, update)
+
+
+clocks.on_expire = on_clock_expired
+
+
+async def _send_matched(game: Game) -> None:
+    """Отправить обоим игрокам matched (с начальными часами)."""
+    base = {
+        "type": "matched",
+        "game_id": game.id,
+        "time_control": game.time_control_key,
+        "fen": game.fen,
+        "white_username": game.white_username,
+        "black_username": game.black_username,
+        "white_remaining_ms": game.white_remaining_ms,
+        "black_remaining_ms": game.black_remaining_ms,
+    }
+    white_payload = {**base, "color": "white"}
+    black_payload = {**base, "color": "black"}
+    await manager.send_to_user(game.white_id, white_payload)
+    await manager.send_to_user(game.black_id, black_payload)
+
+
+async def matchmaking_loop() -> None:
+    """
+    Периодический тик пейринга. Пары подбирает только лидер; партия создаётся
+    на воркере одного из игроков, чтобы партии распределялись по воркерам.
+    """
+    interval = get_config().match_tick_ms / 1000
+    published = None
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await cluster.refresh_leadership():
+                entries = await cluster.backend.queue_entries()
+                reset_queues(list(entries.values()))
+                published = None
+            if not cluster.is_leader:
+                continue
+            for time_control_key, white, black in run_pairing_tick():
+                await cluster.backend.queue_remove(white.user_id)
+                await cluster.backend.queue_remove(black.user_id)
+                owner = await cluster.backend.get_presence(random.choice((white, black)).user_id)
+                if owner and owner != cluster.worker_id:
+                    await cluster.backend.publish(
+                        f"worker:{owner}",
+                        {
+                            "op": "start_game",
+                            "time_control": time_control_key,
+                            "white": _player_entry(white),
+                            "black": _player_entry(black),
+                        },
+                    )
+                else:
+                    await _start_game(time_control_key, white, black)
+            counts = waiting_counts()
+            if counts != published:
+                published = counts
+                await cluster.broadcast({"op": "queue_counts", "counts": counts})
+        except Exception:
+            logger.exception("WS: matchmaking tick failed")
+
+
+def _player_entry(p: QueuedPlayer) -> dict[str, Any]:
+    return {"user_id": p.user_id, "telegram_id": p.telegram_id, "username": p.username, "rating": p.rating}
+
+
+async def _start_game(time_control_key: str, white: QueuedPlayer, black: QueuedPlayer) -> None:
+    game = start_game(time_control_key, white, black)
+    await cluster.backend.set_game_owner(game.id, cluster.worker_id, GAME_OWNER_TTL_S)
+    await cluster.backend.top_games_add(game.id, *top_game_entry(game, (white.rating + black.rating) / 2))
+    await _send_matched(game)
+
+
+async def restore_games() -> None:
+    """
+    При старте: поднять из хранилища незавершённые партии этого воркера и снова стать их
+    владельцем. С общим состоянием нужен постоянный WORKER_ID: иначе «свои» партии не отличить
+    от партий живых воркеров, и у партии оказалось бы два владельца.
+    """
+    if persistence.repo is None:
+        return
+    config = get_config()
+    if config.state_backend != "memory" and not config.worker_id:
+        raise RuntimeError(f"WORKER_ID is required with STATE_BACKEND={config.state_backend} and DATABASE_URL set")
+    stored = []
+    for s in await persistence.repo.load_unfinished(config.worker_id or None):
+        owner = await cluster.backend.get_game_owner(s.id)
+        if owner is not None and owner != cluster.worker_id:
+            logger.warning("WS: not recovering game_id=%s, owned by worker %s", s.id, owner)
+            continue
+        stored.append(s)
+    games = recover_games(stored)
+    for game in games:
+        await cluster.backend.set_game_owner(game.id, cluster.worker_id, GAME_OWNER_TTL_S)
+        await cluster.backend.top_games_add(game.id, *top_game_entry(game))
+    if games:
+        logger.info("WS: recovered %d unfinished games", len(games))
+
+
+async def _on_start_game(msg: dict[str, Any]) -> None:
+    white = QueuedPlayer(**msg["white"])
+    black = QueuedPlayer(**msg["black"])
+    await _start_game(msg["time_control"], white, black)
+
+
+async def _on_queue_join(msg: dict[str, Any]) -> None:
+    join_queue(msg["time_control"], msg["user_id"], msg["telegram_id"], msg["username"])
+
+
+async def _on_queue_leave(msg: dict[str, Any]) -> None:
+    if msg.get("time_control"):
+        leave_queue(msg["time_control"], msg["user_id"])
+    else:
+        leave_all_queues(msg["user_id"])
+
+
+async def _on_queue_counts(msg: dict[str, Any]) -> None:
+    cluster.counts = msg["counts"]
+    await manager.broadcast_queue_counts()
+
+
+async def _on_deliver(msg: dict[str, Any]) -> None:
+    if "b64" in msg:
+        await manager.send_encoded(msg["user_id"], msg["msg_type"], base64.b64decode(msg["b64"]))
+    else:
+        await manager.send_encoded(msg["user_id"], msg["msg_type"], msg["text"])
+
+
+async def _on_ratings(msg: dict[str, Any]) -> None:
+    ratings.apply(msg["pool"], msg["ratings"])
+
+
+async def _on_abandon(msg: dict[str, Any]) -> None:
+    """Пользователь не вернулся после отключения: поражение, если его партия на этом воркере."""
+    result = abandon_game(msg["user_id"])
+    if result:
+        g, update = result
+        logger.info("WS: forfeit on disconnect game_id=%s user_id=%s", g.id, msg["user_id"])
+        await _send_game_update(g, update)
+
+
+def _start_grace(user_id: str) -> None:
+    """
+    Сессия отложена: из очередей — сразу (иначе офлайн-игрока могут свести с кем-то),
+    через disconnect_grace_s — _end_session, если пользователь не вернётся.
+    """
+    asyncio.ensure_future(_leave_queues(user_id))
+    session_timers.schedule(user_id, time.monotonic() + get_config().disconnect_grace_s)
+
+
+async def _end_session(user_id: str) -> None:
+    """Окно переподключения истекло: сдать партию за ушедшего."""
+    if not manager.drop_parked(user_id):
+        return
+    spectators.unwatch(user_id)
+    await cluster.backend.clear_presence(user_id, cluster.worker_id)
+    if await cluster.backend.get_presence(user_id) is not None:
+        # Переподключился к другому воркеру — партия остаётся за ним
+        return
+    await cluster.broadcast({"op": "abandon", "user_id": user_id})
+    logger.info("WS: session expired user_id=%s", user_id)
+
+
+async def _on_session_moved(msg: dict[str, Any]) -> None:
+    """Пользователь вошёл на другом воркере: отложенная здесь сессия продолжается там."""
+    if msg["worker_id"] == cluster.worker_id:
+        return
+    session_timers.cancel(msg["user_id"])
+    sent = await manager.hand_over(msg["user_id"])
+    if sent:
+        logger.info("WS: handed %d messages for user_id=%s to worker %s", sent, msg["user_id"], msg["worker_id"])
+
+
+async def _on_ws_message(msg: dict[str, Any]) -> None:
+    """Сообщение по партии этого воркера от игрока, подключённого к другому воркеру."""
+    await handle_ws_message(None, msg["raw"], msg["user_id"], lag_ms=msg.get("lag_ms", 0))
+
+
+async def _leave_queues(user_id: str, time_control: str | None = None) -> None:
+    if await cluster.backend.queue_remove(user_id, time_control):
+        await cluster.to_matchmaker({"op": "queue_leave", "user_id": user_id, "time_control": time_control})
+
+
+cluster.on("start_game", _on_start_game)
+cluster.on("queue_join", _on_queue_join)
+cluster.on("queue_leave", _on_queue_leave)
+cluster.on("queue_counts", _on_queue_counts)
+cluster.on("deliver", _on_deliver)
+cluster.on("ws_message", _on_ws_message)
+cluster.on("abandon", _on_abandon)
+cluster.on("session_moved", _on_session_moved)
+cluster.on("ratings", _on_ratings)
+manager.remote = cluster.deliver
+manager.elsewhere = cluster.elsewhere
+manager.on_parked = _start_grace
+session_timers.on_expire = _end_session
+spectators.send = manager.send_encoded
+
+
+async def handle_ws_message(
+    ws: WebSocket, raw: str, user_id: str, expected_type: str | None = None, lag_ms: int | None = None
+) -> bool:
     """
     Обрабатывает одно сообщение от уже авторизованного клиента.
+    expected_type — тип, по которому сообщение прошло лимитер (должен совпасть с разобранным).
+    lag_ms — медианный RTT игрока, если он подключён к другому воркеру (иначе — у своего подключения).
     Возвращает False если соединение нужно закрыть.
     """
+    received = time.perf_counter()
     try:
-        data = json.loads(raw)
-    except json.JSONDecodeError as e:
+        data = decode(raw)
+    except ValueError as e:
         logger.warning("WS: invalid JSON from %s: %s", user_id, e)
         return True
+    if not isinstance(data, dict):
+        return True
     t = data.get("type")
-    logger.info("WS: msg from %s type=%s", user_id, t)
+    if expected_type is not None and t != expected_type:
+        # Тип во вложенном объекте не тот, что на верхнем уровне — лимит списан не с того bucket
+        return True
+    MESSAGES.inc(t if t in MESSAGE_TYPES else "other")
+    logger.debug("WS: msg from %s type=%s", user_id, t)
+    if t == "pong":
+        manager.pong(user_id, time.monotonic())
+        return True
+    if lag_ms is None:
+        lag_ms = manager.lag_ms(user_id)
+    if t in GAME_MESSAGES:
+        game_id = data.get("game_id")
+        if isinstance(game_id, str) and not has_game(game_id):
+            # Партию держит другой воркер — переслать ему
+            await cluster.forward_to_owner(game_id, user_id, raw, lag_ms)
+            return True
     if t == "join_queue":
         time_control = data.get("time_control")
         if time_control not in get_queue_counts():
@@ -49,89 +353,103 @@ async def handle_ws_message(ws: WebSocket, raw: str, user_id: str) -> bool:
         conn = manager._by_user.get(user_id)
         if not conn:
             return True
-        game = join_queue(
-            time_control,
-            user_id,
-            conn.telegram_id,
-            conn.username or "",
-        )
-        if game:
-            # Отправить обоим игрокам matched (с начальными часами)
-            base = {
-                "type": "matched",
-                "game_id": game.id,
-                "time_control": game.time_control_key,
-                "fen": game.fen,
-                "white_username": game.white_username,
-                "black_username": game.black_username,
-                "white_remaining_ms": game.white_remaining_ms,
-                "black_remaining_ms": game.black_remaining_ms,
-            }
-            white_payload = {**base, "color": "white"}
-            black_payload = {**base, "color": "black"}
-            await manager.send_to_user(game.white_id, white_payload)
-            await manager.send_to_user(game.black_id, black_payload)
-        await manager.broadcast_queue_counts()
+        entry = {
+            "time_control": time_control,
+            "user_id": user_id,
+            "telegram_id": conn.telegram_id,
+            "username": conn.username or "",
+        }
+        await cluster.backend.queue_put(user_id, entry)
+        await cluster.to_matchmaker({"op": "queue_join", **entry})
         return True
     if t == "leave_queue":
-        time_control = data.get("time_control")
-        if time_control:
-            leave_queue(time_control, user_id)
-        else:
-            leave_all_queues(user_id)
-        await manager.broadcast_queue_counts()
+        await _leave_queues(user_id, data.get("time_control") or None)
         return True
     if t == "subscribe_game":
         game_id = data.get("game_id")
+        since = data.get("since")
         g = get_game_for_user(game_id, user_id) if game_id else None
         if g:
-            await manager.send_to_user(user_id, game_state_payload(g))
+            since = since if isinstance(since, int) and not isinstance(since, bool) else None
+            if data.get("binary") is True:
+                await manager.send_encoded(user_id, "game_moves", game_moves_frame(g, since))
+            else:
+                await manager.send_to_user(user_id, game_state_payload(g, since))
+        return True
+    if t == "watch_game":
+        game_id = data.get("game_id")
+        g = get_game(game_id) if isinstance(game_id, str) else None
+        if g:
+            if g.result is None and not spectators.watch(game_id, user_id):
+                await manager.send_to_user(user_id, {"type": "watch_rejected", "game_id": game_id, "reason": "full"})
+                return True
+            await manager.send_to_user(user_id, _spectate_payload(g))
+        return True
+    if t == "unwatch_game":
+        spectators.unwatch(user_id)
+        return True
+    if t == "top_games":
+        limit = data.get("limit")
+        limit = min(limit, TOP_GAMES_MAX) if isinstance(limit, int) and limit > 0 else 10
+        # Список общий для всех воркеров. Зрителей считает воркер-владелец партии (туда уходит
+        # watch_game): у партий других воркеров здесь 0, и клиент число не показывает
+        top = await cluster.backend.top_games(limit)
+        games = [{**e, "spectators": spectators.count(e["game_id"])} for e in top]
+        await manager.send_to_user(user_id, {"type": "top_games", "games": games})
         return True
+    if t == "premove":
+        game_id = data.get("game_id")
+        g = get_game_for_user(game_id, user_id, live=True) if game_id else None
+        if not g or g.result is not None:
+            return True
+        if set_premove(g, user_id, data.get("from"), data.get("to"), data.get("promotion")):
+            return True
+        if not data.get("from") or not data.get("to") or g.board.turn != (g.white_id == user_id):
+            return True
+        # Ход соперника пришёл раньше премува: это обычный ход
+        t = "make_move"
     if t == "make_move":
         game_id = data.get("game_id")
         from_sq = data.get("from")
         to_sq = data.get("to")
         promotion = data.get("promotion")
-        g = get_game_for_user(game_id, user_id) if game_id else None
+        g = get_game_for_user(game_id, user_id, live=True) if game_id else None
         if g and from_sq and to_sq:
-            update = apply_move(game_id, user_id, from_sq, to_sq, promotion)
+            started = time.perf_counter()
+            update = await apply_move_async(game_id, user_id, from_sq, to_sq, promotion, lag_ms)
+            APPLY_MOVE_S.observe(time.perf_counter() - started)
             if update:
-                payload = {
-                    "type": "game_update",
-                    "fen": update["fen"],
-                    "white_remaining_ms": update["white_remaining_ms"],
-                    "black_remaining_ms": update["black_remaining_ms"],
-                    "san": update["san"],
-                    "move_time_ms": update["move_time_ms"],
-                    "result": update["result"],
-                    "from": update.get("from"),
-                    "to": update.get("to"),
-                }
-                await manager.send_to_user(g.white_id, payload)
-                await manager.send_to_user(g.black_id, payload)
+                await _send_game_update(g, update)
+                MOVE_LATENCY_S.observe(time.perf_counter() - received)
         return True
     if t == "resign":
         game_id = data.get("game_id")
-        g = get_game_for_user(game_id, user_id) if game_id else None
+        g = get_game_for_user(game_id, user_id, live=True) if game_id else None
         if g:
             update = resign_game(game_id, user_id)
             if update:
-                payload = {
-                    "type": "game_update",
-                    "fen": update["fen"],
-                    "white_remaining_ms": update["white_remaining_ms"],
-                    "black_remaining_ms": update["black_remaining_ms"],
-                    "result": update["result"],
-                }
-                await manager.send_to_user(g.white_id, payload)
-                await manager.send_to_user(g.black_id, payload)
+                await _send_game_update(g, update)
         return True
     return True
 
 
+def _spectate_payload(g: Game) -> dict[str, Any]:
+    """Начальное состояние для зрителя: снимок партии и кто играет."""
+    return {
+        **game_state_payload(g),
+        "type": "spectate",
+        "game_id": g.id,
+        "time_control": g.time_control_key,
+        "white_username": g.white_username,
+        "black_username": g.black_username,
+        "spectators": spectators.count(g.id),
+    }
+
+
 async def ws_auth_and_loop(ws: WebSocket) -> None:
     """
-    Первое сообщение — auth с init_data. Дальше цикл приёма сообщений.
+    Первое сообщение — auth с init_data (или resume_token из прошлого подключения).
+    Дальше цикл приёма сообщений.
     """
     config = get_config()
     user_id = None
@@ -139,15 +457,25 @@ async def ws_auth_and_loop(ws: WebSocket) -> None:
         await ws.accept()
         logger.info("WS: accepted, waiting for auth")
         raw = await ws.receive_text()
-        data = json.loads(raw)
-        msg_type = data.get("type")
+        limiter = guard.limiter(time.monotonic())
+        if not limiter.check_size(raw):
+            logger.warning("WS: auth message too big (%d), closing %d", len(raw), limiter.close_code)
+            await ws.close(code=limiter.close_code)
+            return
+        data = decode(raw)
+        msg_type = data.get("type") if isinstance(data, dict) else None
+        MESSAGES.inc("auth" if msg_type == "auth" else "other")
         logger.info("WS: first message type=%s", msg_type)
         if msg_type != "auth":
             logger.warning("WS: expected auth, got %s, closing 4001", msg_type)
             await ws.close(code=4001)
             return
         init_data = data.get("init_data", "")
-        if config.debug and not init_data:
+        resume_token = data.get("resume_token")
+        user = resume_tokens.verify(resume_token, time.time()) if isinstance(resume_token, str) else None
+        if user is not None:
+            logger.info("WS: resume token accepted, uid=%s", user["id"])
+        elif config.debug and not init_data:
             uid = data.get("debug_uid", 0)
             user = {"id": uid, "first_name": "Dev", "username": f"dev{uid}"}
             logger.info("WS: debug auth, uid=%s", uid)
@@ -160,24 +488,50 @@ async def ws_auth_and_loop(ws: WebSocket) -> None:
         telegram_id = int(user["id"])
         user_id = _user_id(telegram_id)
         username = user.get("username") or user.get("first_name") or ""
-        await manager.connect(ws, user_id, telegram_id, username)
+        session_timers.cancel(user_id)
+        parked = await manager.connect(ws, user_id, telegram_id, username)
+        await cluster.backend.set_presence(user_id, cluster.worker_id)
+        if parked is None:
+            # Сессия могла остаться отложенной на другом воркере — её сообщения перешлют сюда
+            await cluster.broadcast({"op": "session_moved", "user_id": user_id, "worker_id": cluster.worker_id})
+        persistence.record_user(user_id, telegram_id, username)
         logger.info("WS: auth ok user_id=%s username=%s", user_id, username)
+        # complete — все сообщения за время отключения будут доставлены, докачивать партию не нужно
+        await manager.send_to_user(user_id, {
+            "type": "session",
+            "resume_token": resume_tokens.issue(telegram_id, username, time.time(), user.get("auth_date")),
+            "resumed": parked is not None,
+            "complete": parked is not None and not parked.overflowed,
+        })
+        if parked is not None:
+            manager.replay(user_id, parked)
         await manager.send_to_user(
             user_id,
             {"type": "queue_counts", "counts": get_queue_counts()},
         )
         logger.info("WS: queue_counts sent to %s", user_id)
+        manager.ping(user_id)
         while True:
             msg = await ws.receive_text()
-            if not await handle_ws_message(ws, msg, user_id):
+            msg_type = limiter.admit(msg, time.monotonic())
+            if msg_type is None:
+                if limiter.abusive:
+                    guard.disconnects += 1
+                    logger.warning(
+                        "WS: disconnecting abusive client user_id=%s dropped=%d", user_id, limiter.dropped
+                    )
+                    await ws.close(code=limiter.close_code)
+                    break
+                continue
+            if not await handle_ws_message(ws, msg, user_id, msg_type):
                 break
     except WebSocketDisconnect as e:
         logger.info("WS: client disconnected code=%s reason=%s user_id=%s", e.code, e.reason or "", user_id)
     except Exception as e:
         logger.exception("WS: error user_id=%s: %s", user_id, e)
     finally:
-        if user_id:
-            leave_all_queues(user_id)
-            manager.disconnect(user_id)
-            await manager.broadcast_queue_counts()
-            logger.info("WS: disconnected user_id=%s", user_id)
+        # Если пользователь уже переподключился, новое подключение не трогаем; иначе сессия
+        # ждёт переподключения (партия и присутствие сохраняются до _end_session, из очередей
+        # пользователь выходит сразу — _start_grace)
+        if user_id and manager.park(user_id, ws):
+            logger.info("WS: disconnected user_id=%s, waiting for resume", user_id)
@@ -1,30 +1,232 @@
 """
 Менеджер WebSocket: подключения по user_id, рассылка очередей и событий игры.
 """
-import json
+import asyncio
 import logging
+import time
+from array import array
+from collections import deque
+from collections.abc import Awaitable, Callable
 from typing import Any
 
 from fastapi import WebSocket
 
-from .constants import TIME_CONTROL_KEYS
+from .codec import encode
+from .config import get_config
+from .metrics import Histogram, registry
 from .pairing import get_queue_counts
 
 logger = logging.getLogger(__name__)
 
+QUEUE_COUNTS_BROADCAST_S = registry.histogram(
+    "phonechess_broadcast_seconds", "Serialize and enqueue one update for all recipients", kind="queue_counts"
+)
+
+# Heartbeat: реестр обходится по частям раз в такт (ping'и размазаны по интервалу, а не пачкой
+# на всех — цикл событий не стоит), по скольким последним замерам считается медианный RTT,
+# границы гистограммы RTT (с)
+HEARTBEAT_TICK_S = 0.1
+RTT_SAMPLES = 7
+RTT_BUCKETS = [0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1, 2, 5]
+# Закрытие подключения, не ответившего на ping
+CLOSE_HEARTBEAT = 4009
+
 
 class Connection:
-    def __init__(self, ws: WebSocket, user_id: str, telegram_id: int, username: str):
+    """
+    Подключение с ограниченной исходящей очередью и собственной задачей-писателем:
+    медленный клиент не задерживает рассылку остальным.
+    Политика: устаревший queue_counts заменяется свежим, остальные сообщения
+    (game_update и т.п.) не выбрасываются; при переполнении очереди — отключение.
+    Очередь и писатель есть только пока есть что отправлять: простаивающее подключение
+    (их большинство) — это один объект со слотами.
+    """
+
+    __slots__ = (
+        "ws", "user_id", "telegram_id", "username", "high_water", "_outbox", "_pending_counts",
+        "_writer", "_on_dead", "closed", "sent", "dropped_counts", "send_latency_ms", "send_latency_max_ms",
+        "ping_sent_at", "rtt_samples",
+    )
+
+    def __init__(self, ws: WebSocket, user_id: str, telegram_id: int, username: str, high_water: int = 256):
         self.ws = ws
         self.user_id = user_id
         self.telegram_id = telegram_id
         self.username = username
+        self.high_water = high_water
+        # (текст или бинарный кадр, момент постановки в очередь); None — пусто
+        self._outbox: deque[tuple[str | bytes, float]] | None = None
+        self._pending_counts: tuple[str, float] | None = None
+        self._writer: asyncio.Task | None = None
+        self._on_dead: Callable[["Connection"], None] | None = None
+        self.closed = False
+        # Метрики
+        self.sent = 0
+        self.dropped_counts = 0
+        self.send_latency_ms = 0.0  # сглаженная (EWMA) задержка от постановки в очередь до отправки
+        self.send_latency_max_ms = 0.0
+        # Heartbeat: когда ушёл ping без ответа (None — ответ получен) и последние замеры RTT, мс
+        self.ping_sent_at: float | None = None
+        self.rtt_samples: array | None = None
+
+    @property
+    def rtt_ms(self) -> int | None:
+        """
+        Медиана последних замеров RTT (None — ещё не измерен). Замер — по часам сервера
+        от ping до pong; редкие задержки pong медиану не сдвигают.
+        """
+        samples = self.rtt_samples
+        return sorted(samples)[len(samples) // 2] if samples else None
+
+    @property
+    def depth(self) -> int:
+        return (len(self._outbox) if self._outbox else 0) + (self._pending_counts is not None)
+
+    def start(self, on_dead: Callable[["Connection"], None]) -> None:
+        """on_dead — вызвать, если отправка упала (писатель запускается при первом сообщении)."""
+        self._on_dead = on_dead
+
+    def stop(self) -> None:
+        self.closed = True
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    def enqueue(self, msg_type: str, text: str | bytes) -> bool:
+        """Поставить сообщение в очередь. False — очередь переполнена, клиента пора отключать."""
+        if self.closed:
+            return True
+        now = time.monotonic()
+        if msg_type == "queue_counts":
+            if self._pending_counts is not None:
+                self.dropped_counts += 1
+            self._pending_counts = (text, now)
+        else:
+            if self._outbox is None:
+                self._outbox = deque()
+            elif len(self._outbox) >= self.high_water:
+                return False
+            self._outbox.append((text, now))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+        return True
+
+    async def _write_loop(self) -> None:
+        """Отправить всё, что накопилось, и завершиться (следующее сообщение запустит снова)."""
+        try:
+            while self._outbox or self._pending_counts is not None:
+                if self._outbox:
+                    text, queued_at = self._outbox.popleft()
+                else:
+                    text, queued_at = self._pending_counts
+                    self._pending_counts = None
+                if isinstance(text, bytes):
+                    await self.ws.send_bytes(text)
+                else:
+                    await self.ws.send_text(text)
+                self._observe(time.monotonic() - queued_at)
+            # Между проверкой и выходом нет await: новое сообщение увидит завершённую задачу
+            self._outbox = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("WS: send to %s failed: %s", self.user_id, e)
+            if self._on_dead:
+                self._on_dead(self)
+
+    def _observe(self, latency_s: float) -> None:
+        ms = latency_s * 1000
+        self.sent += 1
+        self.send_latency_ms += (ms - self.send_latency_ms) * 0.1
+        if ms > self.send_latency_max_ms:
+            self.send_latency_max_ms = ms
+
+    def stats(self) -> dict[str, Any]:
+        """Без user_id: сводка отдаётся в /stats без авторизации."""
+        return {
+            "depth": self.depth,
+            "sent": self.sent,
+            "dropped_counts": self.dropped_counts,
+            "send_latency_ms": round(self.send_latency_ms, 2),
+            "send_latency_max_ms": round(self.send_latency_max_ms, 2),
+            "rtt_ms": self.rtt_ms,
+        }
+
+
+class ParkedSession:
+    """
+    Отключившийся пользователь в окне переподключения: сообщения для него копятся
+    и отправляются при возобновлении. queue_counts не копится (при входе шлётся свежий).
+    Переполнение — буфер выбрасывается, клиент докачает партию через subscribe_game.
+    """
+
+    __slots__ = ("telegram_id", "username", "max_messages", "messages", "overflowed", "moving")
+
+    def __init__(self, telegram_id: int, username: str, max_messages: int):
+        self.telegram_id = telegram_id
+        self.username = username
+        self.max_messages = max_messages
+        self.messages: list[tuple[str, str | bytes]] = []
+        self.overflowed = False
+        self.moving = False  # сессия продолжена на другом воркере, накопленное пересылается туда
+
+    def add(self, msg_type: str, text: str | bytes) -> None:
+        if msg_type == "queue_counts" or self.overflowed:
+            return
+        if len(self.messages) >= self.max_messages:
+            self.overflowed = True
+            self.messages.clear()
+            return
+        self.messages.append((msg_type, text))
+
+    @classmethod
+    def from_connection(cls, conn: Connection, max_messages: int) -> "ParkedSession":
+        """Забрать у подключения то, что оно не успело отправить."""
+        parked = cls(conn.telegram_id, conn.username, max_messages)
+        for text, _ in conn._outbox or ():
+            parked.add("", text)
+        return parked
 
 
 class WSManager:
-    def __init__(self):
+    def __init__(
+        self,
+        queue_counts_interval_s: float = 0.5,
+        outbox_high_water: int = 256,
+        resume_buffer_max: int = 256,
+        ping_interval_s: float = 0.0,
+    ):
+        # Реестр подключений: вход, выход и поиск — O(1), рассылка — по values()
         self._by_user: dict[str, Connection] = {}
-        self._all: list[Connection] = []
+        self.outbox_high_water = outbox_high_water
+        self.slow_disconnects = 0
+        # Отключившиеся в окне переподключения; on_parked — запустить отсчёт окна
+        self._parked: dict[str, ParkedSession] = {}
+        self.resume_buffer_max = resume_buffer_max
+        self.on_parked: Callable[[str], None] | None = None
+        self.resumed = 0
+        self.replayed = 0
+        # Доставка пользователям, подключённым к другим воркерам: (user_id, тип, текст) -> доставлено ли
+        self.remote: Callable[[str, str, str | bytes], Awaitable[bool]] | None = None
+        # Открыт ли сокет пользователя на другом воркере (отложенная здесь сессия продолжена там)
+        self.elsewhere: Callable[[str], Awaitable[bool]] | None = None
+        self.handed_over = 0
+        # Коалесценция queue_counts: не чаще раза в интервал и только при изменении
+        self.queue_counts_interval_s = queue_counts_interval_s
+        self._counts_dirty = False
+        self._counts_task: asyncio.Task | None = None
+        self._last_counts: dict[str, int] | None = None
+        self._last_counts_at = 0.0
+        self.queue_counts_requested = 0
+        self.queue_counts_broadcasts = 0
+        self.queue_counts_unchanged = 0
+        # Heartbeat: один цикл на все подключения (0 — выключен)
+        self.ping_interval_s = ping_interval_s
+        self._heartbeat_task: asyncio.Task | None = None
+        self.heartbeat_slices = max(1, round(ping_interval_s / HEARTBEAT_TICK_S))
+        self._ping_text = encode({"type": "ping"})
+        self.pings = 0
+        self.reaped = 0
+        self.rtt = Histogram(RTT_BUCKETS)
 
     async def connect(
         self,
@@ -32,51 +234,284 @@ class WSManager:
         user_id: str,
         telegram_id: int,
         username: str,
-    ) -> None:
+    ) -> ParkedSession | None:
+        """
+        Зарегистрировать подключение. Возвращает сессию, которую оно продолжает: отложенную
+        после отключения или прежнее ещё открытое подключение с неотправленными сообщениями.
+        Отправить их — replay() (после того как клиенту сообщено о возобновлении).
+        """
+        parked = self._parked.pop(user_id, None)
         if user_id in self._by_user:
             old = self._by_user[user_id]
-            self._all.remove(old)
+            old.stop()
+            parked = ParkedSession.from_connection(old, self.resume_buffer_max)
             try:
                 await old.ws.close(code=4000)
             except Exception:
                 pass
-        conn = Connection(ws, user_id, telegram_id, username)
+        conn = Connection(ws, user_id, telegram_id, username, self.outbox_high_water)
         self._by_user[user_id] = conn
-        self._all.append(conn)
-        logger.info("WS: connect user_id=%s (total=%d)", user_id, len(self._all))
+        conn.start(self._on_dead)
+        if parked is not None:
+            self.resumed += 1
+        logger.info("WS: connect user_id=%s (total=%d resumed=%s)", user_id, len(self._by_user), parked is not None)
+        return parked
 
-    def disconnect(self, user_id: str) -> None:
-        if user_id in self._by_user:
-            conn = self._by_user.pop(user_id)
-            if conn in self._all:
-                self._all.remove(conn)
-            logger.info("WS: disconnect user_id=%s (remaining=%d)", user_id, len(self._all))
+    def replay(self, user_id: str, parked: ParkedSession) -> int:
+        """Поставить накопленные сообщения в очередь нового подключения. Возвращает их число."""
+        conn = self._by_user.get(user_id)
+        if conn is None:
+            return 0
+        for msg_type, text in parked.messages:
+            if not self._enqueue(conn, msg_type, text):
+                break
+        self.replayed += len(parked.messages)
+        return len(parked.messages)
 
-    async def send_to_user(self, user_id: str, payload: dict[str, Any]) -> bool:
+    def disconnect(self, user_id: str, ws: WebSocket | None = None) -> bool:
+        """
+        Убрать подключение пользователя. Если передан ws — только если это всё ещё
+        его текущее подключение (а не уже заменённое новым). True если убрали.
+        """
         conn = self._by_user.get(user_id)
-        if not conn:
+        if conn is None or (ws is not None and conn.ws is not ws):
             return False
-        try:
-            await conn.ws.send_json(payload)
-            return True
-        except Exception as e:
-            logger.warning("send_to_user %s: %s", user_id, e)
+        del self._by_user[user_id]
+        conn.stop()
+        logger.info("WS: disconnect user_id=%s (remaining=%d)", user_id, len(self._by_user))
+        return True
+
+    def park(self, user_id: str, ws: WebSocket | None = None, overflowed: bool = False) -> bool:
+        """
+        Отключить, но оставить сессию в окне переподключения: сообщения для пользователя
+        копятся до возобновления или до drop_parked. Условие по ws — как в disconnect.
+        """
+        conn = self._by_user.get(user_id)
+        if conn is None or (ws is not None and conn.ws is not ws):
             return False
+        self.disconnect(user_id, conn.ws)
+        parked = ParkedSession.from_connection(conn, self.resume_buffer_max)
+        if overflowed:
+            parked.overflowed = True
+            parked.messages.clear()
+        self._parked[user_id] = parked
+        if self.on_parked:
+            self.on_parked(user_id)
+        return True
+
+    def drop_parked(self, user_id: str) -> bool:
+        """Окно переподключения истекло. True — сессия была отложена (и теперь удалена)."""
+        return self._parked.pop(user_id, None) is not None
+
+    async def hand_over(self, user_id: str) -> int:
+        """
+        Пользователь продолжил сессию на другом воркере: переслать туда накопленное (по порядку,
+        включая пришедшее во время пересылки) и забыть отложенную сессию. Возвращает число сообщений.
+        """
+        parked = self._parked.get(user_id)
+        if parked is None or parked.moving or self.remote is None:
+            return 0
+        parked.moving = True
+        sent = 0
+        while parked.messages:
+            batch, parked.messages = parked.messages, []
+            for msg_type, text in batch:
+                await self.remote(user_id, msg_type, text)
+            sent += len(batch)
+        if self._parked.get(user_id) is parked:
+            del self._parked[user_id]
+        self.handed_over += 1
+        return sent
+
+    def _on_dead(self, conn: Connection) -> None:
+        self.park(conn.user_id, conn.ws)
+
+    def _enqueue(self, conn: Connection, msg_type: str, text: str | bytes) -> bool:
+        if conn.enqueue(msg_type, text):
+            return True
+        # Клиент не успевает читать даже сообщения, которые нельзя выбросить
+        logger.warning("WS: outbox overflow user_id=%s depth=%d, disconnecting", conn.user_id, conn.depth)
+        self.slow_disconnects += 1
+        self.park(conn.user_id, conn.ws, overflowed=True)
+        asyncio.ensure_future(_close_quietly(conn.ws, 4008))
+        return False
+
+    async def send_to_user(self, user_id: str, payload: dict[str, Any]) -> bool:
+        """Поставить сообщение в очередь пользователя (не ждёт отправки)."""
+        return await self.send_encoded(user_id, payload.get("type", ""), encode(payload))
+
+    async def send_encoded(self, user_id: str, msg_type: str, text: str | bytes) -> bool:
+        """
+        То же для уже сериализованного payload (один encode на всех получателей).
+        bytes уходят бинарным кадром WebSocket.
+        """
+        conn = self._by_user.get(user_id)
+        if conn:
+            return self._enqueue(conn, msg_type, text)
+        parked = self._parked.get(user_id)
+        if parked is not None:
+            parked.add(msg_type, text)
+            # Вернулся на другом воркере, а весть об этом (session_moved) сюда не дошла
+            if not parked.moving and self.elsewhere is not None and await self.elsewhere(user_id):
+                await self.hand_over(user_id)
+            return True
+        if self.remote:
+            return await self.remote(user_id, msg_type, text)
+        return False
 
     async def broadcast_queue_counts(self) -> None:
-        counts = get_queue_counts()
-        msg = {"type": "queue_counts", "counts": counts}
-        await self._broadcast(msg)
+        """
+        Запросить рассылку счётчиков очередей. Не ждёт отправки: изменения за интервал
+        схлопываются в одну рассылку, одинаковые счётчики повторно не шлются.
+        """
+        self.queue_counts_requested += 1
+        self._counts_dirty = True
+        if self._counts_task is None or self._counts_task.done():
+            self._counts_task = asyncio.create_task(self._flush_queue_counts())
+
+    async def _flush_queue_counts(self) -> None:
+        while self._counts_dirty:
+            delay = self._last_counts_at + self.queue_counts_interval_s - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._counts_dirty = False
+            counts = get_queue_counts()
+            self._last_counts_at = time.monotonic()
+            if counts == self._last_counts:
+                self.queue_counts_unchanged += 1
+                continue
+            self._last_counts = counts
+            self.queue_counts_broadcasts += 1
+            await self._broadcast({"type": "queue_counts", "counts": counts})
 
     async def _broadcast(self, payload: dict[str, Any]) -> None:
-        dead = []
-        for conn in self._all:
-            try:
-                await conn.ws.send_json(payload)
-            except Exception:
-                dead.append(conn)
-        for conn in dead:
-            self.disconnect(conn.user_id)
+        """Сериализовать один раз и разложить по очередям подключений; пишут их задачи-писатели."""
+        started = time.perf_counter()
+        text = encode(payload)
+        msg_type = payload.get("type", "")
+        for conn in list(self._by_user.values()):
+            self._enqueue(conn, msg_type, text)
+        QUEUE_COUNTS_BROADCAST_S.observe(time.perf_counter() - started)
+
+    def start_heartbeat(self) -> None:
+        """Запустить общий цикл ping (вызывать из lifespan)."""
+        if self.ping_interval_s > 0 and self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    def stop_heartbeat(self) -> None:
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        self._heartbeat_task = None
+
+    async def _heartbeat_loop(self) -> None:
+        """
+        Раз в интервал — снимок реестра, по одной из heartbeat_slices частей за такт: каждое
+        подключение проверяется раз в интервал, без задачи и таймера на сокет.
+        """
+        slices = self.heartbeat_slices
+        step = self.ping_interval_s / slices
+        while True:
+            conns = list(self._by_user.values())
+            for i in range(slices):
+                started = time.monotonic()
+                try:
+                    self._heartbeat(conns[len(conns) * i // slices:len(conns) * (i + 1) // slices])
+                except Exception:
+                    logger.exception("WS: heartbeat failed")
+                await asyncio.sleep(max(0.0, step - (time.monotonic() - started)))
+
+    def _heartbeat(self, conns: list[Connection]) -> None:
+        now = time.monotonic()
+        for conn in conns:
+            if self._by_user.get(conn.user_id) is not conn:
+                continue  # уже отключён или заменён новым подключением
+            if conn.ping_sent_at is not None:
+                if now - conn.ping_sent_at < self.ping_interval_s:
+                    continue  # ping после входа: ответ ещё может прийти
+                # Прошлый ping без ответа целый интервал: сокет мёртв, хотя отправка ещё не падала
+                logger.info("WS: no pong from user_id=%s for %.1f s, disconnecting", conn.user_id, now - conn.ping_sent_at)
+                self.reaped += 1
+                self.park(conn.user_id, conn.ws)
+                asyncio.ensure_future(_close_quietly(conn.ws, CLOSE_HEARTBEAT))
+                continue
+            self._ping(conn, now)
+
+    def _ping(self, conn: Connection, now: float) -> None:
+        conn.ping_sent_at = now
+        self.pings += 1
+        self._enqueue(conn, "ping", self._ping_text)
+
+    def ping(self, user_id: str) -> None:
+        """Внеочередной ping (сразу после входа — чтобы RTT был известен к первому ходу)."""
+        conn = self._by_user.get(user_id)
+        if conn is not None and self.ping_interval_s > 0 and conn.ping_sent_at is None:
+            self._ping(conn, time.monotonic())
+
+    def pong(self, user_id: str, now: float) -> None:
+        """Ответ на ping: добавить замер RTT подключения (хранятся последние RTT_SAMPLES)."""
+        conn = self._by_user.get(user_id)
+        if conn is None or conn.ping_sent_at is None:
+            return
+        rtt_s = now - conn.ping_sent_at
+        conn.ping_sent_at = None
+        if conn.rtt_samples is None:
+            conn.rtt_samples = array("H")
+        elif len(conn.rtt_samples) >= RTT_SAMPLES:
+            del conn.rtt_samples[0]
+        conn.rtt_samples.append(min(int(rtt_s * 1000), 0xFFFF))
+        self.rtt.observe(rtt_s)
+
+    def lag_ms(self, user_id: str) -> int:
+        """Медианный RTT пользователя в мс (0 — не подключён здесь или ещё не измерен)."""
+        conn = self._by_user.get(user_id)
+        rtt_ms = conn.rtt_ms if conn is not None else None
+        return rtt_ms or 0
+
+    def stats(self, top: int = 10) -> dict[str, Any]:
+        """Сводка по исходящим очередям и top самых отстающих подключений."""
+        conns = list(self._by_user.values())
+        slowest = sorted(conns, key=lambda c: (c.depth, c.send_latency_ms), reverse=True)[:top]
+        return {
+            "connections": len(conns),
+            "outbox_depth_total": sum(c.depth for c in conns),
+            "outbox_depth_max": max((c.depth for c in conns), default=0),
+            "slow_disconnects": self.slow_disconnects,
+            "parked": len(self._parked),
+            "resumed": self.resumed,
+            "replayed": self.replayed,
+            "handed_over": self.handed_over,
+            "queue_counts_requested": self.queue_counts_requested,
+            "queue_counts_broadcasts": self.queue_counts_broadcasts,
+            "pings": self.pings,
+            "heartbeat_reaped": self.reaped,
+            "rtt_s": self.rtt.snapshot(),
+            "slowest": [c.stats() for c in slowest],
+        }
+
+
+async def _close_quietly(ws: WebSocket, code: int) -> None:
+    try:
+        await ws.close(code=code)
+    except Exception:
+        pass
 
 
-manager = WSManager()
+manager = WSManager(
+    queue_counts_interval_s=get_config().queue_counts_interval_ms / 1000,
+    outbox_high_water=get_config().ws_outbox_high_water,
+    resume_buffer_max=get_config().resume_buffer_max,
+    ping_interval_s=get_config().ws_ping_interval_s,
+)
+registry.gauge("phonechess_ws_parked_sessions", "Disconnected users inside the reconnect window", lambda: len(manager._parked))
+registry.counter_fn("phonechess_ws_resumed_total", "Connections that resumed a previous session", lambda: manager.resumed)
+registry.gauge("phonechess_ws_connections", "WebSocket connections on this worker", lambda: len(manager._by_user))
+registry.gauge(
+    "phonechess_ws_outbox_depth", "Messages waiting in outboxes of all connections",
+    lambda: sum(c.depth for c in manager._by_user.values()),
+)
+registry.counter_fn("phonechess_ws_slow_disconnects_total", "Clients dropped for outbox overflow", lambda: manager.slow_disconnects)
+registry.counter_fn("phonechess_ws_pings_total", "Heartbeat pings sent", lambda: manager.pings)
+registry.counter_fn(
+    "phonechess_ws_heartbeat_reaped_total", "Connections dropped for not answering a ping", lambda: manager.reaped
+)
+registry.add_histogram("phonechess_ws_rtt_seconds", "Heartbeat round-trip time per pong", manager.rtt)
@@ -0,0 +1,4 @@
+"""
+Микробенчмарки и нагрузочные сценарии бэкенда.
+Запуск из каталога backend: python -m bench.<имя>
+"""
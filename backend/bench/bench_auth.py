@@ -0,0 +1,79 @@
+"""
+Проверка initData при шторме переподключений (после деплоя все клиенты
+переподключаются, многие — по несколько раз с той же initData).
+Сравнение: прежняя проверка (HMAC секрета на каждый вызов) против
+предвычисленного секрета и кэша проверенных строк.
+Запуск: python -m bench.bench_auth [клиентов] [переподключений_на_клиента]
+"""
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import time
+from urllib.parse import parse_qsl, urlencode
+
+TOKEN = "123456:bench-token"
+os.environ["TELEGRAM_BOT_TOKEN"] = TOKEN
+
+from app import auth  # noqa: E402
+
+
+def _sign(fields: dict[str, str]) -> str:
+    secret = hmac.new(b"WebAppData", TOKEN.encode(), hashlib.sha256).digest()
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    return urlencode({**fields, "hash": hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()})
+
+
+def _init_data(uid: int) -> str:
+    user = {"id": uid, "first_name": "Bench", "last_name": "", "username": f"bench{uid}", "language_code": "ru"}
+    return _sign({
+        "query_id": f"AAH{uid:012d}",
+        "user": json.dumps(user, separators=(",", ":")),
+        "auth_date": str(int(time.time())),
+    })
+
+
+def _validate_old(init_data: str) -> dict | None:
+    """Прежняя проверка: секрет, разбор и сортировка на каждый вызов."""
+    parsed = dict(parse_qsl(init_data))
+    hash_from_tg = parsed.pop("hash", None)
+    check = "\n".join(f"{k}={v}" for k, v in sorted(parsed.items()))
+    secret = hmac.new(b"WebAppData", TOKEN.encode(), hashlib.sha256).digest()
+    calculated = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(calculated, hash_from_tg):
+        return None
+    return auth._parse_user_from_parsed(parsed)
+
+
+def _rate(fn, items: list[str]) -> float:
+    start = time.perf_counter()
+    for s in items:
+        if fn(s) is None:
+            raise SystemExit("validation failed")
+    return len(items) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    reconnects = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    unique = [_init_data(uid) for uid in range(clients)]
+    storm = unique * reconnects
+    random.Random(1).shuffle(storm)
+
+    old = _rate(_validate_old, storm)
+    auth.auth_cache = auth.AuthCache(max_size=0)  # только предвычисленный секрет, без кэша
+    precomputed = _rate(auth.validate_init_data, storm)
+    auth.auth_cache = auth.AuthCache(max_size=clients * 2)
+    cached = _rate(auth.validate_init_data, storm)
+
+    print(f"клиентов={clients} переподключений={reconnects} проверок={len(storm)}")
+    print(f"прежняя проверка:        {old:>10,.0f} /с")
+    print(f"предвычисленный секрет:  {precomputed:>10,.0f} /с (x{precomputed / old:.2f})")
+    print(f"+ кэш проверенных:       {cached:>10,.0f} /с (x{cached / old:.2f})")
+    print(f"кэш: {auth.auth_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
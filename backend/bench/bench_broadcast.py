@@ -0,0 +1,70 @@
+"""
+Рассылка queue_counts при 10k подключённых клиентов и постоянном входе/выходе из очередей.
+Сравнивает число сообщений без коалесценции (каждое событие — рассылка всем)
+с коалесцированной рассылкой WSManager.
+Запуск: python -m bench.bench_broadcast [клиентов] [событий_в_секунду] [секунд]
+"""
+import asyncio
+import logging
+import random
+import sys
+import time
+
+from app import pairing
+from app.cluster import cluster
+from app.ws_manager import WSManager
+
+
+class FakeWebSocket:
+    """Имитация WebSocket: отправка стоит одно переключение цикла событий."""
+
+    sent = 0
+
+    async def send_text(self, text: str) -> None:
+        FakeWebSocket.sent += 1
+        await asyncio.sleep(0)
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+async def main() -> None:
+    logging.disable(logging.INFO)
+    n_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    manager = WSManager(queue_counts_interval_s=0.5)
+    for i in range(n_clients):
+        await manager.connect(FakeWebSocket(), str(i), i, "")
+
+    rnd = random.Random(1)
+    keys = list(pairing.get_queue_counts())
+    events = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for _ in range(rate // 100):
+            user_id = str(rnd.randrange(n_clients))
+            if rnd.random() < 0.5:
+                pairing.join_queue(rnd.choice(keys), user_id, 0, "")
+            else:
+                pairing.leave_all_queues(user_id)
+            # Один воркер — он же лидер: счётчики берутся прямо из matchmaker
+            cluster.counts = pairing.waiting_counts()
+            await manager.broadcast_queue_counts()
+            events += 1
+        await asyncio.sleep(0.01)
+    await manager._counts_task
+    elapsed = time.perf_counter() - start
+
+    naive = events * n_clients
+    print(f"клиентов={n_clients} событий={events} за {elapsed:.1f} с")
+    print(f"без коалесценции: {naive:,} сообщений ({events:,} сериализаций)")
+    print(
+        f"с коалесценцией:  {FakeWebSocket.sent:,} сообщений "
+        f"({manager.queue_counts_broadcasts} рассылок, {manager.queue_counts_unchanged} пропущено без изменений)"
+    )
+    print(f"экономия: x{naive / max(FakeWebSocket.sent, 1):,.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
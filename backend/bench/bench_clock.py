@@ -0,0 +1,69 @@
+"""
+Нагрузочный тест планировщика часов: N одновременных партий в одном heap.
+Меряет перепланирование при ходе и опоздание падения флага относительно дедлайна.
+Запуск: python -m bench.bench_clock [партий]
+"""
+import asyncio
+import random
+import sys
+import time
+
+from app import pairing
+from app.clock import clocks
+from app.pairing import QueuedPlayer, _create_game, _schedule_clock
+from app.store import store
+
+
+async def main() -> None:
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rnd = random.Random(1)
+    games = []
+    for i in range(n_games):
+        g = _create_game("3+0", QueuedPlayer(f"w{i}", i, ""), QueuedPlayer(f"b{i}", i, ""))
+        store.add(g)
+        games.append(g)
+
+    clocks.start()
+    # Перепланирование: каждая партия «ходит» 10 раз
+    start = time.perf_counter()
+    for _ in range(10):
+        for g in games:
+            _schedule_clock(g)
+    resched = 10 * n_games / (time.perf_counter() - start)
+
+    # Дедлайны в ближайшие 0.5–10 с: у всех партий выходит время
+    deadlines = {}
+    now = time.monotonic()
+    for g in games:
+        g.last_clock_at = now
+        g.white_remaining_ms = rnd.randint(500, 10_000)
+        deadlines[g.id] = now + g.white_remaining_ms / 1000
+        _schedule_clock(g)
+
+    lateness: list[float] = []
+    done = asyncio.Event()
+
+    async def on_expire(game_id: str) -> None:
+        if pairing.flag_game(game_id):
+            lateness.append(time.monotonic() - deadlines[game_id])
+        if len(lateness) == n_games:
+            done.set()
+
+    clocks.on_expire = on_expire
+    await asyncio.wait_for(done.wait(), timeout=60)
+    clocks.stop()
+    lateness.sort()
+    flagged = sum(1 for g in games if g.result is not None)
+    print(f"партий={n_games} флагов={flagged} в heap осталось={len(clocks)}")
+    print(f"перепланирование: {resched:,.0f} /с")
+    print(
+        "опоздание флага: p50={:.2f} мс p99={:.2f} мс max={:.2f} мс".format(
+            lateness[len(lateness) // 2] * 1000,
+            lateness[int(len(lateness) * 0.99)] * 1000,
+            lateness[-1] * 1000,
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
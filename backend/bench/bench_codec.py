@@ -0,0 +1,57 @@
+"""
+Стоимость сериализации на одну рассылку: send_json на каждого получателя (stdlib json)
+против одного codec.encode на всех. Плюс разбор входящего make_move.
+Запуск: python -m bench.bench_codec [получателей_queue_counts]
+"""
+import json
+import sys
+import timeit
+
+from app import codec
+
+GAME_UPDATE = {
+    "type": "game_update",
+    "fen": "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+    "white_remaining_ms": 171234,
+    "black_remaining_ms": 168002,
+    "san": "Qxf7#",
+    "move_time_ms": 2310,
+    "result": "1-0",
+    "from": "h5",
+    "to": "f7",
+}
+QUEUE_COUNTS = {"type": "queue_counts", "counts": {"3+0": 12, "3+2": 4, "5+0": 9, "5+3": 1, "10+0": 3, "15+10": 0}}
+MAKE_MOVE = '{"type":"make_move","game_id":"5978b2a7-9588-41ac-900d-a46d1b619bdb","from":"e2","to":"e4","promotion":null}'
+
+
+def _send_json_each(payload: dict, recipients: int) -> None:
+    for _ in range(recipients):
+        json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def _encode_once(payload: dict, recipients: int) -> None:
+    text = codec.encode(payload)
+    for _ in range(recipients):
+        _ = text
+
+
+def _per_call_us(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    recipients = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print(f"JSON-бэкенд codec: {codec.BACKEND}")
+    before = _per_call_us(lambda: _send_json_each(GAME_UPDATE, 2), 20_000)
+    after = _per_call_us(lambda: _encode_once(GAME_UPDATE, 2), 20_000)
+    print(f"game_update x2 получателя: {before:8.2f} мкс -> {after:8.2f} мкс")
+    before = _per_call_us(lambda: _send_json_each(QUEUE_COUNTS, recipients), 5)
+    after = _per_call_us(lambda: _encode_once(QUEUE_COUNTS, recipients), 5)
+    print(f"queue_counts x{recipients} получателей: {before:8.0f} мкс -> {after:8.0f} мкс")
+    before = _per_call_us(lambda: json.loads(MAKE_MOVE), 50_000)
+    after = _per_call_us(lambda: codec.decode(MAKE_MOVE), 50_000)
+    print(f"разбор make_move: {before:8.2f} мкс -> {after:8.2f} мкс")
+
+
+if __name__ == "__main__":
+    main()
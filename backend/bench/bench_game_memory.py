@@ -0,0 +1,81 @@
+"""
+Память на одну партию из 80 ходов: прежнее представление (список MoveRecord с SAN
+и доска со стеком отмены python-chess) против move_codes + clock_deltas в Game.
+Плюс размер ответа subscribe_game: JSON game_state против бинарного кадра.
+Запуск: python -m bench.bench_game_memory [ходов]
+"""
+import random
+import sys
+from dataclasses import dataclass
+
+import chess
+from chess import Board
+
+from app.codec import encode
+from app.matchmaking import QueuedPlayer
+from app.movecodec import decode_moves_frame
+from app.pairing import _create_game, game_moves_frame, game_state_payload
+from app.store import ArchivedGame, deep_sizeof
+
+
+@dataclass
+class MoveRecord:
+    """Прежняя запись хода в Game.moves."""
+
+    san: str
+    time_ms: int
+
+
+def _random_line(plies: int, seed: int = 7) -> list[chess.Move]:
+    rnd = random.Random(seed)
+    while True:
+        board = Board()
+        line = []
+        while len(line) < plies and not board.is_game_over():
+            move = rnd.choice(list(board.legal_moves))
+            board.push(move)
+            line.append(move)
+        if len(line) == plies:
+            return line
+
+
+def main() -> None:
+    plies = int(sys.argv[1]) if len(sys.argv) > 1 else 80
+    line = _random_line(plies)
+    rnd = random.Random(1)
+    times = [rnd.randrange(200, 15000) for _ in line]
+
+    old_board = Board()
+    old_moves = []
+    for move, time_ms in zip(line, times):
+        old_moves.append(MoveRecord(san=old_board.san(move), time_ms=time_ms))
+        old_board.push(move)
+
+    white = QueuedPlayer(user_id="1", telegram_id=1, username="white")
+    black = QueuedPlayer(user_id="2", telegram_id=2, username="black")
+    g = _create_game("5+0", white, black)
+    for move, time_ms in zip(line, times):
+        g.push(move, time_ms)
+    # Для корректного сравнения: Game без доски и без истории
+    base = deep_sizeof(_create_game("5+0", white, black)) - deep_sizeof(Board())
+
+    old_history = deep_sizeof(old_moves)
+    old_board_bytes = deep_sizeof(old_board)
+    new_history = deep_sizeof(g.move_codes) + deep_sizeof(g.clock_deltas)
+    new_board_bytes = deep_sizeof(g.board)
+    print(f"ходов={plies}")
+    print(f"история ходов:   было {old_history:>7,} Б (list[MoveRecord])  стало {new_history:>5,} Б (array + varint)")
+    print(f"доска:           было {old_board_bytes:>7,} Б (со стеком отмены)   стало {new_board_bytes:>5,} Б")
+    old_total = old_history + old_board_bytes + base
+    new_total = deep_sizeof(g)
+    print(f"партия целиком:  было {old_total:>7,} Б  стало {new_total:>7,} Б  (x{old_total / new_total:.1f})")
+    print(f"в архиве:        {deep_sizeof(ArchivedGame(g, 0.0)):,} Б")
+
+    json_state = encode(game_state_payload(g))
+    frame = game_moves_frame(g)
+    assert decode_moves_frame(frame)["moves"] == line
+    print(f"subscribe_game:  JSON {len(json_state.encode()):,} Б  бинарный кадр {len(frame):,} Б")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Heartbeat на 100k подключений: общий цикл WSManager против задачи-пингера на каждый сокет.
+- Время одного круга ping'ов (поставить в очередь и отправить) и обработки pong'ов.
+- Память и время на создание задач, если бы у каждого сокета был свой цикл ping.
+Запуск: python -m bench.bench_heartbeat [подключений]
+"""
+import asyncio
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+
+from app.ws_manager import WSManager
+
+
+class FakeWebSocket:
+    __slots__ = ("sent",)
+
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def send_text(self, text: str) -> None:
+        self.sent += 1
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+async def _per_socket_pinger(manager: WSManager, user_id: str, interval_s: float) -> None:
+    """Как было бы с задачей на сокет: свой sleep и свой ping."""
+    while True:
+        await asyncio.sleep(interval_s)
+        manager.ping(user_id)
+
+
+async def main() -> None:
+    logging.disable(logging.INFO)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    manager = WSManager(ping_interval_s=15)
+    sockets = [FakeWebSocket() for _ in range(n)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws, str(i), i, "")
+    conns = list(manager._by_user.values())
+    slices = manager.heartbeat_slices
+    print(f"подключений: {n}, интервал {manager.ping_interval_s:.0f} с, частей (тактов) за интервал: {slices}")
+
+    started = time.perf_counter()
+    for i in range(slices):
+        manager._heartbeat(conns[n * i // slices:n * (i + 1) // slices])
+    queued = time.perf_counter() - started
+    while sum(ws.sent for ws in sockets) < n:
+        await asyncio.sleep(0)
+    sent = time.perf_counter() - started
+    print(f"круг ping:   поставить {queued * 1e3:6.0f} мс, с отправкой {sent * 1e3:6.0f} мс"
+          f"  ({sent / n * 1e6:.1f} мкс на подключение, такт ~{sent / slices * 1e3:.1f} мс)")
+
+    started = time.perf_counter()
+    now = time.monotonic()
+    for i in range(n):
+        manager.pong(str(i), now)
+    elapsed = time.perf_counter() - started
+    print(f"pong:        {n / elapsed:9.0f} в секунду ({elapsed / n * 1e6:.2f} мкс)")
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(_per_socket_pinger(manager, str(i), 15)) for i in range(n)]
+    await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    per_task = (tracemalloc.get_traced_memory()[0] - before) / n
+    tracemalloc.stop()
+    print(f"задача на сокет: {per_task:5.0f} Б на подключение ({per_task * n / 2**20:.0f} МБ), "
+          f"запуск {elapsed * 1e3:.0f} мс и {n} таймеров в цикле событий; общий цикл — одна задача")
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
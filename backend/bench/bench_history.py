@@ -0,0 +1,146 @@
+"""
+История партий и экспорт PGN на большой базе: у одного пользователя N завершённых партий.
+- Страницы по курсору против OFFSET: время первой и последних страниц.
+- Потоковый экспорт PGN всех партий: партий в секунду и RSS процесса по ходу экспорта
+  (должен оставаться ровным — в памяти одна страница партий, а не весь файл).
+Запуск: python -m bench.bench_history [партий] [полуходов_в_партии]
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import chess
+
+# Конфиг читается при импорте app: хранилище подставляем сами
+os.environ.setdefault("DATABASE_URL", "")
+
+from app.history import export_pgn  # noqa: E402
+from app.persistence import SqliteRepository, WriteBatch, persistence  # noqa: E402
+
+USER = "1"
+PAGE = 50
+LINES = 100
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _random_lines(plies: int, seed: int = 1) -> list[list[str]]:
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(LINES):
+        board = chess.Board()
+        line = []
+        while len(line) < plies and not board.is_game_over():
+            move = rnd.choice(list(board.legal_moves))
+            board.push(move)
+            line.append(move.uci())
+        lines.append(line)
+    return lines
+
+
+async def _fill(repo: SqliteRepository, n_games: int, plies: int) -> None:
+    lines = _random_lines(plies)
+    rnd = random.Random(2)
+    started_at = time.time() - n_games * 600
+    batch = WriteBatch()
+    for i in range(n_games):
+        game_id = f"game-{i:07d}"
+        opponent = str(1000 + rnd.randrange(5000))
+        white, black = (USER, opponent) if i % 2 == 0 else (opponent, USER)
+        created = started_at + i * 600
+        batch.games.append((game_id, "3+0", white, black, "u" + white, "u" + black, 180_000, 180_000, "", created))
+        white_ms = black_ms = 180_000
+        for ply, uci in enumerate(lines[i % LINES], 1):
+            if ply % 2:
+                white_ms -= 1000
+            else:
+                black_ms -= 1000
+            batch.moves.append((game_id, ply, uci, 1000, white_ms, black_ms))
+        batch.results.append((rnd.choice(("1-0", "0-1", "1/2-1/2")), white_ms, black_ms, created + 300, game_id))
+        if len(batch.games) == 2000:
+            await repo.write(batch)
+            batch = WriteBatch()
+    await repo.write(batch)
+
+
+async def _pages(repo: SqliteRepository) -> list[float]:
+    """Пройти всю историю по курсору; время каждой страницы в мс."""
+    times = []
+    before = None
+    while True:
+        started = time.perf_counter()
+        games = await repo.history(USER, before, PAGE)
+        times.append((time.perf_counter() - started) * 1000)
+        if len(games) < PAGE:
+            return times
+        before = (games[-1].finished_at, games[-1].id)
+
+
+def _offset_page_ms(path: str, offset: int) -> float:
+    db = sqlite3.connect(path)
+    started = time.perf_counter()
+    db.execute(
+        "SELECT id FROM games WHERE (white_id = ?1 OR black_id = ?1) AND result IS NOT NULL"
+        " ORDER BY finished_at DESC, id DESC LIMIT ?2 OFFSET ?3",
+        (USER, PAGE, offset),
+    ).fetchall()
+    ms = (time.perf_counter() - started) * 1000
+    db.close()
+    return ms
+
+
+async def main() -> None:
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    plies = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.db")
+        repo = SqliteRepository(path)
+        await repo.open()
+        started = time.perf_counter()
+        await _fill(repo, n_games, plies)
+        print(f"партий: {n_games}  полуходов: {plies}  заполнение {time.perf_counter() - started:.1f} с")
+
+        times = await _pages(repo)
+        head, tail = times[:10], times[-10:]
+        print(
+            f"курсор: страниц {len(times)} по {PAGE}  первые 10: {sum(head) / len(head):.2f} мс/стр  "
+            f"последние 10: {sum(tail) / len(tail):.2f} мс/стр"
+        )
+        print(
+            f"OFFSET: первая {_offset_page_ms(path, 0):.2f} мс  "
+            f"последняя {_offset_page_ms(path, max(0, n_games - PAGE)):.2f} мс"
+        )
+
+        persistence.repo = repo
+        rss = [_rss_mb()]
+        exported = size = 0
+        started = time.perf_counter()
+        async for pgn in export_pgn(USER):
+            exported += 1
+            size += len(pgn)
+            if exported % 5000 == 0:
+                rss.append(_rss_mb())
+        elapsed = time.perf_counter() - started
+        rss.append(_rss_mb())
+        print(
+            f"экспорт PGN: {exported} партий, {size / 1e6:.0f} МБ за {elapsed:.1f} с ({exported / elapsed:.0f} партий/с)"
+        )
+        print(f"RSS по ходу экспорта: {rss[0]:.0f} -> max {max(rss):.0f} -> {rss[-1]:.0f} МБ")
+        await repo.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""
+Матчмейкинг под нагрузкой в смоделированном времени: поток игроков с рейтингами
+N(1500, 300), тик каждые 200 мс. Печатает гистограммы качества пар и ожидания,
+а также стоимость тика.
+Запуск: python -m bench.bench_matchmaking [игроков_в_секунду] [секунд]
+"""
+import random
+import sys
+import time
+
+from app.constants import TIME_CONTROL_KEYS
+from app.matchmaking import Matchmaker, QueuedPlayer
+
+TICK_S = 0.2
+
+
+def _print_histogram(title: str, snapshot: dict) -> None:
+    print(f"{title}: n={snapshot['count']}")
+    for label, count in snapshot["buckets"].items():
+        print(f"  <= {label:>6}: {count}")
+
+
+def main() -> None:
+    rate = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    rnd = random.Random(1)
+    ratings: dict[str, int] = {}
+    mm = Matchmaker(
+        TIME_CONTROL_KEYS,
+        window_base=50,
+        window_per_s=25,
+        window_max=1000,
+        rating_of=lambda user_id, key: ratings[user_id],
+    )
+    now = 0.0
+    user = 0
+    tick_cost = 0.0
+    ticks = 0
+    max_waiting = 0
+    while now < seconds:
+        for _ in range(int(rate * TICK_S)):
+            user_id = str(user)
+            user += 1
+            ratings[user_id] = int(rnd.gauss(1500, 300))
+            mm.join(rnd.choice(TIME_CONTROL_KEYS), QueuedPlayer(user_id, user, "", joined_at=now))
+        max_waiting = max(max_waiting, sum(mm.counts().values()))
+        start = time.perf_counter()
+        mm.tick(now)
+        tick_cost += time.perf_counter() - start
+        ticks += 1
+        now += TICK_S
+    print(f"игроков={user} пар={mm.pairs} ждут={sum(mm.counts().values())} максимум в очередях={max_waiting}")
+    print(f"тик: в среднем {tick_cost / ticks * 1000:.2f} мс")
+    _print_histogram("разница рейтингов в паре", mm.rating_diff.snapshot())
+    _print_histogram("ожидание, с", mm.wait_s.snapshot())
+
+
+if __name__ == "__main__":
+    main()
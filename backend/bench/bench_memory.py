@@ -0,0 +1,90 @@
+"""
+Память сервера на 100k пользователей (tracemalloc, только объекты приложения):
+- подключённый пользователь: Connection в WSManager, лимитер сообщений, присутствие в backend;
+- игрок в очереди матчмейкинга;
+- живая партия: Game с доской после нескольких ходов, часы, индексы store/игроков/топа.
+Сокеты и протокол uvicorn не считаются (вместо WebSocket — пустая заглушка).
+Запуск: python -m bench.bench_memory [пользователей] [полуходов_в_партии]
+"""
+import asyncio
+import gc
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import chess
+
+# Конфиг читается при импорте app: без хранилища (очередь записи не копит строки)
+os.environ.setdefault("DATABASE_URL", "")
+
+from app.cluster import cluster  # noqa: E402
+from app.constants import TIME_CONTROL_KEYS  # noqa: E402
+from app.matchmaking import QueuedPlayer, matchmaker  # noqa: E402
+from app.pairing import start_game  # noqa: E402
+from app.ratelimit import guard  # noqa: E402
+from app.ws_manager import manager  # noqa: E402
+
+
+class _FakeWS:
+    __slots__ = ()
+
+
+def _traced() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def main() -> None:
+    logging.disable(logging.INFO)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    plies = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    user_ids = [str(10_000_000 + i) for i in range(n)]
+    sockets = [_FakeWS() for _ in range(n)]
+    limiters = [None] * n
+    rnd = random.Random(1)
+    lines = []
+    for _ in range(100):
+        board = chess.Board()
+        line = []
+        while len(line) < plies and not board.is_game_over():
+            line.append(rnd.choice(list(board.legal_moves)))
+            board.push(line[-1])
+        lines.append(line)
+    tracemalloc.start()
+
+    before = _traced()
+    started = time.perf_counter()
+    for i, user_id in enumerate(user_ids):
+        await manager.connect(sockets[i], user_id, int(user_id), f"user{i}")
+        limiters[i] = guard.limiter(time.monotonic())
+        await cluster.backend.set_presence(user_id, cluster.worker_id)
+    connected = _traced()
+    print(f"подключено {n}: {(connected - before) / n:7.0f} Б на пользователя  ({time.perf_counter() - started:.1f} с)")
+
+    before = _traced()
+    for i, user_id in enumerate(user_ids):
+        matchmaker.join(TIME_CONTROL_KEYS[i % len(TIME_CONTROL_KEYS)], QueuedPlayer(user_id, int(user_id), f"user{i}"))
+    queued = _traced()
+    print(f"в очереди {n}:  {(queued - before) / n:7.0f} Б на игрока")
+    matchmaker.clear()
+
+    before = _traced()
+    games = []
+    for i in range(0, n, 2):
+        white = QueuedPlayer(user_ids[i], int(user_ids[i]), f"user{i}")
+        black = QueuedPlayer(user_ids[i + 1], int(user_ids[i + 1]), f"user{i + 1}")
+        g = start_game(TIME_CONTROL_KEYS[i // 2 % len(TIME_CONTROL_KEYS)], white, black)
+        for move in lines[i // 2 % len(lines)]:
+            g.push(move, 1000)
+        games.append(g)
+    live = _traced()
+    print(f"партий {len(games)}:   {(live - before) / len(games):7.0f} Б на партию ({plies} полуходов)")
+    print(f"всего: {live / 2**20:.0f} МБ отслежено tracemalloc")
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Ходов в секунду: живая доска Game против старого пути Board(fen) на каждом ходу.
+Запуск: python -m bench.bench_moves [партий] [ходов_в_партии]
+"""
+import random
+import sys
+import time
+
+import chess
+from chess import Board
+
+from app.pairing import QueuedPlayer, _create_game, apply_move
+from app.store import store
+
+
+def _random_games(n_games: int, plies: int, seed: int = 1) -> list[list[chess.Move]]:
+    rnd = random.Random(seed)
+    games = []
+    for _ in range(n_games):
+        board = Board()
+        line = []
+        while len(line) < plies and not board.is_game_over():
+            move = rnd.choice(list(board.legal_moves))
+            board.push(move)
+            line.append(move)
+        games.append(line)
+    return games
+
+
+def _fen_round_trip(fen: str, move: chess.Move) -> str:
+    """Старый путь apply_move: разбор FEN, ход, сериализация, проверки конца партии."""
+    board = Board(fen)
+    if move not in board.legal_moves:
+        raise ValueError(move)
+    board.san(move)
+    board.push(move)
+    fen = board.fen()
+    if board.is_checkmate():
+        pass
+    elif board.is_stalemate() or board.is_insufficient_material() or board.can_claim_fifty_moves() or board.can_claim_threefold_repetition():
+        pass
+    return fen
+
+
+def bench_fen(lines: list[list[chess.Move]]) -> float:
+    total = 0
+    start = time.perf_counter()
+    for line in lines:
+        fen = chess.STARTING_FEN
+        for move in line:
+            fen = _fen_round_trip(fen, move)
+            total += 1
+    return total / (time.perf_counter() - start)
+
+
+def bench_live(lines: list[list[chess.Move]]) -> float:
+    white = QueuedPlayer(user_id="w", telegram_id=1, username="w")
+    black = QueuedPlayer(user_id="b", telegram_id=2, username="b")
+    total = 0
+    start = time.perf_counter()
+    for line in lines:
+        g = _create_game("15+10", white, black)
+        store.add(g)
+        for i, move in enumerate(line):
+            uci = move.uci()
+            user = "w" if i % 2 == 0 else "b"
+            if apply_move(g.id, user, uci[:2], uci[2:4], uci[4:] or None) is None:
+                break
+            total += 1
+        store.remove(g.id)
+    return total / (time.perf_counter() - start)
+
+
+def main() -> None:
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    plies = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+    lines = _random_games(n_games, plies)
+    fen_rate = bench_fen(lines)
+    live_rate = bench_live(lines)
+    print(f"партий={n_games} ходов_в_партии<={plies}")
+    print(f"Board(fen) на каждый ход: {fen_rate:10.0f} ходов/с")
+    print(f"живая доска Game:         {live_rate:10.0f} ходов/с  (x{live_rate / fen_rate:.2f})")
+
+
+if __name__ == "__main__":
+    main()
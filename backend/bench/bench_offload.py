@@ -0,0 +1,123 @@
+"""
+Задержка цикла событий при 10k одновременных партий: проверка ходов в цикле (inline)
+против пула потоков, пула процессов и режима auto.
+Каждая партия — задача, которая ходит по заранее сгенерированной линии через
+apply_move_async с паузой «на подумать»; отдельная задача раз в 10 мс меряет,
+насколько позже обещанного просыпается цикл. Дебют (до position_cache.max_ply) разыгрывается
+заранее: ранние ходы идут через кэш позиций в цикле событий и в пул не попадают никогда.
+Запуск: python -m bench.bench_offload [партий] [секунд] [средняя_пауза_с]
+"""
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+import chess
+
+from app import pairing
+from app.offload import MoveOffload
+from app.pairing import QueuedPlayer, _create_game, _index_players, apply_move_async
+from app.positions import position_cache
+from app.store import store
+
+LINES = 500
+PLIES = 60
+
+
+def _random_lines(seed: int = 1) -> list[list[str]]:
+    rnd = random.Random(seed)
+    lines = []
+    while len(lines) < LINES:
+        board = chess.Board()
+        line = []
+        while len(line) < PLIES and not board.is_game_over():
+            move = rnd.choice(list(board.legal_moves))
+            board.push(move)
+            line.append(move.uci())
+        # Линия должна пережить дебют, который разыгрывается заранее
+        if len(line) > position_cache.max_ply + 1:
+            lines.append(line)
+    return lines
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def _probe(stop: float, samples: list[float], interval_s: float = 0.01) -> None:
+    while time.perf_counter() < stop:
+        started = time.perf_counter()
+        await asyncio.sleep(interval_s)
+        samples.append((time.perf_counter() - started - interval_s) * 1000)
+
+
+async def _play(g, line: list[str], rnd: random.Random, think_s: float, stop: float, latencies: list[float]) -> None:
+    await asyncio.sleep(rnd.uniform(0, think_s))
+    for i, uci in enumerate(line[g.ply:], g.ply):
+        if time.perf_counter() >= stop:
+            return
+        user_id = g.white_id if i % 2 == 0 else g.black_id
+        started = time.perf_counter()
+        update = await apply_move_async(g.id, user_id, uci[:2], uci[2:4], uci[4:] or None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if update is None or update["result"] is not None:
+            return
+        await asyncio.sleep(rnd.uniform(0.5, 1.5) * think_s)
+
+
+async def _run(mode: str, n_games: int, seconds: float, think_s: float, lines: list[list[str]]) -> None:
+    offload = MoveOffload(mode=mode, workers=min(4, os.cpu_count() or 1))
+    pairing.move_offload = offload
+    offload.start()
+    if mode == "process":
+        # Поднять процессы пула заранее, чтобы не мерить их запуск
+        await asyncio.gather(*(offload.run(pairing.analyze_move, chess.Board(), chess.Move.from_uci("e2e4"))
+                               for _ in range(offload.workers)))
+    games = []
+    opening = position_cache.max_ply + 1
+    for i in range(n_games):
+        g = _create_game("15+10", QueuedPlayer(f"w{i}", i, ""), QueuedPlayer(f"b{i}", i, ""))
+        for uci in lines[i % len(lines)][:opening]:
+            g.push(chess.Move.from_uci(uci), 0)
+        g._init_clocks()
+        store.add(g)
+        _index_players(g)
+        games.append(g)
+    rnd = random.Random(2)
+    lag: list[float] = []
+    latencies: list[float] = []
+    stop = time.perf_counter() + seconds
+    await asyncio.gather(
+        _probe(stop, lag),
+        *(_play(g, lines[i % len(lines)], rnd, think_s, stop, latencies) for i, g in enumerate(games)),
+    )
+    stats = offload.stats()
+    offload.stop()
+    for g in games:
+        store.remove(g.id)
+    print(
+        f"{mode:<8} ходов/с={len(latencies) / seconds:7.0f}  "
+        f"лаг цикла p50={_percentile(lag, 0.5):6.2f} p99={_percentile(lag, 0.99):7.2f} max={max(lag, default=0):7.2f} мс  "
+        f"ход p50={_percentile(latencies, 0.5):6.2f} p99={_percentile(latencies, 0.99):7.2f} мс  "
+        f"в пуле={stats['offloaded']} на месте={stats['inline']}"
+    )
+
+
+async def main() -> None:
+    logging.disable(logging.INFO)
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    think_s = float(sys.argv[3]) if len(sys.argv) > 3 else 4
+    lines = _random_lines()
+    print(f"партий={n_games} пауза≈{think_s} с (≈{n_games / think_s:.0f} ходов/с)  ядер={os.cpu_count()}")
+    for mode in ("inline", "thread", "auto", "process"):
+        await _run(mode, n_games, seconds, think_s, lines)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
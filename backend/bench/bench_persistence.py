@@ -0,0 +1,72 @@
+"""
+Запись ходов в SQLite: отдельная транзакция на каждый ход против пачек WriteBehind.
+Запуск: python -m bench.bench_persistence [партий] [ходов_в_партии]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from app.persistence import SqliteRepository, WriteBatch, WriteBehind
+
+
+class _Game:
+    def __init__(self, i: int):
+        self.id = f"game-{i}"
+        self.time_control_key = "3+0"
+        self.white_id, self.black_id = str(2 * i), str(2 * i + 1)
+        self.white_username = self.black_username = ""
+        self.white_remaining_ms = self.black_remaining_ms = 180_000
+        self.ply = 0
+        self.result = None
+
+
+async def _per_move(repo: SqliteRepository, games: list[_Game], plies: int) -> float:
+    start = time.perf_counter()
+    for g in games:
+        await repo.write(WriteBatch(games=[(g.id, "3+0", g.white_id, g.black_id, "", "", 0, 0, "", 0.0)]))
+    for ply in range(1, plies + 1):
+        for g in games:
+            await repo.write(WriteBatch(moves=[(g.id, ply, "e2e4", 1000, 0, 0)]))
+    return time.perf_counter() - start
+
+
+async def _write_behind(repo: SqliteRepository, games: list[_Game], plies: int) -> tuple[float, WriteBehind]:
+    wb = WriteBehind(repo, flush_interval_s=0.2, max_batch=500)
+    wb.start()
+    start = time.perf_counter()
+    for g in games:
+        wb.record_game(g, "")
+    for _ in range(plies):
+        for g in games:
+            g.ply += 1
+            wb.record_move(g, "e2e4", 1000)
+        await asyncio.sleep(0)  # игровой цикл отдаёт управление между ходами
+    enqueue_s = time.perf_counter() - start
+    await wb.close()
+    print(f"  постановка в очередь: {enqueue_s * 1e6 / (len(games) * plies):.2f} мкс/ход")
+    return time.perf_counter() - start, wb
+
+
+async def main() -> None:
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    plies = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    rows = n_games * (plies + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = SqliteRepository(os.path.join(tmp, "per_move.db"))
+        await repo.open()
+        per_move = await _per_move(repo, [_Game(i) for i in range(n_games)], plies)
+        await repo.close()
+        print(f"партий={n_games} ходов={plies} строк={rows}")
+        print(f"транзакция на ход: {per_move:.2f} с ({rows / per_move:,.0f} строк/с)")
+        print("WriteBehind:")
+        repo = SqliteRepository(os.path.join(tmp, "batched.db"))
+        await repo.open()
+        batched, wb = await _write_behind(repo, [_Game(i) for i in range(n_games)], plies)
+        print(f"  всего: {batched:.2f} с ({rows / batched:,.0f} строк/с), x{per_move / batched:.1f}")
+        print(f"  {wb.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Кэш ранних позиций: время анализа хода первых полуходов с кэшем и без.
+Партии идут по линиям дебютной книги и с вероятностью отклонения на каждом ходу
+уходят в случайные ходы (как живые игроки).
+Запуск: python -m bench.bench_positions [партий] [вероятность_отклонения]
+"""
+import random
+import sys
+import time
+
+import chess
+import chess.polyglot
+
+from app.positions import OPENING_BOOK, PositionCache, analyze_move
+
+PLIES = 12
+
+
+def _lines(n_games: int, deviate: float, seed: int = 1) -> list[list[chess.Move]]:
+    rnd = random.Random(seed)
+    lines = []
+    for _ in range(n_games):
+        book = rnd.choice(OPENING_BOOK).split()
+        board = chess.Board()
+        line = []
+        in_book = True
+        while len(line) < PLIES and not board.is_game_over():
+            in_book = in_book and len(line) < len(book) and rnd.random() >= deviate
+            move = board.parse_san(book[len(line)]) if in_book else rnd.choice(list(board.legal_moves))
+            board.push(move)
+            line.append(move)
+        lines.append(line)
+    return lines
+
+
+def _run(lines: list[list[chess.Move]], cache: PositionCache | None) -> float:
+    """Микросекунд на ход (включая push на доске партии)."""
+    total = 0
+    elapsed = 0.0
+    for line in lines:
+        board = chess.Board()
+        key = chess.polyglot.zobrist_hash(board)
+        started = time.perf_counter()
+        for ply, move in enumerate(line):
+            a = cache.analyze(board, key, ply, move) if cache else analyze_move(board, move)
+            key = a.key
+        elapsed += time.perf_counter() - started
+        total += len(line)
+    return elapsed / total * 1e6
+
+
+def main() -> None:
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    deviate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.15
+    lines = _lines(n_games, deviate)
+    plain = _run(lines, None)
+    cache = PositionCache(max_size=10_000, max_ply=PLIES)
+    started = time.perf_counter()
+    cache.warm()
+    warm_ms = (time.perf_counter() - started) * 1000
+    cached = _run(lines, cache)
+    print(f"партий={n_games} полуходов<={PLIES} отклонение={deviate}")
+    print(f"без кэша:   {plain:6.1f} мкс/ход")
+    print(f"с кэшем:    {cached:6.1f} мкс/ход  (x{plain / cached:.2f})  прогрев {warm_ms:.0f} мс")
+    print(f"кэш: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
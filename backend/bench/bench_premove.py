@@ -0,0 +1,116 @@
+"""
+Премувы против обычного ответа: «эффективная» задержка хода в пулевой партии — от отправки
+хода белыми до того, как у них на доске появился ответ чёрных.
+Сервер поднимается в этом же процессе (как в loadgen), у клиентов искусственная сетевая
+задержка в одну сторону. Оба игрока ходят по одной детерминированной политике, поэтому
+чёрные заранее знают ход белых: в режиме premove они отправляют ответ премувом, пока белые
+думают, в режиме reply — обычным make_move сразу после прихода game_update.
+Запуск: python -m bench.bench_premove [--pairs 50] [--delay-ms 40] [--think-ms 100] [--plies 40]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import chess
+import chess.polyglot
+import websockets
+
+from bench.loadgen import _percentile, _recv, _start_server
+
+
+def _policy(board: chess.Board) -> chess.Move:
+    """Ход, который выберут оба клиента: зависит только от позиции."""
+    moves = sorted(board.legal_moves, key=chess.Move.uci)
+    return moves[chess.polyglot.zobrist_hash(board) % len(moves)]
+
+
+async def _send(ws, delay_s: float, msg: dict) -> None:
+    await asyncio.sleep(delay_s)
+    await ws.send(json.dumps(msg))
+
+
+def _move_msg(type_: str, game_id: str, move: chess.Move) -> dict:
+    uci = move.uci()
+    return {"type": type_, "game_id": game_id, "from": uci[:2], "to": uci[2:4], "promotion": uci[4:] or None}
+
+
+async def _play(ws, matched: dict, args, latencies: list[float]) -> None:
+    mode, delay_s, plies = args.mode, args.delay_ms / 1000, args.plies
+    color = chess.WHITE if matched["color"] == "white" else chess.BLACK
+    game_id = matched["game_id"]
+    board = chess.Board()
+    sent = None
+    while True:
+        if board.turn == color:
+            if color == chess.WHITE and board.ply() >= plies:
+                await _send(ws, delay_s, {"type": "resign", "game_id": game_id})
+            else:
+                if color == chess.WHITE:
+                    await asyncio.sleep(args.think_ms / 1000)
+                sent = time.perf_counter()
+                await _send(ws, delay_s, _move_msg("make_move", game_id, _policy(board)))
+        elif color == chess.BLACK and mode == "premove" and board.ply() < plies:
+            ahead = board.copy(stack=False)
+            ahead.push(_policy(ahead))
+            if not ahead.is_game_over():
+                await _send(ws, delay_s, _move_msg("premove", game_id, _policy(ahead)))
+        update = await _recv(ws, 30, game_id, "game_update")
+        if update is None:
+            return
+        await asyncio.sleep(delay_s)
+        if update["result"] is not None:
+            return
+        board = chess.Board(update["fen"])
+        if color == chess.WHITE and board.turn == chess.WHITE and sent is not None:
+            latencies.append((time.perf_counter() - sent) * 1000)
+            sent = None
+
+
+async def _client(uid: int, url: str, args, latencies: list[float]) -> None:
+    async with websockets.connect(url, max_size=None, open_timeout=60) as ws:
+        await ws.send(json.dumps({"type": "auth", "init_data": "", "debug_uid": uid}))
+        if await _recv(ws, 60, None, "queue_counts") is None:
+            return
+        await ws.send(json.dumps({"type": "join_queue", "time_control": "3+0"}))
+        matched = await _recv(ws, 60, None, "matched")
+        if matched is not None:
+            await _play(ws, matched, args, latencies)
+
+
+async def _run(mode: str, first_uid: int, url: str, args) -> None:
+    latencies: list[float] = []
+    args.mode = mode
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(uid, url, args, latencies) for uid in range(first_uid, first_uid + 2 * args.pairs)))
+    elapsed = time.perf_counter() - started
+    print(
+        f"{mode:<8} ответов: {len(latencies):5d}  p50: {_percentile(latencies, 0.5):6.1f} мс  "
+        f"p99: {_percentile(latencies, 0.99):6.1f} мс  партии за {elapsed:.1f} с"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Задержка ответа с премувами и без")
+    parser.add_argument("--pairs", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=40, help="сетевая задержка в одну сторону")
+    parser.add_argument("--think-ms", type=float, default=100, help="сколько думают белые")
+    parser.add_argument("--plies", type=int, default=40)
+    parser.add_argument("--port", type=int, default=8133)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    server, _ = await _start_server(args.port)
+    url = f"ws://127.0.0.1:{args.port}/ws"
+    print(
+        f"пар: {args.pairs}  задержка в одну сторону: {args.delay_ms:.0f} мс  "
+        f"белые думают: {args.think_ms:.0f} мс  полуходов: {args.plies}"
+    )
+    await _run("reply", 1, url, args)
+    await _run("premove", 1_000_001, url, args)
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
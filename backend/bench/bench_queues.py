@@ -0,0 +1,78 @@
+"""
+Оборот очередей пейринга: вход/выход/отключение на длинных очередях.
+Сравнение PlayerQueues (deque + индекс) со старыми списками и линейным поиском.
+Запуск: python -m bench.bench_queues [событий] [ожидающих]
+"""
+import random
+import sys
+import time
+from collections import defaultdict
+
+from app.constants import TIME_CONTROL_KEYS
+from app.matchmaking import PlayerQueues, QueuedPlayer
+
+
+class ListQueues:
+    """Прежняя реализация: list.pop(0) и линейный поиск при выходе."""
+
+    def __init__(self):
+        self._queues: dict[str, list[QueuedPlayer]] = defaultdict(list)
+
+    def push(self, key: str, player: QueuedPlayer) -> None:
+        self._queues[key].append(player)
+
+    def pop(self, key: str) -> QueuedPlayer | None:
+        queue = self._queues[key]
+        return queue.pop(0) if queue else None
+
+    def remove(self, user_id: str, key: str | None = None) -> bool:
+        keys = [key] if key else TIME_CONTROL_KEYS
+        for k in keys:
+            queue = self._queues[k]
+            for i, p in enumerate(queue):
+                if p.user_id == user_id:
+                    queue.pop(i)
+                    return True
+        return False
+
+
+def _events(n_events: int, n_waiting: int, seed: int = 1) -> list[tuple[str, str, str]]:
+    rnd = random.Random(seed)
+    events = []
+    for _ in range(n_events):
+        user_id = str(rnd.randrange(n_waiting * 2))
+        key = rnd.choice(TIME_CONTROL_KEYS)
+        events.append((rnd.choice(("join", "leave", "disconnect", "match")), key, user_id))
+    return events
+
+
+def run(queues, n_waiting: int, events: list[tuple[str, str, str]]) -> float:
+    for i in range(n_waiting):
+        queues.push(TIME_CONTROL_KEYS[i % len(TIME_CONTROL_KEYS)], QueuedPlayer(str(i), i, ""))
+    start = time.perf_counter()
+    for kind, key, user_id in events:
+        if kind == "join":
+            queues.remove(user_id)
+            queues.push(key, QueuedPlayer(user_id, 0, ""))
+        elif kind == "leave":
+            queues.remove(user_id, key)
+        elif kind == "disconnect":
+            queues.remove(user_id)
+        else:
+            queues.pop(key)
+    return len(events) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_waiting = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    events = _events(n_events, n_waiting)
+    new_rate = run(PlayerQueues(TIME_CONTROL_KEYS), n_waiting, events)
+    old_rate = run(ListQueues(), n_waiting, events)
+    print(f"событий={n_events} ожидающих в начале={n_waiting}")
+    print(f"списки + линейный поиск: {old_rate:12,.0f} событий/с")
+    print(f"deque + индекс:          {new_rate:12,.0f} событий/с  (x{new_rate / old_rate:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Флуд одного клиента против задержки ходов остальных игроков.
+Сервер (uvicorn) и флудер запускаются отдельными процессами; здесь — пары игроков,
+которые ходят случайными легальными ходами. Три прогона: без флуда, флуд без лимитов
+(WS_RATE_LIMIT=0), флуд с лимитами. Флудер шлёт join_queue/leave_queue и make_move
+без пауз и переподключается после отключения.
+Запуск: python -m bench.bench_ratelimit [пар] [секунд]
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import chess
+import websockets
+
+PORT = 8131
+URL = f"ws://127.0.0.1:{PORT}/ws"
+
+FLOODER = f"""
+import asyncio, json, websockets
+async def main():
+    join = json.dumps({{"type": "join_queue", "time_control": "3+0"}})
+    leave = json.dumps({{"type": "leave_queue"}})
+    move = json.dumps({{"type": "make_move", "game_id": "x" * 36, "from": "e2", "to": "e4"}})
+    while True:
+        try:
+            async with websockets.connect("{URL}") as ws:
+                await ws.send(json.dumps({{"type": "auth", "init_data": "", "debug_uid": 999999}}))
+                while True:
+                    for raw in (join, leave, move):
+                        await ws.send(raw)
+                    await asyncio.sleep(0)
+        except Exception:
+            await asyncio.sleep(0.05)
+asyncio.run(main())
+"""
+
+
+async def _recv_type(ws, *types: str) -> dict:
+    while True:
+        msg = json.loads(await ws.recv())
+        if msg["type"] == "ping":
+            await ws.send(json.dumps({"type": "pong"}))
+        elif msg["type"] in types:
+            return msg
+
+
+async def _player(uid: int, stop: float, latencies: list[float], matches: list[float]) -> None:
+    rnd = random.Random(uid)
+    async with websockets.connect(URL) as ws:
+        await ws.send(json.dumps({"type": "auth", "init_data": "", "debug_uid": uid}))
+        await _recv_type(ws, "queue_counts")
+        while time.perf_counter() < stop:
+            joined = time.perf_counter()
+            await ws.send(json.dumps({"type": "join_queue", "time_control": "15+10"}))
+            matched = await _recv_type(ws, "matched")
+            matches.append(time.perf_counter() - joined)
+            color = chess.WHITE if matched["color"] == "white" else chess.BLACK
+            board = chess.Board()
+            while time.perf_counter() < stop:
+                sent = None
+                if board.turn == color:
+                    await asyncio.sleep(0.05)  # «подумать»
+                    uci = rnd.choice(list(board.legal_moves)).uci()
+                    sent = time.perf_counter()
+                    await ws.send(json.dumps({
+                        "type": "make_move", "game_id": matched["game_id"],
+                        "from": uci[:2], "to": uci[2:4], "promotion": uci[4:] or None,
+                    }))
+                update = await _recv_type(ws, "game_update")
+                if sent is not None:
+                    latencies.append((time.perf_counter() - sent) * 1000)
+                board = chess.Board(update["fen"])
+                if update["result"] is not None:
+                    break
+
+
+def _percentile(values: list[float], p: float) -> str:
+    if not values:
+        return "—"
+    values = sorted(values)
+    return f"{values[min(len(values) - 1, int(len(values) * p))]:.1f}"
+
+
+async def _run(pairs: int, seconds: float, flood: bool, limit: bool) -> None:
+    env = {**os.environ, "DEBUG": "1", "DATABASE_URL": "", "WS_RATE_LIMIT": "1" if limit else "0"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning",
+         "--ws-max-size", os.environ.get("WS_MAX_MESSAGE_BYTES", "8192")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    flooder = None
+    try:
+        for _ in range(100):
+            try:
+                async with websockets.connect(URL):
+                    break
+            except OSError:
+                await asyncio.sleep(0.1)
+        if flood:
+            flooder = subprocess.Popen([sys.executable, "-c", FLOODER])
+            await asyncio.sleep(1)
+        latencies: list[float] = []
+        matches: list[float] = []
+        stop = time.perf_counter() + seconds
+        await asyncio.gather(*(
+            asyncio.wait_for(_player(uid, stop, latencies, matches), seconds + 30)
+            for uid in range(1, 2 * pairs + 1)
+        ), return_exceptions=True)
+        stats = _fetch_stats()
+        name = "без флуда" if not flood else ("флуд, лимиты выкл" if not limit else "флуд, лимиты вкл")
+        print(
+            f"{name:<20} матчей={len(matches):>3}  ходов={len(latencies):>5}  p50={_percentile(latencies, 0.5):>7} мс  "
+            f"p99={_percentile(latencies, 0.99):>7} мс  ratelimit={stats.get('ratelimit')}"
+        )
+    finally:
+        if flooder:
+            flooder.kill()
+        server.kill()
+        server.wait()
+
+
+def _fetch_stats() -> dict:
+    import urllib.request
+    with urllib.request.urlopen(f"http://127.0.0.1:{PORT}/stats", timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+async def main() -> None:
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 8
+    for flood, limit in ((False, True), (True, False), (True, True)):
+        await _run(pairs, seconds, flood, limit)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
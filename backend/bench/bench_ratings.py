@@ -0,0 +1,104 @@
+"""
+Рейтинги Эло: пропускная способность на 1M результатов.
+- Инкрементальный учёт результатов (словарь + SortedList на пул).
+- Место игрока и топ-100 по SortedList против сортировки всего пула на каждый запрос.
+- Пересчёт всех рейтингов с нуля по истории в SQLite (audit).
+Запуск: python -m bench.bench_ratings [результатов] [игроков]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Конфиг читается при импорте app: хранилище подставляем сами
+os.environ.setdefault("DATABASE_URL", "")
+
+from app.constants import TIME_CONTROL_KEYS  # noqa: E402
+from app.persistence import SqliteRepository, WriteBatch  # noqa: E402
+from app.ratings import Ratings, audit  # noqa: E402
+
+RESULTS = ("1-0", "0-1", "1/2-1/2")
+QUERIES = 100_000
+
+
+def _games(n: int, players: int, seed: int = 1) -> list[tuple[str, str, str, str]]:
+    rnd = random.Random(seed)
+    games = []
+    for _ in range(n):
+        white, black = rnd.sample(range(players), 2)
+        games.append((rnd.choice(TIME_CONTROL_KEYS), str(white), str(black), rnd.choice(RESULTS)))
+    return games
+
+
+def _rank_by_sort(ratings: Ratings, pool: str, user_id: str) -> int:
+    """Как было бы без упорядоченной структуры: сортировка пула на каждый запрос."""
+    ordered = sorted((rating for _, rating in ratings.pools[pool].items()), reverse=True)
+    return ordered.index(ratings.pools[pool].get(user_id)) + 1
+
+
+async def _audit(games: list[tuple[str, str, str, str]], ratings: Ratings) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = SqliteRepository(os.path.join(tmp, "ratings.db"))
+        await repo.open()
+        started = time.perf_counter()
+        batch = WriteBatch()
+        for i, (tc, white, black, result) in enumerate(games):
+            batch.games.append((f"g{i:08d}", tc, white, black, "", "", 0, 0, "", float(i)))
+            batch.results.append((result, 0, 0, float(i), f"g{i:08d}"))
+            if len(batch.games) == 20_000:
+                await repo.write(batch)
+                batch = WriteBatch()
+        await repo.write(batch)
+        users = {user_id for _, white, black, _ in games for user_id in (white, black)}
+        await repo.write(WriteBatch(users=[(user_id, int(user_id), "", 0.0) for user_id in users]))
+        fill_s = time.perf_counter() - started
+        # Сохранить «живые» рейтинги — сверка должна сойтись
+        batch = WriteBatch()
+        for pool, p in ratings.pools.items():
+            batch.ratings.extend((pool, rating, user_id) for user_id, rating in p.items())
+        await repo.write(batch)
+        started = time.perf_counter()
+        report = await audit(repo, ratings.k)
+        elapsed = time.perf_counter() - started
+        print(f"пересчёт из SQLite: {len(games) / elapsed:9.0f} результатов/с ({elapsed:.1f} с, запись {fill_s:.1f} с)  {report}")
+        await repo.close()
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    games = _games(n, players)
+    print(f"результатов: {n}  игроков: {players}")
+
+    ratings = Ratings(k=20)
+    started = time.perf_counter()
+    for tc, white, black, result in games:
+        ratings.record(tc, white, black, result)
+    elapsed = time.perf_counter() - started
+    print(f"учёт результатов:   {n / elapsed:9.0f} результатов/с ({elapsed / n * 1e6:.1f} мкс)  {ratings.stats()['players']}")
+
+    rnd = random.Random(2)
+    users = [str(rnd.randrange(players)) for _ in range(QUERIES)]
+    started = time.perf_counter()
+    for user_id in users:
+        ratings.pools["blitz"].rank(user_id)
+    elapsed = time.perf_counter() - started
+    print(f"место (SortedList): {QUERIES / elapsed:9.0f} запросов/с ({elapsed / QUERIES * 1e6:.1f} мкс)")
+    started = time.perf_counter()
+    for _ in range(QUERIES // 10):
+        ratings.leaderboard("blitz", 100)
+    elapsed = time.perf_counter() - started
+    print(f"топ-100:            {QUERIES // 10 / elapsed:9.0f} запросов/с ({elapsed / (QUERIES // 10) * 1e6:.1f} мкс)")
+    started = time.perf_counter()
+    for user_id in users[:20]:
+        _rank_by_sort(ratings, "blitz", user_id)
+    elapsed = time.perf_counter() - started
+    print(f"место (сортировка): {20 / elapsed:9.0f} запросов/с ({elapsed / 20 * 1e3:.1f} мс)")
+
+    asyncio.run(_audit(games, ratings))
+
+
+if __name__ == "__main__":
+    main()
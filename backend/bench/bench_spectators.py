@@ -0,0 +1,93 @@
+"""
+Нагрузка зрителей: одна партия и 5k зрителей через настоящие обработчики
+(watch_game, make_move) и общий WSManager. Меряем время хода у игроков (горячий путь),
+время рассылки хода всем зрителям после задержки и число сериализаций.
+Запуск: python -m bench.bench_spectators [зрителей] [ходов]
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from app import codec, ws_handlers
+from app.clock import clocks
+from app.matchmaking import QueuedPlayer
+from app.pairing import start_game
+from app.spectators import spectators
+from app.ws_handlers import handle_ws_message
+from app.ws_manager import manager
+
+MOVES = ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6", "b5a4", "g8f6", "e1g1", "f8e7"]
+
+
+class FakeWebSocket:
+    """Имитация WebSocket: запоминает момент получения последнего сообщения."""
+
+    received = 0
+    last_at = 0.0
+
+    async def send_text(self, text: str) -> None:
+        FakeWebSocket.received += 1
+        FakeWebSocket.last_at = time.perf_counter()
+        await asyncio.sleep(0)
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+async def main() -> None:
+    logging.disable(logging.INFO)
+    n_watchers = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_moves = min(int(sys.argv[2]) if len(sys.argv) > 2 else len(MOVES), len(MOVES))
+    clocks.start()
+    # Заглушки не отвечают на ping: heartbeat выключен, ping не попадёт в счёт доставок
+    manager.ping_interval_s = 0
+    spectators.max_per_game = n_watchers
+    white = QueuedPlayer(user_id="w", telegram_id=1, username="white")
+    black = QueuedPlayer(user_id="b", telegram_id=2, username="black")
+    game = start_game("15+10", white, black)
+    await manager.connect(FakeWebSocket(), "w", 1, "white")
+    await manager.connect(FakeWebSocket(), "b", 2, "black")
+    for i in range(n_watchers):
+        user_id = f"s{i}"
+        await manager.connect(FakeWebSocket(), user_id, 1000 + i, "")
+        await handle_ws_message(None, json.dumps({"type": "watch_game", "game_id": game.id}), user_id)
+    await asyncio.sleep(0.1)  # начальные снимки ушли
+
+    encodes = 0
+    original_encode = codec.encode
+
+    def counting_encode(payload):
+        nonlocal encodes
+        encodes += 1
+        return original_encode(payload)
+
+    ws_handlers.encode = counting_encode
+
+    move_us = []
+    fanout_ms = []
+    for i, uci in enumerate(MOVES[:n_moves]):
+        user_id = "w" if i % 2 == 0 else "b"
+        raw = json.dumps({"type": "make_move", "game_id": game.id, "from": uci[:2], "to": uci[2:4]})
+        FakeWebSocket.received = 0
+        start = time.perf_counter()
+        await handle_ws_message(None, raw, user_id)
+        move_us.append((time.perf_counter() - start) * 1e6)
+        published = time.perf_counter()
+        while FakeWebSocket.received < n_watchers + 2:
+            await asyncio.sleep(0.005)
+        fanout_ms.append((FakeWebSocket.last_at - published - spectators.delay_s) * 1000)
+
+    print(f"зрителей={n_watchers} ходов={n_moves} задержка={spectators.delay_s * 1000:.0f} мс")
+    print(f"ход у игроков (обработчик): p50 {sorted(move_us)[len(move_us) // 2]:.0f} мкс, max {max(move_us):.0f} мкс")
+    print(f"рассылка всем зрителям после задержки: p50 {sorted(fanout_ms)[len(fanout_ms) // 2]:.1f} мс, "
+          f"max {max(fanout_ms):.1f} мс")
+    print(f"сериализаций game_update: {encodes} на {n_moves} ходов ({n_moves * (n_watchers + 2):,} доставок)")
+    print(f"spectators: {spectators.stats()}")
+    print(f"ws: outbox_depth_max={manager.stats()['outbox_depth_max']} slow_disconnects={manager.slow_disconnects}")
+    clocks.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
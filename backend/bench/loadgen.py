@@ -0,0 +1,247 @@
+"""
+Нагрузочный прогон «от клиента до клиента»: сервер (uvicorn) запускается отдельным процессом,
+к /ws подключаются N клиентов через debug_uid (DEBUG=1).
+Каждый клиент встаёт в очередь случайного режима из TIME_CONTROL_KEYS, после матча ходит
+случайными легальными ходами (python-chess), иногда сдаётся или «зависает» до падения флага,
+затем снова встаёт в очередь.
+Итог: матчей в секунду, p50/p99 времени ход -> game_update, RSS и CPU сервера и клиентов — по отдельности.
+С --max-p99-ms прогон завершается с кодом 1, если p99 хуже порога (проверка перед деплоем).
+Запуск: python -m bench.loadgen [--clients 1000] [--seconds 30] [--think-ms 200] [--max-p99-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+
+import chess
+import websockets
+
+from app.constants import TIME_CONTROL_KEYS
+
+PONG = json.dumps({"type": "pong"})
+# Сервер: те же лимиты, что в Dockerfile; INFO-логи на каждое подключение не пишем — они мерили бы логирование
+SERVER = """
+import logging, os, uvicorn
+logging.disable(logging.INFO)
+uvicorn.run(
+    "app.main:app", host="127.0.0.1", port={port}, log_level="warning", backlog=4096,
+    ws_max_size=int(os.environ.get("WS_MAX_MESSAGE_BYTES", "8192")),
+)
+"""
+
+
+@dataclass
+class Totals:
+    connected: int = 0
+    games_started: int = 0
+    games_finished: int = 0
+    resigns: int = 0
+    stalls: int = 0
+    errors: int = 0
+    latencies_ms: list[float] = field(default_factory=list)
+
+
+def _rss_mb(pid: int | str = "self") -> tuple[float, float]:
+    """(текущий RSS, пиковый RSS) процесса в МБ (Linux; иначе только пик своего процесса)."""
+    current = peak = 0.0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        if pid == "self":
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return current, peak
+
+
+def _cpu_s(pid: int | str = "self") -> float:
+    """Процессорное время процесса (user + system), с (Linux)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def _recv(ws, timeout: float, game_id: str | None, *types: str) -> dict | None:
+    """
+    Следующее сообщение нужного типа (для game_update — только своей партии); None — таймаут.
+    На ping отвечает pong, как фронтенд, иначе сервер закроет подключение (heartbeat).
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        left = deadline - time.perf_counter()
+        if left <= 0:
+            return None
+        try:
+            raw = await asyncio.wait_for(ws.recv(), left)
+        except asyncio.TimeoutError:
+            return None
+        if isinstance(raw, bytes):
+            continue
+        msg = json.loads(raw)
+        if msg["type"] == "ping":
+            await ws.send(PONG)
+            continue
+        if msg["type"] in types and (game_id is None or msg.get("game_id") == game_id):
+            return msg
+
+
+async def _play(ws, rnd: random.Random, matched: dict, args, totals: Totals, stop: float) -> None:
+    color = chess.WHITE if matched["color"] == "white" else chess.BLACK
+    game_id = matched["game_id"]
+    board = chess.Board()
+    stalled = rnd.random() < args.stall
+    if stalled:
+        totals.stalls += 1
+    while True:
+        sent = None
+        if board.turn == color and not stalled:
+            await asyncio.sleep(rnd.uniform(0.5, 1.5) * args.think_ms / 1000)
+            if time.perf_counter() >= stop or rnd.random() < args.resign or board.ply() >= args.max_plies:
+                await ws.send(json.dumps({"type": "resign", "game_id": game_id}))
+                totals.resigns += 1
+            else:
+                uci = rnd.choice(list(board.legal_moves)).uci()
+                await ws.send(json.dumps({
+                    "type": "make_move", "game_id": game_id,
+                    "from": uci[:2], "to": uci[2:4], "promotion": uci[4:] or None,
+                }))
+            sent = time.perf_counter()
+        # Зависший игрок ждёт флага: таймаут — весь контроль партии с запасом
+        update = await _recv(ws, args.update_timeout_s if not stalled else 3600, game_id, "game_update")
+        if update is None:
+            totals.errors += 1
+            return
+        if sent is not None:
+            totals.latencies_ms.append((time.perf_counter() - sent) * 1000)
+        if update["result"] is not None:
+            if color == chess.WHITE:
+                totals.games_finished += 1
+            return
+        board = chess.Board(update["fen"])
+
+
+async def _client(uid: int, url: str, args, totals: Totals, stop: float) -> None:
+    rnd = random.Random(uid)
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=60) as ws:
+            await ws.send(json.dumps({"type": "auth", "init_data": "", "debug_uid": uid}))
+            if await _recv(ws, 60, None, "queue_counts") is None:
+                totals.errors += 1
+                return
+            totals.connected += 1
+            while time.perf_counter() < stop:
+                await ws.send(json.dumps({"type": "join_queue", "time_control": rnd.choice(TIME_CONTROL_KEYS)}))
+                matched = await _recv(ws, stop - time.perf_counter(), None, "matched")
+                if matched is None:
+                    await ws.send(json.dumps({"type": "leave_queue"}))
+                    return
+                if matched["color"] == "white":
+                    totals.games_started += 1
+                await _play(ws, rnd, matched, args, totals, stop)
+    except (OSError, websockets.WebSocketException):
+        totals.errors += 1
+
+
+async def _start_server(port: int) -> subprocess.Popen:
+    """uvicorn в отдельном процессе: его RSS и CPU меряются отдельно от клиентов."""
+    env = {**os.environ, "DEBUG": "1", "DATABASE_URL": os.environ.get("DATABASE_URL", "")}
+    server = subprocess.Popen([sys.executable, "-c", SERVER.format(port=port)], env=env)
+    for _ in range(300):
+        try:
+            async with websockets.connect(f"ws://127.0.0.1:{port}/ws"):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            await asyncio.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+async def _run(server_pid: int, args) -> int:
+    rss_before, _ = _rss_mb(server_pid)
+    server_cpu_before = _cpu_s(server_pid)
+    url = f"ws://127.0.0.1:{args.port}/ws"
+    totals = Totals()
+    started = time.perf_counter()
+    stop = started + args.seconds
+    tasks = []
+    for uid in range(1, args.clients + 1):
+        tasks.append(asyncio.create_task(_client(uid, url, args, totals, stop)))
+        if uid % max(1, args.ramp // 10) == 0:
+            await asyncio.sleep(0.1)
+    rss_loaded = rss_before
+    while time.perf_counter() < stop:
+        await asyncio.sleep(1)
+        rss_loaded = max(rss_loaded, _rss_mb(server_pid)[0])
+    await asyncio.wait(tasks, timeout=args.update_timeout_s)
+    elapsed = time.perf_counter() - started
+    _, rss_peak = _rss_mb(server_pid)
+    client_rss, client_peak = _rss_mb()
+    server_cpu = _cpu_s(server_pid) - server_cpu_before
+    client_cpu = _cpu_s()
+
+    lat = totals.latencies_ms
+    p50, p99 = _percentile(lat, 0.5), _percentile(lat, 0.99)
+    print(f"клиентов: {args.clients}  подключено: {totals.connected}  ошибок: {totals.errors}")
+    print(
+        f"партий начато: {totals.games_started}  завершено: {totals.games_finished}  "
+        f"сдач: {totals.resigns}  зависаний: {totals.stalls}  матчей/с: {totals.games_started / elapsed:.1f}"
+    )
+    print(f"ходов: {len(lat)}  p50: {p50:.1f} мс  p99: {p99:.1f} мс  max: {max(lat, default=0):.1f} мс")
+    print(f"RSS сервера: до {rss_before:.0f} МБ, под нагрузкой {rss_loaded:.0f} МБ, пик {rss_peak:.0f} МБ")
+    print(f"RSS клиентов: {client_rss:.0f} МБ, пик {client_peak:.0f} МБ")
+    print(f"CPU: сервер {server_cpu:.1f} с, клиенты {client_cpu:.1f} с за {elapsed:.1f} с")
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        print(f"p99 {p99:.1f} мс хуже порога {args.max_p99_ms} мс", file=sys.stderr)
+        return 1
+    return 0
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон PhoneChess через /ws")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--ramp", type=int, default=500, help="подключений в секунду")
+    parser.add_argument("--think-ms", type=float, default=200, help="среднее время на ход")
+    parser.add_argument("--resign", type=float, default=0.01, help="вероятность сдаться перед ходом")
+    parser.add_argument("--stall", type=float, default=0.0, help="доля партий, где игрок ждёт падения флага")
+    parser.add_argument("--max-plies", type=int, default=200, help="после стольких полуходов — сдаться")
+    parser.add_argument("--update-timeout-s", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8132)
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="порог p99 для кода выхода")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    server = await _start_server(args.port)
+    try:
+        return await _run(server.pid, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
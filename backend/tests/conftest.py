@@ -0,0 +1,180 @@
+"""
+Общее для тестов: конфиг читается при импорте app, поэтому окружение — до него.
+Запуск: python -m pytest из backend/
+"""
+import asyncio
+import hashlib
+import hmac
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import urlencode
+
+import pytest
+
+# Без постоянного хранилища: партии и результаты не пишутся на диск
+os.environ.setdefault("DATABASE_URL", "")
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+@pytest.fixture
+def new_game():
+    """Фабрика партий между новыми игроками (у каждого теста свои user_id)."""
+    from app.matchmaking import QueuedPlayer
+    from app.pairing import start_game
+
+    def make(time_control_key: str = "3+0"):
+        white, black = (
+            QueuedPlayer(user_id=str(uuid.uuid4()), telegram_id=i, username=name)
+            for i, name in ((1, "white"), (2, "black"))
+        )
+        return start_game(time_control_key, white, black)
+
+    return make
+
+
+BOT_TOKEN = "123456:test-token"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Токен бота задан (initData проверяется по подписи), кэш initData — свой на тест."""
+    from app import auth
+    from app.auth import AuthCache
+    from app.config import get_config
+
+    monkeypatch.setattr(get_config(), "telegram_bot_token", BOT_TOKEN)
+    monkeypatch.setattr(get_config(), "auth_max_age_s", 3600)
+    cache = AuthCache(ttl_s=300, max_size=2)
+    monkeypatch.setattr(auth, "auth_cache", cache)
+    return cache
+
+
+def signed_init_data(user_id: int = 42, auth_date: float | None = None) -> str:
+    """initData, подписанный токеном BOT_TOKEN так, как это делает Telegram."""
+    from app.auth import _secret_key
+
+    fields = {
+        "auth_date": str(int(time.time() if auth_date is None else auth_date)),
+        "query_id": f"q{user_id}",
+        "user": json.dumps({"id": user_id, "username": f"user{user_id}"}),
+    }
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    fields["hash"] = hmac.new(_secret_key(BOT_TOKEN), check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def _app_copy(name: str):
+    """
+    Ещё одна копия пакета app под именем name: свои синглтоны (manager, cluster, store, часы) —
+    второй воркер в том же процессе.
+    """
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, APP_DIR / "__init__.py", submodule_search_locations=[str(APP_DIR)])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return importlib.import_module(f"{name}.ws_handlers")
+
+
+class FakeClient:
+    """Клиент для ws_auth_and_loop: то, что шлёт сервер, копится в received (JSON разобран)."""
+
+    def __init__(self):
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self.received: list[dict | bytes] = []
+        self._taken: set[int] = set()
+        self.closed_with: int | None = None
+        self.task: asyncio.Task | None = None
+
+    async def accept(self) -> None:
+        pass
+
+    async def receive_text(self) -> str:
+        from starlette.websockets import WebSocketDisconnect
+
+        text = await self._inbox.get()
+        if text is None:
+            raise WebSocketDisconnect(1001)
+        return text
+
+    async def send_text(self, text: str) -> None:
+        self.received.append(json.loads(text))
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.received.append(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+        self._inbox.put_nowait(None)
+
+    def connect(self, worker, **auth) -> None:
+        """Открыть сессию на воркере (auth — init_data/debug_uid/resume_token)."""
+        self.task = asyncio.create_task(worker.ws_auth_and_loop(self))
+        self.send(type="auth", init_data="", **auth)
+
+    def send(self, **msg) -> None:
+        self._inbox.put_nowait(json.dumps(msg))
+
+    async def disconnect(self) -> None:
+        self._inbox.put_nowait(None)
+        await self.task
+
+    async def wait_for(self, msg_type: str, timeout: float = 2.0, **fields) -> dict:
+        """Следующее ещё не взятое сообщение этого типа (с такими значениями полей)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            for i, msg in enumerate(self.received):
+                if (
+                    i not in self._taken and isinstance(msg, dict) and msg.get("type") == msg_type
+                    and all(msg.get(k) == v for k, v in fields.items())
+                ):
+                    self._taken.add(i)
+                    return msg
+            if time.monotonic() > deadline:
+                raise AssertionError(f"no {msg_type} {fields or ''} in {self.received}")
+            await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    """
+    Два воркера (ws_handlers пакета app и его копии) с общим InMemoryBackend.
+    Вход — debug_uid, токены возобновления подписаны общим секретом, как у воркеров одного бота.
+    """
+    from app.state_backend import InMemoryBackend
+
+    pair = [importlib.import_module("app.ws_handlers"), _app_copy("app_worker_b")]
+    backend = InMemoryBackend()
+    for name, worker in zip("ab", pair):
+        monkeypatch.setattr(worker.cluster, "backend", backend)
+        monkeypatch.setattr(worker.cluster, "worker_id", name)
+        monkeypatch.setattr(worker.cluster, "is_leader", False)
+        monkeypatch.setattr(worker.manager, "_by_user", {})
+        monkeypatch.setattr(worker.manager, "_parked", {})
+        monkeypatch.setattr(worker.get_config(), "debug", True)
+        monkeypatch.setattr(worker.resume_tokens, "secret", b"shared")
+    return pair
+
+
+@asynccontextmanager
+async def running(*workers, matchmaking: bool = False):
+    """Подписки воркеров (первый — лидер матчмейкинга) и, если нужно, их тики пейринга."""
+    for worker in workers:
+        await worker.cluster.start()
+    tasks = [asyncio.create_task(w.matchmaking_loop()) for w in workers] if matchmaking else []
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        for worker in workers:
+            worker.cluster._listener.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
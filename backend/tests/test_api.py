@@ -0,0 +1,39 @@
+import time
+
+import pytest
+from conftest import signed_init_data
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.sessions import resume_tokens
+
+
+@pytest.fixture
+def client(cache):
+    """Без lifespan: фоновые задачи и хранилище не нужны."""
+    return TestClient(app)
+
+
+def test_user_endpoints_require_authorization(client):
+    for path in ("/api/users/42/rating", "/api/users/42/games", "/api/users/42/games.pgn"):
+        response = client.get(path)
+        assert response.status_code == 401 and response.headers["www-authenticate"] == "tma"
+        assert client.get(path, headers={"Authorization": "tma user=%7B%22id%22%3A42%7D&hash=0"}).status_code == 401
+
+
+def test_user_sees_only_own_data(client):
+    headers = {"Authorization": f"tma {signed_init_data(42)}"}
+    response = client.get("/api/users/42/rating", headers=headers)
+    assert response.status_code == 200 and set(response.json()) == {"blitz", "rapid"}
+    # Чужой id — отказ, даже с действительным initData
+    assert client.get("/api/users/43/rating", headers=headers).status_code == 403
+    # Проверка до хранилища: без DATABASE_URL история — 503 только для своего id
+    assert client.get("/api/users/42/games", headers=headers).status_code == 503
+    assert client.get("/api/users/43/games", headers=headers).status_code == 403
+
+
+def test_resume_token_authorizes_requests(client):
+    token = resume_tokens.issue(42, "user42", time.time())
+    assert client.get("/api/users/42/rating", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert client.get("/api/users/43/rating", headers={"Authorization": f"Bearer {token}"}).status_code == 403
+    assert client.get("/api/users/42/rating", headers={"Authorization": "Bearer " + token[:-2]}).status_code == 401
@@ -0,0 +1,49 @@
+import time
+
+from conftest import signed_init_data
+
+from app import auth
+from app.auth import AuthCache, validate_init_data
+
+
+def test_valid_init_data_is_cached(cache):
+    init_data = signed_init_data()
+    user = validate_init_data(init_data)
+    assert user["id"] == 42 and user["username"] == "user42"
+    assert isinstance(user["auth_date"], int)
+    assert validate_init_data(init_data) == user
+    assert cache.stats() == {"cached": 1, "hits": 1, "misses": 1, "rejected_stale": 0}
+    # Подменённые поля с тем же hash — другая строка: мимо кэша и не проходит подпись
+    assert validate_init_data(init_data.replace("user42", "user43")) is None
+    assert cache.hits == 1
+
+
+def test_stale_auth_date_is_rejected(cache, monkeypatch):
+    now = time.time()
+    assert validate_init_data(signed_init_data(auth_date=now - 3601)) is None
+    assert cache.rejected_stale == 1 and cache.stats()["cached"] == 0
+    # Запись в кэше живёт не дольше, чем initData остаётся свежим
+    init_data = signed_init_data(auth_date=now - 3590)
+    assert validate_init_data(init_data) is not None
+    monkeypatch.setattr(auth.time, "time", lambda: now + 20)
+    assert validate_init_data(init_data) is None
+    assert cache.rejected_stale == 2
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    first, second, third = (signed_init_data(user_id) for user_id in (1, 2, 3))
+    validate_init_data(first)
+    validate_init_data(second)
+    validate_init_data(first)  # first — свежее second
+    validate_init_data(third)
+    assert cache.stats()["cached"] == 2
+    now = time.time()
+    assert cache.get(first, now)["id"] == 1
+    assert cache.get(third, now)["id"] == 3
+    assert cache.get(second, now) is None
+
+
+def test_zero_max_size_disables_cache():
+    cache = AuthCache(max_size=0)
+    cache.put("init", {"id": 1}, time.time() + 60)
+    assert cache.get("init", time.time()) is None and cache.stats()["cached"] == 0
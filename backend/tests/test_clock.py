@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+import chess
+import pytest
+
+from app import pairing
+from app.clock import ClockScheduler
+from app.pairing import apply_move, flag_game
+
+
+async def _expired_within(scheduler: ClockScheduler, seconds: float) -> list[tuple[str, float]]:
+    """Что сработало за seconds: [(game_id, time.monotonic() срабатывания)]."""
+    fired = []
+
+    async def on_expire(game_id: str) -> None:
+        fired.append((game_id, time.monotonic()))
+
+    scheduler.on_expire = on_expire
+    await asyncio.sleep(seconds)
+    scheduler.stop()
+    return fired
+
+
+def test_deadline_fires_once_and_not_early():
+    async def run():
+        scheduler = ClockScheduler()
+        scheduler.start()
+        deadline = time.monotonic() + 0.05
+        scheduler.schedule("g1", deadline)
+        fired = await _expired_within(scheduler, 0.15)
+        return deadline, fired, len(scheduler)
+
+    deadline, fired, pending = asyncio.run(run())
+    assert [game_id for game_id, _ in fired] == ["g1"]
+    assert deadline <= fired[0][1] < deadline + 0.05
+    assert pending == 0
+
+
+def test_cancelled_deadline_does_not_fire():
+    async def run():
+        scheduler = ClockScheduler()
+        scheduler.start()
+        now = time.monotonic()
+        scheduler.schedule("g1", now + 0.03)
+        scheduler.schedule("g2", now + 0.05)
+        scheduler.cancel("g1")
+        return await _expired_within(scheduler, 0.12)
+
+    assert [game_id for game_id, _ in asyncio.run(run())] == ["g2"]
+
+
+def test_rescheduled_deadline_fires_at_the_new_time():
+    async def run():
+        scheduler = ClockScheduler()
+        scheduler.start()
+        now = time.monotonic()
+        # Ход сдвинул дедлайн позже: старая запись в heap устарела и не срабатывает
+        scheduler.schedule("later", now + 0.03)
+        scheduler.schedule("later", now + 0.08)
+        # ...и раньше: таймер перевзводится на новую вершину heap
+        scheduler.schedule("earlier", now + 0.2)
+        scheduler.schedule("earlier", now + 0.02)
+        fired = await _expired_within(scheduler, 0.15)
+        return now, fired
+
+    now, fired = asyncio.run(run())
+    assert [game_id for game_id, _ in fired] == ["earlier", "later"]
+    assert fired[1][1] >= now + 0.08
+
+
+@pytest.fixture
+def clocks(monkeypatch):
+    """Свой планировщик часов партий; on_expire — flag_game, результаты копятся в flagged."""
+    scheduler = ClockScheduler()
+    scheduler.flagged = []
+
+    async def on_expire(game_id: str) -> None:
+        scheduler.flagged.append(flag_game(game_id))
+
+    scheduler.on_expire = on_expire
+    monkeypatch.setattr(pairing, "clocks", scheduler)
+    return scheduler
+
+
+def _run_clock(g, white_ms: int, black_ms: int) -> None:
+    """Оставить сторонам по N мс и пустить часы стороны, чей ход, с этого момента."""
+    g.white_remaining_ms, g.black_remaining_ms = white_ms, black_ms
+    g.last_clock_at = time.monotonic()
+    pairing._schedule_clock(g)
+
+
+def test_flag_falls_at_the_deadline(new_game, clocks):
+    g = new_game()
+
+    async def run():
+        clocks.start()
+        _run_clock(g, 50, 60_000)
+        await asyncio.sleep(0.02)
+        assert clocks.flagged == []
+        await asyncio.sleep(0.1)
+        clocks.stop()
+
+    asyncio.run(run())
+    assert [u["result"] for u in clocks.flagged] == ["0-1"]
+    assert g.result == "0-1" and g.white_remaining_ms == 0 and len(clocks) == 0
+
+
+def test_move_reschedules_the_flag_to_the_opponent(new_game, clocks):
+    g = new_game()
+
+    async def run():
+        clocks.start()
+        _run_clock(g, 60, 60)
+        await asyncio.sleep(0.02)
+        assert apply_move(g.id, g.white_id, "e2", "e4")["seq"] == 1
+        # Часы белых остановлены; флаг падает у чёрных через их 60 мс
+        await asyncio.sleep(0.03)
+        assert clocks.flagged == []
+        await asyncio.sleep(0.08)
+        clocks.stop()
+
+    asyncio.run(run())
+    assert [u["result"] for u in clocks.flagged] == ["1-0"]
+    assert g.black_remaining_ms == 0 and g.white_remaining_ms > 0
+
+
+def test_early_timer_reschedules_instead_of_flagging(new_game, clocks):
+    g = new_game()
+    _run_clock(g, 60_000, 60_000)
+    assert flag_game(g.id) is None
+    assert g.result is None and len(clocks) == 1
+
+
+def test_flag_against_bare_king_is_a_draw(new_game, clocks):
+    g = new_game()
+    # Ход белых, у чёрных только король: мат им нечем поставить
+    g.board.set_fen("8/8/8/4k3/8/8/3QK3/8 w - - 0 1")
+    g.white_remaining_ms = 0
+    g.last_clock_at = time.monotonic() - 1
+    update = flag_game(g.id)
+    assert update["result"] == g.result == "1/2-1/2"
+    assert flag_game(g.id) is None
+
+
+def test_flag_with_mating_material_loses(new_game, clocks):
+    g = new_game()
+    g.board.set_fen("8/8/8/4k3/8/8/3QK3/8 b - - 0 1")
+    g.black_remaining_ms = 0
+    g.last_clock_at = time.monotonic() - 1
+    assert flag_game(g.id)["result"] == "1-0"
+    assert g.black_remaining_ms == 0
@@ -0,0 +1,98 @@
+import asyncio
+import uuid
+
+import pytest
+from conftest import FakeClient, running
+
+from app.persistence import StoredGame
+
+
+class StoredGames:
+    """Хранилище, которое отдаёт незавершённые партии с записанным владельцем worker_id."""
+
+    def __init__(self, games: dict[str, str]):
+        self.games = games
+        self.asked: list[str | None] = []
+
+    async def load_unfinished(self, worker_id: str | None = None) -> list[StoredGame]:
+        self.asked.append(worker_id)
+        return [
+            StoredGame(game_id, "3+0", f"w-{game_id}", f"b-{game_id}", "", "", 180_000, 180_000)
+            for game_id, owner in self.games.items()
+            if worker_id is None or owner == worker_id
+        ]
+
+
+def test_restore_requires_worker_id_with_shared_backend(workers, monkeypatch):
+    a, _ = workers
+    repo = StoredGames({"g-a": "a"})
+    monkeypatch.setattr(a.persistence, "repo", repo)
+    monkeypatch.setattr(a.get_config(), "state_backend", "redis")
+    monkeypatch.setattr(a.get_config(), "worker_id", "")
+    with pytest.raises(RuntimeError, match="WORKER_ID"):
+        asyncio.run(a.restore_games())
+    assert repo.asked == []
+
+
+def test_restore_skips_games_owned_by_another_worker(workers, monkeypatch):
+    a, _ = workers
+    repo = StoredGames({"g-mine": "a", "g-moved": "a", "g-other": "b"})
+    monkeypatch.setattr(a.persistence, "repo", repo)
+    monkeypatch.setattr(a.get_config(), "state_backend", "redis")
+    monkeypatch.setattr(a.get_config(), "worker_id", "a")
+
+    async def run():
+        # Партию g-moved уже держит живой воркер b
+        await a.cluster.backend.set_game_owner("g-moved", "b", 60)
+        await a.restore_games()
+        return {game_id: await a.cluster.backend.get_game_owner(game_id) for game_id in repo.games}
+
+    owners = asyncio.run(run())
+    assert repo.asked == ["a"]
+    assert owners == {"g-mine": "a", "g-moved": "b", "g-other": None}
+    assert a.get_game("g-mine") is not None and a.get_game("g-moved") is None
+
+
+async def _top_games(clients) -> list[list[str]]:
+    for client in clients:
+        client.send(type="top_games")
+    return [[e["game_id"] for e in (await client.wait_for("top_games"))["games"]] for client in clients]
+
+
+@pytest.mark.parametrize("owner", ["a", "b"])
+def test_players_on_two_workers_are_matched_and_see_each_others_moves(workers, monkeypatch, owner):
+    a, b = workers
+    uids = {name: uuid.uuid4().int % 10**12 for name in "ab"}
+    # Партия создаётся на воркере случайного из двух игроков — здесь на заданном
+    monkeypatch.setattr(a.random, "choice", lambda players: next(p for p in players if p.user_id == str(uids[owner])))
+
+    async def run():
+        async with running(a, b, matchmaking=True):
+            clients = {}
+            for name, worker in (("a", a), ("b", b)):
+                clients[name] = client = FakeClient()
+                client.connect(worker, debug_uid=uids[name])
+                await client.wait_for("session")
+                client.send(type="join_queue", time_control="3+0")
+            matched = {name: await c.wait_for("matched") for name, c in clients.items()}
+            game_id = matched["a"]["game_id"]
+            by_color = {m["color"]: clients[name] for name, m in matched.items()}
+            top = await _top_games(clients.values())
+            for seq, (color, uci) in enumerate([("white", "e2e4"), ("black", "e7e5"), ("white", "g1f3")], 1):
+                by_color[color].send(type="make_move", game_id=game_id, **{"from": uci[:2], "to": uci[2:]})
+                updates = [await c.wait_for("game_update", seq=seq) for c in clients.values()]
+            by_color["black"].send(type="resign", game_id=game_id)
+            results = [(await c.wait_for("game_update", seq=4))["result"] for c in clients.values()]
+            top += await _top_games(clients.values())
+            for client in clients.values():
+                await client.disconnect()
+            return matched, updates, results, top, await a.cluster.backend.get_game_owner(game_id)
+
+    matched, updates, results, top, game_owner = asyncio.run(run())
+    assert game_owner == owner
+    assert {m["color"] for m in matched.values()} == {"white", "black"}
+    assert matched["a"]["game_id"] == matched["b"]["game_id"]
+    assert updates[0] == updates[1] and updates[0]["san"] == "Nf3"
+    assert results == ["1-0", "1-0"]
+    # «Топ партий» общий: живая партия видна с обоих воркеров, завершённая пропадает у обоих
+    assert top == [[matched["a"]["game_id"]]] * 2 + [[]] * 2
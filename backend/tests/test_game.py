@@ -0,0 +1,45 @@
+from app.pairing import apply_move, get_game
+
+
+def _play(g, ucis: list[str]) -> dict | None:
+    update = None
+    for i, uci in enumerate(ucis):
+        user_id = g.white_id if (g.ply % 2 == 0) else g.black_id
+        update = apply_move(g.id, user_id, uci[:2], uci[2:4], uci[4:] or None)
+        assert update is not None, f"move {i} {uci} rejected"
+    return update
+
+
+def test_threefold_repetition_is_a_draw(new_game):
+    g = new_game()
+    shuffle = ["g1f3", "g8f6", "f3g1", "f6g8"]
+    update = _play(g, shuffle)
+    assert update["result"] is None
+    update = _play(g, shuffle)
+    # Начальная позиция встретилась в третий раз
+    assert update["result"] == "1/2-1/2"
+    assert g.result == "1/2-1/2" and g.ply == 8
+
+
+def test_irreversible_move_resets_repetition_count(new_game):
+    g = new_game()
+    _play(g, ["g1f3", "g8f6", "f3g1", "f6g8", "e2e4"])
+    assert g.position_counts == {g.key: 1}
+    update = _play(g, ["e7e5", "g1f3", "g8f6", "f3g1", "f6g8", "g1f3", "g8f6", "f3g1"])
+    assert update["result"] is None
+    assert _play(g, ["f6g8"])["result"] == "1/2-1/2"
+
+
+def test_live_board_matches_replayed_moves(new_game):
+    g = new_game()
+    _play(g, ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5"])
+    assert g.fen == "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"
+    assert [m["san"] for m in g.move_list()] == ["e4", "e5", "Nf3", "Nc6", "Bb5"]
+    assert get_game(g.id) is g
+
+
+def test_illegal_or_out_of_turn_move_is_rejected(new_game):
+    g = new_game()
+    assert apply_move(g.id, g.black_id, "e7", "e5") is None
+    assert apply_move(g.id, g.white_id, "e2", "e5") is None
+    assert g.ply == 0
@@ -0,0 +1,42 @@
+from app import pairing
+from app.pairing import apply_move, game_state_payload, resign_game
+
+OPENING = ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6"]
+
+
+def _play(g, ucis: list[str]) -> list[dict]:
+    updates = []
+    for uci in ucis:
+        user_id = g.white_id if g.ply % 2 == 0 else g.black_id
+        updates.append(apply_move(g.id, user_id, uci[:2], uci[2:4]))
+    return updates
+
+
+def test_every_update_gets_the_next_seq(new_game):
+    g = new_game()
+    updates = _play(g, OPENING)
+    assert [u["seq"] for u in updates] == list(range(1, len(OPENING) + 1))
+    assert resign_game(g.id, g.white_id)["seq"] == len(OPENING) + 1
+
+
+def test_delta_carries_only_missing_moves(new_game):
+    g = new_game()
+    _play(g, OPENING)
+    delta = game_state_payload(g, since=4)
+    assert delta["type"] == "game_delta" and delta["since"] == 4
+    assert [m["san"] for m in delta["moves"]] == ["Bb5", "a6"]
+    assert delta["fen"] == g.fen and delta["seq"] == g.seq
+    # Клиент в курсе всех ходов — дельта пустая
+    assert game_state_payload(g, since=g.ply)["moves"] == []
+
+
+def test_full_state_without_since_or_when_too_far_behind(new_game, monkeypatch):
+    monkeypatch.setattr(pairing, "DELTA_MAX_MOVES", 4)
+    g = new_game()
+    _play(g, OPENING)
+    full = game_state_payload(g)
+    assert full["type"] == "game_state" and len(full["moves"]) == len(OPENING)
+    for since in (-1, g.ply + 1):
+        assert game_state_payload(g, since=since)["type"] == "game_state"
+    assert game_state_payload(g, since=1)["type"] == "game_state"
+    assert game_state_payload(g, since=2)["type"] == "game_delta"
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app import history
+from app.history import decode_cursor, encode_cursor, export_pgn, game_record, history_page
+from app.persistence import FinishedGame, SqliteRepository, WriteBatch, persistence
+
+
+def _games(n: int) -> WriteBatch:
+    """n завершённых партий alice: каждая вторая — белыми; у двух пар одинаковый finished_at."""
+    batch = WriteBatch()
+    for i in range(n):
+        game_id = f"g{i:02d}"
+        white, black = ("alice", f"opp{i}") if i % 2 == 0 else (f"opp{i}", "alice")
+        batch.games.append((game_id, "3+0", white, black, white, black, 180_000, 180_000, "", 1000.0 + i))
+        batch.moves += [(game_id, 0, "e2e4", 100, 180_000, 180_000), (game_id, 1, "e7e5", 100, 180_000, 179_900)]
+        batch.results.append(("1-0", 180_000, 179_900, 2000.0 + i // 2, game_id))
+    return batch
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    repo = SqliteRepository(":memory:")
+    asyncio.run(repo.open())
+    monkeypatch.setattr(persistence, "repo", repo)
+    yield repo
+    asyncio.run(repo.close())
+
+
+def test_cursor_round_trip():
+    g = FinishedGame("id:with:colons", "3+0", "w", "b", "", "", "1-0", 1.0, 1712345678.123456)
+    assert decode_cursor(encode_cursor(g)) == (1712345678.123456, "id:with:colons")
+    for junk in ("", "@@@", "bm9jb2xvbg", "YWJjOmlk", "__8"):  # без ":", "abc:id", не UTF-8
+        with pytest.raises(ValueError):
+            decode_cursor(junk)
+
+
+def test_pages_cover_history_once_newest_first(repo):
+    asyncio.run(repo.write(_games(7)))
+
+    async def all_pages() -> list[list[str]]:
+        pages, cursor = [], None
+        while True:
+            page = await history_page("alice", cursor, limit=3)
+            pages.append([g["game_id"] for g in page["games"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    pages = asyncio.run(all_pages())
+    # Партии с одинаковым finished_at упорядочены по id и не теряются на границе страниц
+    assert pages == [["g06", "g05", "g04"], ["g03", "g02", "g01"], ["g00"]]
+    assert asyncio.run(history_page("nobody")) == {"games": [], "next_cursor": None}
+
+
+def test_game_record_and_pgn_export(repo, monkeypatch):
+    asyncio.run(repo.write(_games(3)))
+    record = asyncio.run(game_record("g01"))
+    assert [m["san"] for m in record["moves"]] == ["e4", "e5"]
+    assert record["moves"][1]["black_remaining_ms"] == 179_900
+    assert asyncio.run(game_record("missing")) is None
+
+    monkeypatch.setattr(history, "EXPORT_PAGE_SIZE", 2)
+
+    async def export() -> list[str]:
+        return [pgn async for pgn in export_pgn("alice")]
+
+    pgns = asyncio.run(export())
+    assert [p.count("[Event ") for p in pgns] == [1, 1, 1]
+    assert '[White "opp1"]' in pgns[1]
+    assert "1. e4 {[%clk 0:03:00]} e5 {[%clk 0:02:59]} 1-0" in pgns[0]
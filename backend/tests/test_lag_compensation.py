@@ -0,0 +1,46 @@
+import time
+
+from app.pairing import LAG_COMPENSATION_MAX_MS, apply_move, flag_game
+
+
+def _black_to_move_late(g, remaining_ms: int, late_ms: int) -> None:
+    """Белые походили; у чёрных remaining_ms, а их ход придёт на late_ms позже."""
+    apply_move(g.id, g.white_id, "e2", "e4")
+    g.black_remaining_ms = remaining_ms
+    g.last_clock_at = time.monotonic() - (remaining_ms + late_ms) / 1000
+
+
+def test_lag_allowance_saves_a_late_move(new_game):
+    g = new_game()
+    _black_to_move_late(g, 100, 50)
+    update = apply_move(g.id, g.black_id, "e7", "e5", lag_ms=150)
+    assert update["result"] is None
+    # Прошло 150 мс, из них 150 — поправка на сеть: списано только время самого теста
+    assert 0 < update["black_remaining_ms"] <= 100
+    assert g.black_lag_ms == 150
+
+
+def test_move_after_deadline_without_allowance_flags(new_game):
+    g = new_game()
+    _black_to_move_late(g, 100, 50)
+    update = apply_move(g.id, g.black_id, "e7", "e5")
+    assert update["result"] == "1-0" and update["black_remaining_ms"] == 0 and g.ply == 1
+
+
+def test_allowance_is_capped(new_game):
+    g = new_game()
+    _black_to_move_late(g, 100, LAG_COMPENSATION_MAX_MS + 50)
+    update = apply_move(g.id, g.black_id, "e7", "e5", lag_ms=LAG_COMPENSATION_MAX_MS * 10)
+    assert update["result"] == "1-0" and g.black_lag_ms == LAG_COMPENSATION_MAX_MS
+
+
+def test_clock_timer_waits_for_the_allowance(new_game):
+    g = new_game()
+    apply_move(g.id, g.white_id, "e2", "e4")
+    apply_move(g.id, g.black_id, "e7", "e5", lag_ms=200)
+    apply_move(g.id, g.white_id, "g1", "f3")
+    g.last_clock_at = time.monotonic() - (g.black_remaining_ms + 100) / 1000
+    # Время чёрных формально вышло, но поправка на их сеть ещё не истекла
+    assert flag_game(g.id) is None and g.result is None
+    g.last_clock_at -= 0.2
+    assert flag_game(g.id)["result"] == "1-0"
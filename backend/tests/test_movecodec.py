@@ -0,0 +1,79 @@
+import uuid
+from array import array
+
+import chess
+import pytest
+
+from app.movecodec import (
+    bytes_to_codes,
+    codes_to_bytes,
+    decode_moves_frame,
+    decode_varints,
+    encode_moves_frame,
+    encode_varints,
+    pack_move,
+    pack_moves,
+    skip_varints,
+    unpack_move,
+    unpack_moves,
+)
+from app.pairing import apply_move, game_moves_frame
+
+
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 300, 16_383, 16_384, 2**32 - 1]
+    data = encode_varints(values)
+    assert decode_varints(data) == values
+    # Время хода до 16 с — не больше двух байт
+    assert len(encode_varints([15_999])) == 2
+    assert skip_varints(data, 4) == len(encode_varints(values[:4]))
+
+
+def test_packed_moves_round_trip_with_promotions():
+    moves = [chess.Move.from_uci(u) for u in ("e2e4", "a7a8q", "h2h1n", "e1g1", "b7c8r", "g2g1b")]
+    assert unpack_moves(pack_moves(moves)) == moves
+    assert all(pack_move(m) < 1 << 15 for m in moves)
+    assert unpack_move(pack_move(moves[1])).promotion == chess.QUEEN
+
+
+def test_codes_bytes_are_little_endian():
+    codes = array("H", [0x0102, 0xFFFF])
+    data = codes_to_bytes(codes)
+    assert data == b"\x02\x01\xff\xff"
+    assert bytes_to_codes(data) == codes
+
+
+def test_moves_frame_round_trip():
+    game_id = str(uuid.uuid4())
+    moves = [chess.Move.from_uci(u) for u in ("e2e4", "e7e5", "g1f3")]
+    codes = array("H", [pack_move(m) for m in moves])
+    frame = encode_moves_frame(game_id, 7, 1, codes, encode_varints([1200, 800, 20_000]), 170_000, 179_000, "0-1")
+    assert decode_moves_frame(frame) == {
+        "game_id": game_id,
+        "seq": 7,
+        "since": 1,
+        "moves": moves[1:],
+        "times_ms": [800, 20_000],
+        "white_remaining_ms": 170_000,
+        "black_remaining_ms": 179_000,
+        "result": "0-1",
+    }
+
+
+def test_unknown_frame_type_is_rejected():
+    frame = bytearray(encode_moves_frame(str(uuid.uuid4()), 0, 0, array("H"), b"", 0, 0, None))
+    frame[0] = 9
+    with pytest.raises(ValueError):
+        decode_moves_frame(bytes(frame))
+
+
+def test_game_frame_matches_game(new_game):
+    g = new_game()
+    for user_id, uci in ((g.white_id, "d2d4"), (g.black_id, "d7d5"), (g.white_id, "c2c4")):
+        apply_move(g.id, user_id, uci[:2], uci[2:4])
+    frame = decode_moves_frame(game_moves_frame(g, since=1))
+    assert [m.uci() for m in frame["moves"]] == ["d7d5", "c2c4"]
+    assert frame["times_ms"] == decode_varints(bytes(g.clock_deltas))[1:]
+    assert (frame["game_id"], frame["seq"], frame["result"]) == (g.id, g.seq, None)
+    # since за пределами партии — все ходы
+    assert decode_moves_frame(game_moves_frame(g, since=10))["since"] == 0
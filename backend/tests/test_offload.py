@@ -0,0 +1,101 @@
+import asyncio
+import threading
+
+import chess
+import pytest
+
+from app import pairing
+from app.offload import MoveOffload
+from app.pairing import apply_move, apply_move_async, resign_game, set_premove
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """analyze_move всегда в пуле потоков (кэш позиций выключен): запускать внутри цикла событий."""
+    offload = MoveOffload("thread", workers=2)
+    monkeypatch.setattr(pairing, "move_offload", offload)
+    monkeypatch.setattr(pairing.position_cache, "max_ply", -1)
+    yield offload
+    offload.stop()
+
+
+def _move(g, user_id: str, uci: str):
+    return apply_move_async(g.id, user_id, uci[:2], uci[2:4], uci[4:] or None)
+
+
+def _blocking_analyze(monkeypatch) -> tuple[threading.Event, threading.Event]:
+    """analyze_move в пуле ждёт release; entered — проверка уже в пуле."""
+    entered, release = threading.Event(), threading.Event()
+    analyze = pairing.analyze_move
+
+    def slow(board, move):
+        entered.set()
+        release.wait(2)
+        return analyze(board, move)
+
+    monkeypatch.setattr(pairing, "analyze_move", slow)
+    return entered, release
+
+
+def test_moves_of_one_game_are_applied_in_order(new_game, pool):
+    g = new_game()
+
+    async def run():
+        pool.start()
+        # Ход чёрных пришёл, пока ход белых ещё в пуле: он ждёт своей очереди, а не отклоняется
+        return await asyncio.gather(_move(g, g.white_id, "e2e4"), _move(g, g.black_id, "e7e5"))
+
+    white, black = asyncio.run(run())
+    assert (white["seq"], white["san"]) == (1, "e4")
+    assert (black["seq"], black["san"]) == (2, "e5")
+    assert g.ply == 2 and pool.offloaded == 2 and pool.stats()["in_flight_games"] == 0
+
+
+def test_pool_result_is_dropped_when_the_position_changed(new_game, pool, monkeypatch):
+    g = new_game()
+    entered, release = _blocking_analyze(monkeypatch)
+
+    async def run():
+        pool.start()
+        task = asyncio.ensure_future(_move(g, g.white_id, "e2e4"))
+        await asyncio.to_thread(entered.wait, 2)
+        # Пока ход считался, позиция сменилась мимо очереди партии
+        assert apply_move(g.id, g.white_id, "d2", "d4")["seq"] == 1
+        release.set()
+        return await task
+
+    assert asyncio.run(run()) is None
+    assert g.ply == 1 and g.seq == 1
+    assert g.board.piece_at(chess.D4) and not g.board.piece_at(chess.E4)
+
+
+def test_pool_result_is_dropped_when_the_game_ended(new_game, pool, monkeypatch):
+    g = new_game()
+    entered, release = _blocking_analyze(monkeypatch)
+
+    async def run():
+        pool.start()
+        task = asyncio.ensure_future(_move(g, g.white_id, "e2e4"))
+        await asyncio.to_thread(entered.wait, 2)
+        assert resign_game(g.id, g.black_id)["result"] == "1-0"
+        release.set()
+        return await task
+
+    assert asyncio.run(run()) is None
+    assert g.ply == 0 and g.result == "1-0"
+
+
+def test_premove_fires_after_an_offloaded_move(new_game, pool):
+    g = new_game()
+
+    async def run():
+        pool.start()
+        await _move(g, g.white_id, "e2e4")
+        assert set_premove(g, g.white_id, "g1", "f3")
+        return await _move(g, g.black_id, "e7e5")
+
+    update = asyncio.run(run())
+    assert (update["san"], update["premove"]["san"]) == ("e5", "Nf3")
+    assert update["seq"] == 3 and g.ply == 3 and g.premoves == {}
+    # Оба хода и премув проверены в пуле
+    assert pool.offloaded == 3
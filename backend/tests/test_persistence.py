@@ -0,0 +1,116 @@
+import asyncio
+
+from app.persistence import ISOLATE_PROBE, WriteBatch, WriteBehind
+
+
+class FakeRepo:
+    """Хранилище, которое не пишет пачки с ядовитыми пользователями (или ничего, если down)."""
+
+    def __init__(self, poison: set[str] = frozenset()):
+        self.poison = poison
+        self.down = False
+        self.users: list[str] = []
+
+    async def write(self, batch: WriteBatch) -> None:
+        if self.down or any(user_id in self.poison for user_id, *_ in batch.users):
+            raise RuntimeError("constraint failed")
+        self.users.extend(user_id for user_id, *_ in batch.users)
+
+
+def _flush(wb: WriteBehind, times: int) -> None:
+    async def run():
+        for _ in range(times):
+            await wb.flush()
+
+    asyncio.run(run())
+
+
+def test_poison_row_is_discarded_after_retries():
+    repo = FakeRepo(poison={"bad"})
+    wb = WriteBehind(repo, max_retries=3)
+    for user_id in ("a", "bad", "b"):
+        wb.record_user(user_id, 1, "")
+    _flush(wb, 2)
+    assert repo.users == [] and wb.pending == 3
+    _flush(wb, 1)
+    assert repo.users == ["a", "b"]
+    assert wb.discarded == 1 and wb.pending == 0
+    # Очередь больше не заблокирована
+    wb.record_user("c", 1, "")
+    _flush(wb, 1)
+    assert repo.users == ["a", "b", "c"]
+
+
+def test_outage_keeps_rows_queued():
+    repo = FakeRepo()
+    repo.down = True
+    wb = WriteBehind(repo, max_retries=2)
+    for i in range(ISOLATE_PROBE + 5):
+        wb.record_user(str(i), i, "")
+    _flush(wb, 6)
+    assert wb.discarded == 0 and wb.pending == ISOLATE_PROBE + 5
+    repo.down = False
+    _flush(wb, 1)
+    assert repo.users == [str(i) for i in range(ISOLATE_PROBE + 5)]
+
+
+def test_requeued_rows_keep_order_before_new_ones():
+    repo = FakeRepo()
+    repo.down = True
+    wb = WriteBehind(repo, max_retries=10)
+    wb.record_user("a", 1, "")
+    _flush(wb, 1)
+    wb.record_user("b", 2, "")
+    repo.down = False
+    _flush(wb, 1)
+    assert repo.users == ["a", "b"]
+
+
+def test_unfinished_game_survives_a_restart_on_sqlite(tmp_path, new_game, monkeypatch):
+    from app import pairing
+    from app.pairing import apply_move, recover_games, resign_game
+    from app.persistence import SqliteRepository
+
+    path = str(tmp_path / "games.db")
+    monkeypatch.setattr(pairing.cluster, "worker_id", "w1")
+
+    async def play():
+        wb = WriteBehind(SqliteRepository(path), flush_interval_s=0.01)
+        monkeypatch.setattr(pairing, "persistence", wb)
+        await wb.open()
+        wb.start()
+        g = new_game()
+        for uci, user_id in (("e2e4", g.white_id), ("e7e5", g.black_id), ("g1f3", g.white_id)):
+            assert apply_move(g.id, user_id, uci[:2], uci[2:4])
+        finished = new_game()
+        resign_game(finished.id, finished.white_id)
+        # Пачки уходят в фоне, без явного flush
+        await asyncio.sleep(0.1)
+        assert wb.pending == 0 and wb.batches > 0
+        await wb.close()
+        return g
+
+    g = asyncio.run(play())
+    expected = (g.fen, g.white_remaining_ms, g.black_remaining_ms, g.seq, g.ply)
+    # Рестарт: в памяти воркера партии больше нет
+    pairing.store.remove(g.id)
+    pairing.clocks.cancel(g.id)
+    for user_id in (g.white_id, g.black_id):
+        pairing._live_by_user.pop(user_id, None)
+
+    async def restart():
+        repo = SqliteRepository(path)
+        await repo.open()
+        try:
+            return await repo.load_unfinished("w1")
+        finally:
+            await repo.close()
+
+    stored = asyncio.run(restart())
+    assert [s.id for s in stored] == [g.id]
+    (recovered,) = recover_games(stored)
+    assert pairing.get_game(g.id) is recovered
+    assert (recovered.fen, recovered.white_remaining_ms, recovered.black_remaining_ms,
+            recovered.seq, recovered.ply) == expected
+    # Партия продолжается с того же места
+    assert apply_move(g.id, g.black_id, "b8", "c6")["seq"] == expected[3] + 1
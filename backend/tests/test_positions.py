@@ -0,0 +1,91 @@
+import random
+
+import chess
+import chess.polyglot
+from chess import Board
+
+from app.positions import OPENING_BOOK, PositionCache, analyze_move
+
+
+def _play(cache: PositionCache, ucis: list[str]) -> Board:
+    board = Board()
+    for ply, uci in enumerate(ucis):
+        assert cache.analyze(board, chess.polyglot.zobrist_hash(board), ply, chess.Move.from_uci(uci))
+    return board
+
+
+def test_position_is_cached_from_its_second_visit():
+    cache = PositionCache(max_size=10, max_ply=12)
+    _play(cache, ["e2e4"])
+    # Первая встреча позиции только помечает её ключ
+    assert (len(cache), cache.hits, cache.misses) == (0, 0, 1)
+    _play(cache, ["e2e4"])
+    assert (len(cache), cache.hits, cache.misses) == (1, 0, 2)
+    board = _play(cache, ["e2e4"])
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert board.fen() == "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+
+def test_least_recently_used_position_is_evicted():
+    cache = PositionCache(max_size=2, max_ply=12)
+    start = chess.polyglot.zobrist_hash(Board())
+    after_e4 = chess.polyglot.zobrist_hash(Board("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"))
+    for _ in range(2):
+        _play(cache, ["e2e4", "e7e5"])
+    assert list(cache._entries) == [start, after_e4]
+    _play(cache, ["e2e4"])  # начальная позиция — свежее позиции после e4
+    for _ in range(2):
+        _play(cache, ["d2d4"])
+        _play(cache, ["d2d4", "d7d5"])
+    assert len(cache) == 2 and start in cache._entries and after_e4 not in cache._entries
+    # Вытесненная позиция снова считается заново
+    hits = cache.hits
+    _play(cache, ["e2e4", "e7e5"])
+    assert cache.hits == hits + 1
+
+
+def test_positions_after_max_ply_are_not_cached():
+    cache = PositionCache(max_size=10, max_ply=1)
+    line = ["e2e4", "e7e5", "g1f3", "b8c6"]
+    for _ in range(3):
+        _play(cache, line)
+    # Ходы с ply 0 и 1 — через кэш, дальше — мимо него
+    assert len(cache) == 2 and cache.hits + cache.misses == 6
+    assert PositionCache(max_size=0).max_ply == -1
+
+
+def test_illegal_move_is_not_cached_and_leaves_the_board():
+    cache = PositionCache(max_size=10, max_ply=12)
+    for _ in range(3):
+        board = Board()
+        assert cache.analyze(board, chess.polyglot.zobrist_hash(board), 0, chess.Move.from_uci("e2e5")) is None
+        assert board == Board()
+    assert all(moves == {} for moves in cache._entries.values())
+
+
+def test_cached_result_matches_a_fresh_analysis():
+    cache = PositionCache(max_size=10_000, max_ply=12)
+    cache.warm()
+    rng = random.Random(7)
+    # Дебютные линии и случайные партии из тех же начальных позиций: всё, что кэш отдаёт,
+    # совпадает с честным analyze_move, включая ключ (коллизия ключей дала бы чужую позицию)
+    lines: list[list[chess.Move]] = [[] for _ in range(60)]
+    for i, line in enumerate(lines):
+        board = Board()
+        if i < len(OPENING_BOOK):
+            for san in OPENING_BOOK[i].split()[:4]:
+                line.append(board.push_san(san))
+        while len(line) < 14 and not board.is_game_over():
+            move = rng.choice(list(board.legal_moves))
+            board.push(move)
+            line.append(move)
+    # Третий проход — случайные позиции тоже уже в кэше
+    for _ in range(3):
+        for line in lines:
+            board = Board()
+            for ply, move in enumerate(line):
+                fresh = analyze_move(board.copy(stack=False), move)
+                a = cache.analyze(board, chess.polyglot.zobrist_hash(board), ply, move)
+                assert (a.san, a.key, a.outcome) == (fresh.san, fresh.key, fresh.outcome)
+                assert a.board.fen() == fresh.board.fen() and a.key == chess.polyglot.zobrist_hash(board)
+    assert cache.hits > cache.misses
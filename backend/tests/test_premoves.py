@@ -0,0 +1,51 @@
+from app.pairing import PREMOVE_MS, apply_move, game_state_payload, set_premove
+
+
+def _move(g, user_id: str, uci: str) -> dict | None:
+    return apply_move(g.id, user_id, uci[:2], uci[2:4], uci[4:] or None)
+
+
+def test_premove_is_applied_with_the_opponents_move(new_game):
+    g = new_game()
+    assert _move(g, g.white_id, "e2e4")["seq"] == 1
+    assert set_premove(g, g.white_id, "g1", "f3")
+    update = _move(g, g.black_id, "e7e5")
+    # Один game_update на оба хода: позиция и seq — после премува
+    assert update["seq"] == 3 and g.seq == 3 and g.ply == 3
+    assert (update["san"], update["from"], update["to"]) == ("e5", "e7", "e5")
+    assert update["premove"] == {"san": "Nf3", "move_time_ms": PREMOVE_MS, "from": "g1", "to": "f3"}
+    assert update["fen"] == g.fen
+    assert g.premoves == {}
+    # Клиент, пропустивший update, получает оба хода дельтой
+    assert [m["san"] for m in game_state_payload(g, since=1)["moves"]] == ["e5", "Nf3"]
+
+
+def test_illegal_premove_is_rejected_after_the_opponents_move(new_game):
+    g = new_game()
+    _move(g, g.white_id, "e2e4")
+    assert set_premove(g, g.white_id, "e4", "e5")
+    update = _move(g, g.black_id, "e7e5")
+    assert update["premove"] == {"rejected": True}
+    assert update["seq"] == 2 and g.ply == 2 and g.premoves == {}
+    # Ход по-прежнему за белыми
+    assert _move(g, g.white_id, "g1f3")["seq"] == 3
+
+
+def test_premove_only_while_waiting_and_can_be_cancelled(new_game):
+    g = new_game()
+    assert not set_premove(g, g.white_id, "e2", "e4")
+    assert set_premove(g, g.black_id, "e7", "e5")
+    assert set_premove(g, g.black_id, None, None) and g.premoves == {}
+    assert not set_premove(g, g.black_id, "e7", "zz")
+    update = _move(g, g.white_id, "e2e4")
+    assert "premove" not in update and update["seq"] == 1
+
+
+def test_premove_that_mates_finishes_the_game(new_game):
+    g = new_game()
+    _move(g, g.white_id, "f2f3")
+    _move(g, g.black_id, "e7e5")
+    assert set_premove(g, g.black_id, "d8", "h4")
+    update = _move(g, g.white_id, "g2g4")
+    assert update["premove"]["san"] == "Qh4#"
+    assert update["result"] == g.result == "0-1" and g.ply == 4
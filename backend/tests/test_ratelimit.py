@@ -0,0 +1,72 @@
+import json
+
+from app.ratelimit import CLOSE_TOO_BIG, OTHER, RATE_POLICY, MessageGuard
+
+
+def _msg(msg_type: str, **fields) -> str:
+    return json.dumps({"type": msg_type, **fields})
+
+
+def test_per_type_bucket_refills_over_time():
+    guard = MessageGuard()
+    limiter = guard.limiter(0.0)
+    rate, capacity = RATE_POLICY["join_queue"]
+    admitted = [limiter.admit(_msg("join_queue"), 0.0) for _ in range(int(capacity) + 1)]
+    assert admitted == ["join_queue"] * int(capacity) + [None]
+    # Другой тип — свой bucket
+    assert limiter.admit(_msg("make_move"), 0.0) == "make_move"
+    assert limiter.admit(_msg("join_queue"), 1 / rate) == "join_queue"
+    assert guard.dropped == {"join_queue": 1}
+
+
+def test_total_bucket_limits_all_types_together():
+    guard = MessageGuard(rate=1, burst=3)
+    limiter = guard.limiter(0.0)
+    admitted = [limiter.admit(_msg(t), 0.0) for t in ("make_move", "premove", "resign", "make_move")]
+    assert admitted == ["make_move", "premove", "resign", None]
+
+
+def test_dropped_reasons_are_bounded():
+    guard = MessageGuard(rate=1, burst=5, strikes=1000)
+    limiter = guard.limiter(0.0)
+    # Часть отбрасывает общий bucket, часть — bucket OTHER
+    for i in range(50):
+        limiter.admit(_msg("spam_" + "x" * (i % 20)), 0.0)
+    limiter.admit('{"kind": "make_move"}', 0.0)
+    # Произвольные типы клиента не становятся ключами счётчиков
+    assert set(guard.dropped) <= {OTHER, "malformed"}
+    assert guard.dropped["malformed"] == 1
+
+
+def test_oversized_message_closes_immediately():
+    guard = MessageGuard(max_bytes=100)
+    limiter = guard.limiter(0.0)
+    assert limiter.admit(_msg("make_move", pad="x" * 200), 0.0) is None
+    assert limiter.abusive and limiter.close_code == CLOSE_TOO_BIG
+
+
+def test_size_limit_counts_utf8_bytes():
+    guard = MessageGuard(max_bytes=100)
+    # 50 символов кириллицы — 100 байт: ровно на лимите
+    assert guard.limiter(0.0).check_size("я" * 50)
+    # 60 символов — меньше лимита, но 120 байт
+    limiter = guard.limiter(0.0)
+    assert not limiter.check_size("я" * 60)
+    assert limiter.close_code == CLOSE_TOO_BIG and guard.dropped["oversized"] == 1
+    assert guard.limiter(0.0).check_size("x" * 100)
+
+
+def test_flooder_runs_out_of_strikes():
+    guard = MessageGuard(strikes=5, strike_refill=0)
+    limiter = guard.limiter(0.0)
+    capacity = int(RATE_POLICY["resign"][1])
+    for _ in range(capacity + 5):
+        limiter.admit(_msg("resign"), 0.0)
+    assert not limiter.abusive
+    limiter.admit(_msg("resign"), 0.0)
+    assert limiter.abusive
+
+
+def test_disabled_guard_admits_everything():
+    limiter = MessageGuard(enabled=False).limiter(0.0)
+    assert all(limiter.admit(_msg("resign"), 0.0) == "resign" for _ in range(100))
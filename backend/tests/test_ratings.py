@@ -0,0 +1,74 @@
+import asyncio
+
+from app import ratings as ratings_module
+from app.constants import DEFAULT_RATING
+from app.persistence import SqliteRepository, WriteBatch
+from app.ratings import Ratings, audit, elo_delta
+
+RESULTS = [
+    ("3+0", "a", "b", "1-0"),
+    ("3+0", "b", "c", "1/2-1/2"),
+    ("10+0", "a", "c", "0-1"),
+    ("5+0", "c", "a", "1-0"),
+    ("3+0", "a", "a", "1-0"),  # сам с собой — не рейтинговая
+]
+
+
+def test_elo_delta():
+    assert elo_delta(1500, 1500, 1.0, 20) == 10
+    assert elo_delta(1500, 1500, 0.5, 20) == 0
+    # Победа над намного более слабым почти ничего не даёт
+    assert elo_delta(2000, 1200, 1.0, 20) == 0
+    assert elo_delta(1200, 2000, 1.0, 20) == 20
+
+
+def test_record_is_zero_sum_per_pool():
+    r = Ratings(k=20)
+    changes = [r.record(*row) for row in RESULTS]
+    assert changes[0] == {"a": (1510, 10), "b": (1490, -10)}
+    assert changes[-1] == {} and r.rated_games == 4
+    blitz = r.pools["blitz"]
+    assert sum(rating for _, rating in blitz.items()) == DEFAULT_RATING * len(blitz)
+    assert r.user("a")["rapid"] == {"rating": 1490, "rank": 2, "players": 2}
+    assert r.user("nobody")["blitz"] == {"rating": DEFAULT_RATING, "rank": None, "players": 3}
+
+
+def test_rank_and_leaderboard_share_places_on_ties():
+    r = Ratings()
+    r.load([("a", "alice", {"blitz": 1600}), ("b", "bob", {"blitz": 1700}), ("c", "", {"blitz": 1600})])
+    assert [r.pools["blitz"].rank(u) for u in "bac"] == [1, 2, 2]
+    board = r.leaderboard("blitz", 3)
+    assert [(e["user_id"], e["username"], e["rank"]) for e in board] == [("b", "bob", 1), ("a", "alice", 2), ("c", "", 2)]
+    r.apply("blitz", {"c": 1800})
+    assert r.pools["blitz"].top(1) == [("c", 1800)] and r.pools["blitz"].rank("a") == 3
+
+
+def test_audit_matches_incremental_ratings_and_repairs_drift(monkeypatch):
+    monkeypatch.setattr(ratings_module, "RECOMPUTE_PAGE_SIZE", 2)
+    r = Ratings(k=20)
+    batch = WriteBatch()
+    for user_id in "abc":
+        batch.users.append((user_id, ord(user_id), user_id, 1.0))
+    for i, (tc, white, black, result) in enumerate(RESULTS):
+        game_id = f"g{i}"
+        batch.games.append((game_id, tc, white, black, white, black, 0, 0, "", 1.0))
+        batch.results.append((result, 0, 0, 100.0 + i, game_id))
+        for user_id, (rating, _) in r.record(tc, white, black, result).items():
+            batch.ratings.append((ratings_module.POOL_OF[tc], rating, user_id))
+
+    async def run():
+        repo = SqliteRepository(":memory:")
+        await repo.open()
+        await repo.write(batch)
+        clean = await audit(repo, k=20)
+        await repo.write(WriteBatch(ratings=[("blitz", 1400, "a"), ("rapid", 1550, "b")]))
+        drift = await audit(repo, k=20, apply=True)
+        repaired = await audit(repo, k=20)
+        await repo.close()
+        return clean, drift, repaired
+
+    clean, drift, repaired = asyncio.run(run())
+    assert clean == {"games": 4, "mismatched": 0, "max_diff": 0, "applied": False}
+    # b не играл в rapid: его рейтинг там возвращается к стартовому
+    assert drift["mismatched"] == 2 and drift["max_diff"] == r.pools["blitz"].get("a") - 1400
+    assert repaired["mismatched"] == 0
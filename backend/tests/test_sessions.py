@@ -0,0 +1,170 @@
+import asyncio
+import uuid
+
+from conftest import FakeClient, running
+
+from app.sessions import ResumeTokens, _b64, _unb64
+from app.ws_manager import WSManager
+
+NOW = 1_700_000_000
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent: list[str | bytes] = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(text)
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def test_token_round_trip():
+    tokens = ResumeTokens(b"secret", ttl_s=60)
+    token = tokens.issue(42, "alice:bob", NOW, auth_date=NOW - 5)
+    # В имени пользователя может быть двоеточие
+    assert tokens.verify(token, NOW + 60) == {"id": 42, "username": "alice:bob", "auth_date": NOW - 5}
+
+
+def test_reissued_tokens_do_not_outlive_auth_max_age():
+    tokens = ResumeTokens(b"secret", ttl_s=600, max_age_s=1000)
+    token = tokens.issue(42, "alice", NOW)
+    now = NOW
+    # Каждое возобновление выдаёт новый токен с тем же auth_date
+    for _ in range(3):
+        now += 300
+        user = tokens.verify(token, now)
+        assert user["auth_date"] == NOW
+        token = tokens.issue(user["id"], user["username"], now, user["auth_date"])
+    assert tokens.verify(token, NOW + 1000) is not None
+    assert tokens.verify(token, NOW + 1001) is None
+
+
+def test_expired_token_is_rejected():
+    tokens = ResumeTokens(b"secret", ttl_s=60)
+    assert tokens.verify(tokens.issue(42, "alice", NOW), NOW + 61) is None
+    assert tokens.stats() == {"issued": 1, "accepted": 0, "rejected": 1}
+
+
+def test_tampered_or_foreign_token_is_rejected():
+    tokens = ResumeTokens(b"secret", ttl_s=60)
+    body, sig = tokens.issue(42, "alice", NOW).split(".")
+    forged = _b64(_unb64(body).replace(b"42", b"43"))
+    assert tokens.verify(f"{forged}.{sig}", NOW) is None
+    assert ResumeTokens(b"other", ttl_s=60).verify(f"{body}.{sig}", NOW) is None
+    for junk in ("", "no-dot", "a.b.c", "!!!.???"):
+        assert tokens.verify(junk, NOW) is None
+
+
+def test_parked_session_replays_missed_messages():
+    async def run():
+        manager = WSManager(resume_buffer_max=2)
+        await manager.connect(FakeWebSocket(), "u", 1, "alice")
+        assert manager.park("u")
+        await manager.send_encoded("u", "game_update", "m1")
+        await manager.send_encoded("u", "queue_counts", "counts")
+        await manager.send_encoded("u", "game_update", "m2")
+        ws = FakeWebSocket()
+        parked = await manager.connect(ws, "u", 1, "alice")
+        replayed = manager.replay("u", parked)
+        await asyncio.sleep(0)
+        return manager, ws, parked, replayed
+
+    manager, ws, parked, replayed = asyncio.run(run())
+    # queue_counts не копится: при входе шлётся свежий
+    assert replayed == 2 and ws.sent == ["m1", "m2"]
+    assert parked.username == "alice" and manager.resumed == 1
+
+
+def test_parked_buffer_overflow_drops_messages():
+    async def run():
+        manager = WSManager(resume_buffer_max=2)
+        await manager.connect(FakeWebSocket(), "u", 1, "")
+        manager.park("u")
+        for i in range(3):
+            await manager.send_encoded("u", "game_update", str(i))
+        return await manager.connect(FakeWebSocket(), "u", 1, "")
+
+    parked = asyncio.run(run())
+    # Клиент докачает партию через subscribe_game
+    assert parked.overflowed and parked.messages == []
+
+
+def test_drop_parked_ends_the_window():
+    async def run():
+        manager = WSManager()
+        await manager.connect(FakeWebSocket(), "u", 1, "")
+        manager.park("u")
+        assert manager.drop_parked("u") and not manager.drop_parked("u")
+        return await manager.connect(FakeWebSocket(), "u", 1, "")
+
+    assert asyncio.run(run()) is None
+
+
+def test_resume_on_another_worker_gets_buffered_and_new_updates(workers):
+    a, b = workers
+
+    async def run():
+        handed_over = a.manager.handed_over
+        async with running(a, b, matchmaking=True):
+            clients, tokens, colors = {}, {}, {}
+            for _ in range(2):
+                uid = uuid.uuid4().int % 10**12
+                clients[uid] = client = FakeClient()
+                client.connect(a, debug_uid=uid)
+                tokens[uid] = (await client.wait_for("session"))["resume_token"]
+                client.send(type="join_queue", time_control="3+0")
+            for uid, client in clients.items():
+                matched = await client.wait_for("matched")
+                colors[matched["color"]] = uid
+            game_id = matched["game_id"]
+            white, black_uid = clients[colors["white"]], colors["black"]
+
+            await clients[black_uid].disconnect()
+            white.send(type="make_move", game_id=game_id, **{"from": "e2", "to": "e4"})
+            await white.wait_for("game_update", seq=1)
+            assert a.manager.stats()["parked"] == 1
+
+            black = FakeClient()
+            black.connect(b, resume_token=tokens[black_uid])
+            await black.wait_for("session", resumed=False)
+            # Накопленное на воркере a переслано на b
+            await black.wait_for("game_update", seq=1)
+            black.send(type="make_move", game_id=game_id, **{"from": "e7", "to": "e5"})
+            for client in (white, black):
+                await client.wait_for("game_update", seq=2)
+            black.send(type="subscribe_game", game_id=game_id, since=1)
+            delta = await black.wait_for("game_delta")
+            # Окно переподключения на a истекает, но партия за вернувшегося не сдаётся
+            await a._end_session(str(black_uid))
+            for client in (white, black):
+                await client.disconnect()
+            return delta, a.get_game(game_id), a.manager.handed_over - handed_over
+
+    delta, g, handed_over = asyncio.run(run())
+    assert [m["san"] for m in delta["moves"]] == ["e5"]
+    assert g.result is None and g.ply == 2 and handed_over == 1
+
+
+def test_disconnect_leaves_queues_at_once(workers):
+    a, _ = workers
+
+    async def run():
+        async with running(a):
+            uid = uuid.uuid4().int % 10**12
+            client = FakeClient()
+            client.connect(a, debug_uid=uid)
+            await client.wait_for("session")
+            client.send(type="join_queue", time_control="5+0")
+            for _ in range(100):
+                if str(uid) in await a.cluster.backend.queue_entries():
+                    break
+                await asyncio.sleep(0.01)
+            await client.disconnect()
+            await asyncio.sleep(0.05)
+            return await a.cluster.backend.queue_entries(), a.manager.stats()["parked"], a.waiting_counts()["5+0"]
+
+    entries, parked, waiting = asyncio.run(run())
+    # Сессия в окне переподключения, но свести офлайн-игрока уже не с кем
+    assert entries == {} and parked >= 1 and waiting == 0
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # Lua-скрипты в fakeredis
+
+from app import state_backend  # noqa: E402
+from app.state_backend import InMemoryBackend, RedisBackend  # noqa: E402
+
+
+@pytest.fixture
+def redis_pair(monkeypatch):
+    """Два воркера с RedisBackend над одним (поддельным) сервером Redis."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        state_backend.redis_asyncio, "from_url", lambda url: fakeredis.aioredis.FakeRedis(server=server)
+    )
+    return RedisBackend("redis://test"), RedisBackend("redis://test")
+
+
+def test_leader_lease_held_and_renewed(redis_pair):
+    a, b = redis_pair
+
+    async def run():
+        assert await a.acquire_leader("mm", "a", 1.0)
+        assert not await b.acquire_leader("mm", "b", 1.0)
+        # Продление владельцем сдвигает срок
+        assert await a.acquire_leader("mm", "a", 60.0)
+        assert await a._redis.pttl("phonechess:leader:mm") > 1000
+
+    asyncio.run(run())
+
+
+def test_expired_lease_is_not_renewed_by_old_leader(redis_pair):
+    a, b = redis_pair
+
+    async def run():
+        assert await a.acquire_leader("mm", "a", 0.05)
+        await asyncio.sleep(0.1)
+        assert await b.acquire_leader("mm", "b", 60.0)
+        # Прежний лидер не продлевает и не перехватывает чужую аренду
+        assert not await a.acquire_leader("mm", "a", 0.05)
+        assert await a._redis.get("phonechess:leader:mm") == b"b"
+        assert await a._redis.pttl("phonechess:leader:mm") > 1000
+
+    asyncio.run(run())
+
+
+def test_leader_renewal_is_one_command(redis_pair, monkeypatch):
+    """Проверка владельца и продление — одна команда: между ними аренда не может смениться."""
+    a, _ = redis_pair
+    commands = []
+    execute = a._redis.execute_command
+
+    async def counting(*args, **kwargs):
+        commands.append(args[0])
+        return await execute(*args, **kwargs)
+
+    async def run():
+        assert await a.acquire_leader("mm", "a", 1.0)  # первый вызов ещё загружает скрипт
+        monkeypatch.setattr(a._redis, "execute_command", counting)
+        assert await a.acquire_leader("mm", "a", 1.0)
+
+    asyncio.run(run())
+    assert commands == ["EVALSHA"]
+
+
+def test_in_memory_leader_expires():
+    backend = InMemoryBackend()
+
+    async def run():
+        assert await backend.acquire_leader("mm", "a", 0.05)
+        assert not await backend.acquire_leader("mm", "b", 0.05)
+        await asyncio.sleep(0.1)
+        assert await backend.acquire_leader("mm", "b", 0.05)
+        assert not await backend.acquire_leader("mm", "a", 0.05)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", ["memory", "redis"])
+def test_top_games_are_shared_and_ordered(kind, redis_pair):
+    if kind == "memory":
+        a = b = InMemoryBackend()
+    else:
+        a, b = redis_pair
+
+    async def run():
+        await a.top_games_add("g1", 1500, {"time_control": "3+0"})
+        await b.top_games_add("g2", 1700, {"time_control": "5+0"})
+        await a.top_games_add("g3", 1600, {"time_control": "1+0"})
+        # Партии обоих воркеров в одном списке, по убыванию рейтинга
+        assert [e["game_id"] for e in await b.top_games(10)] == ["g2", "g3", "g1"]
+        assert await a.top_games(1) == [{"game_id": "g2", "rating": 1700, "time_control": "5+0"}]
+        # Завершённую партию убирает её воркер — пропадает у всех
+        await b.top_games_remove("g2")
+        await b.top_games_remove("missing")
+        assert [e["game_id"] for e in await a.top_games(10)] == ["g3", "g1"]
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+import time
+
+from app.pairing import Game, apply_move, get_game, resign_game
+from app.store import ArchivedGame, GameStore, store
+
+
+def _game(game_id: str) -> Game:
+    return Game(id=game_id, time_control_key="3+0", white_id="w", black_id="b", white_username="", black_username="")
+
+
+def test_finished_game_is_archived_and_restored(new_game):
+    g = new_game()
+    for user_id, uci in ((g.white_id, "e2e4"), (g.black_id, "e7e5"), (g.white_id, "d1h5")):
+        assert apply_move(g.id, user_id, uci[:2], uci[2:4]) is not None
+    resign_game(g.id, g.black_id)
+    fen, moves, seq = g.fen, g.move_list(), g.seq
+
+    store.sweep(time.monotonic() + store.grace_s + 1)
+    assert isinstance(store.get(g.id), ArchivedGame)
+    restored = get_game(g.id)
+    assert restored is not g
+    assert restored.result == "1-0" and restored.seq == seq
+    assert restored.fen == fen and restored.move_list() == moves
+    assert (restored.white_remaining_ms, restored.black_remaining_ms) == (g.white_remaining_ms, g.black_remaining_ms)
+
+
+def test_live_game_is_not_archived(new_game):
+    g = new_game()
+    store.sweep(time.monotonic() + store.grace_s + 1)
+    assert get_game(g.id) is g
+
+
+def test_archive_is_bounded_lru():
+    s = GameStore(grace_s=0, max_archived=2, archive_ttl_s=3600)
+    for game_id in "abc":
+        s.add(_game(game_id))
+        s.mark_finished(game_id)
+    now = time.monotonic()
+    # Партии ещё в грейс-периоде — остаются живыми
+    s.sweep(now - 1)
+    assert all(isinstance(s.get(game_id), Game) for game_id in "abc")
+    s.sweep(now)
+    assert s.get("a") is None and len(s) == 2
+    s.get("b")  # b — недавно запрошенная, вытесняется c
+    s.add(_game("d"))
+    s.mark_finished("d")
+    s.sweep(time.monotonic())
+    assert s.get("c") is None and isinstance(s.get("b"), ArchivedGame)
+
+
+def test_archive_expires_after_ttl():
+    s = GameStore(grace_s=0, max_archived=10, archive_ttl_s=60)
+    s.add(_game("a"))
+    s.mark_finished("a")
+    now = time.monotonic()
+    s.sweep(now)
+    s.sweep(now + 61)
+    assert s.get("a") is None and len(s) == 0
+
+
+def test_membership_does_not_touch_the_archive_lru():
+    s = GameStore(grace_s=0, max_archived=2, archive_ttl_s=3600)
+    for game_id in "ab":
+        s.add(_game(game_id))
+        s.mark_finished(game_id)
+    s.sweep(time.monotonic())
+    assert "a" in s and "x" not in s
+    assert s.get_live("a") is None
+    # Проверка членства не освежила "a": вытесняется она, а не "b"
+    s.add(_game("c"))
+    s.mark_finished("c")
+    s.sweep(time.monotonic())
+    assert "a" not in s and "b" in s
+
+
+def test_game_messages_do_not_restore_archived_games(new_game, monkeypatch):
+    import asyncio
+    import json
+
+    from app import pairing, ws_handlers
+
+    g = new_game()
+    resign_game(g.id, g.black_id)
+    store.sweep(time.monotonic() + store.grace_s + 1)
+    restored, forwarded = [], []
+    restore = pairing._restore
+    monkeypatch.setattr(pairing, "_restore", lambda a: restored.append(a.id) or restore(a))
+
+    async def forward(game_id, user_id, raw, lag_ms):
+        forwarded.append(game_id)
+
+    monkeypatch.setattr(ws_handlers.cluster, "forward_to_owner", forward)
+
+    async def send(msg_type: str, **fields) -> None:
+        raw = json.dumps({"type": msg_type, "game_id": g.id, **fields})
+        assert await ws_handlers.handle_ws_message(None, raw, g.white_id)
+
+    async def run():
+        await send("make_move", **{"from": "e2", "to": "e4"})
+        await send("premove", **{"from": "e2", "to": "e4"})
+        await send("resign")
+        assert restored == [] and forwarded == []
+        # Просмотр завершённой партии разворачивает архив — один раз на сообщение
+        await send("subscribe_game")
+        assert restored == [g.id]
+
+    asyncio.run(run())
+    assert isinstance(store.get(g.id), ArchivedGame)
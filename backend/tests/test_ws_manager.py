@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+from app.ws_manager import CLOSE_HEARTBEAT, RTT_SAMPLES, WSManager
+
+
+class FakeWebSocket:
+    """Сокет, который пишет в список; пока blocked не установлен — отправка висит."""
+
+    def __init__(self, blocked: bool = False):
+        self.sent: list[str | bytes] = []
+        self.closed_with: int | None = None
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    async def send_text(self, text: str) -> None:
+        await self.unblocked.wait()
+        self.sent.append(text)
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self.unblocked.wait()
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+
+async def _drain() -> None:
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_outbox_keeps_order_and_replaces_stale_queue_counts():
+    async def run():
+        manager = WSManager()
+        ws = FakeWebSocket(blocked=True)
+        await manager.connect(ws, "u", 1, "")
+        await manager.send_encoded("u", "game_update", "m1")
+        for i in range(3):
+            await manager.send_encoded("u", "queue_counts", f"counts{i}")
+        await manager.send_encoded("u", "game_update", b"m2")
+        ws.unblocked.set()
+        await _drain()
+        return ws, manager
+
+    ws, manager = asyncio.run(run())
+    # Очередь обгоняет только свежий queue_counts, прежние два выброшены
+    assert ws.sent == ["m1", b"m2", "counts2"]
+    assert manager.stats()["slowest"][0]["dropped_counts"] == 2
+
+
+def test_slow_client_does_not_block_others_and_is_dropped_on_overflow():
+    async def run():
+        manager = WSManager(outbox_high_water=4, resume_buffer_max=100)
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        await manager.connect(slow, "slow", 1, "")
+        await manager.connect(fast, "fast", 2, "")
+        results = []
+        for i in range(6):
+            results.append(await manager.send_encoded("slow", "game_update", str(i)))
+            await manager.send_encoded("fast", "game_update", str(i))
+            await _drain()
+        return manager, slow, fast, results
+
+    manager, slow, fast, results = asyncio.run(run())
+    assert fast.sent == [str(i) for i in range(6)]
+    # Первое сообщение уже у писателя, ещё high_water в очереди, следующее — переполнение
+    assert results == [True] * 5 + [False]
+    assert slow.closed_with == 4008 and manager.slow_disconnects == 1
+    assert manager.stats()["connections"] == 1 and manager.stats()["parked"] == 1
+
+
+def test_heartbeat_pings_and_reaps_silent_connections():
+    async def run():
+        manager = WSManager(ping_interval_s=15)
+        alive, dead = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(alive, "alive", 1, "")
+        await manager.connect(dead, "dead", 2, "")
+        conns = list(manager._by_user.values())
+        manager._heartbeat(conns)
+        await _drain()
+        assert alive.sent == dead.sent == ['{"type":"ping"}']
+        # Ping ещё свежий — повторно не шлётся и не считается пропущенным
+        manager._heartbeat(conns)
+        assert manager.pings == 2 and manager.reaped == 0
+        manager.pong("alive", time.monotonic())
+        for conn in conns:
+            if conn.ping_sent_at is not None:
+                conn.ping_sent_at -= 15
+        manager._heartbeat(conns)
+        await _drain()
+        return manager, alive, dead
+
+    manager, alive, dead = asyncio.run(run())
+    assert dead.closed_with == CLOSE_HEARTBEAT and alive.closed_with is None
+    assert manager.reaped == 1 and manager.pings == 3
+    # Сессия отложена: переподключившийся клиент продолжит её
+    assert manager.stats()["connections"] == 1 and manager.stats()["parked"] == 1
+
+
+def test_rtt_is_the_median_of_recent_samples():
+    async def run():
+        manager = WSManager(ping_interval_s=15)
+        await manager.connect(FakeWebSocket(), "u", 1, "")
+        assert manager.lag_ms("u") == 0
+        conn = manager._by_user["u"]
+        for rtt_ms in [400, 40, 60, 5000, 50] + [80] * RTT_SAMPLES:
+            manager.ping("u")
+            manager.pong("u", conn.ping_sent_at + (rtt_ms + 0.5) / 1000)
+            if rtt_ms == 50:
+                # Один выброс медиану не сдвигает
+                assert manager.lag_ms("u") == 60
+        # pong без ping игнорируется
+        manager.pong("u", time.monotonic() + 100)
+        return manager, conn
+
+    manager, conn = asyncio.run(run())
+    assert len(conn.rtt_samples) == RTT_SAMPLES and manager.lag_ms("u") == 80
+    assert manager.lag_ms("nobody") == 0
+
+
+def test_parked_session_is_handed_over_when_user_is_elsewhere():
+    async def run():
+        manager = WSManager()
+        delivered = []
+        moved = False
+
+        async def remote(user_id, msg_type, text):
+            delivered.append(text)
+            return True
+
+        async def elsewhere(user_id):
+            return moved
+
+        manager.remote, manager.elsewhere = remote, elsewhere
+        await manager.connect(FakeWebSocket(), "u", 1, "")
+        manager.park("u")
+        await manager.send_encoded("u", "game_update", "m1")
+        assert delivered == []
+        # Вошёл на другом воркере, а session_moved сюда не дошёл: первое же сообщение всё пересылает
+        moved = True
+        await manager.send_encoded("u", "game_update", "m2")
+        await manager.send_encoded("u", "game_update", "m3")
+        return manager, delivered
+
+    manager, delivered = asyncio.run(run())
+    assert delivered == ["m1", "m2", "m3"]
+    assert manager.stats()["parked"] == 0 and manager.handed_over == 1
@@ -58,22 +58,35 @@
   let ws = null;
   let currentQueue = null;
   let reconnectTimer = null;
+  /** Токен возобновления сессии: при переподключении вместо полной проверки initData */
+  let resumeToken = null;
+  /** Сервер продолжил прежнюю сессию и дошлёт всё пропущенное — докачивать партию не нужно */
+  let sessionResumed = false;
   let currentGameId = null;
   let myColor = null;
   let gameFen = null;
   let gameMoves = [];
+  /** seq последнего применённого game_update: по разрыву в seq запрашиваем недостающее */
+  let gameSeq = 0;
   let whiteRemainingMs = 0;
   let blackRemainingMs = 0;
   let gameResult = null;
   let selectedSquare = null;
   let legalTargets = [];
   let lastMove = null;
+  /** Премув {from, to}: сервер сделает его сразу после хода соперника */
+  let premove = null;
   let clockInterval = null;
   let boardFlipped = false;
   let lastClockTick = 0;
   let resignConfirming = false;
   let resignConfirmTimeout = null;
   let draggedSquare = null;
+  /** Режим зрителя: партия чужая, ходить нельзя, обновления приходят с задержкой */
+  let spectating = false;
+  let whiteName = '';
+  let blackName = '';
+  const TOP_GAMES_REFRESH_MS = 10000;
 
   const $ = (id) => document.getElementById(id);
   const lobbyButtons = $('lobby-buttons');
@@ -91,6 +104,7 @@
   const moveListEl = $('move-list');
   const btnResign = $('btn-resign');
   const btnFlipBoard = $('btn-flip-board');
+  const topGamesList = $('top-games-list');
 
   function getInitData() {
     if (window.Telegram && window.Telegram.WebApp && window.Telegram.WebApp.initData) {
@@ -129,6 +143,40 @@
     });
   }
 
+  function requestTopGames() {
+    if (!ws || ws.readyState !== WebSocket.OPEN || currentGameId) return;
+    ws.send(JSON.stringify({ type: 'top_games', limit: 10 }));
+  }
+
+  function renderTopGames(games) {
+    if (!topGamesList) return;
+    games = games || [];
+    if (!games.length) {
+      topGamesList.textContent = 'Сейчас партий нет';
+      return;
+    }
+    topGamesList.innerHTML = '';
+    games.forEach(function (g) {
+      const btn = document.createElement('button');
+      btn.type = 'button';
+      btn.className = 'top-game';
+      const names = document.createElement('span');
+      names.textContent = (g.white_username || 'Белые') + ' — ' + (g.black_username || 'Чёрные');
+      const meta = document.createElement('span');
+      meta.className = 'top-game-meta';
+      meta.textContent = g.time_control + ' · ' + Math.round(g.rating) + (g.spectators ? ' · 👁 ' + g.spectators : '');
+      btn.appendChild(names);
+      btn.appendChild(meta);
+      btn.addEventListener('click', function () { watchGame(g.game_id); });
+      topGamesList.appendChild(btn);
+    });
+  }
+
+  function watchGame(gameId) {
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+    ws.send(JSON.stringify({ type: 'watch_game', game_id: gameId }));
+  }
+
   function onModeClick(timeControl) {
     if (!ws || ws.readyState !== WebSocket.OPEN) return;
     if (timeControl === currentQueue) {
@@ -154,6 +202,10 @@
   }
 
   function updateClocksDisplay() {
+    if (spectating) {
+      updateSpectatorClocks();
+      return;
+    }
     const isWhite = myColor === 'white';
     const topMs = isWhite ? blackRemainingMs : whiteRemainingMs;
     const bottomMs = isWhite ? whiteRemainingMs : blackRemainingMs;
@@ -173,6 +225,24 @@
     }
   }
 
+  /** Зритель: сверху чёрные, снизу белые; подсвечены часы стороны, чей ход. */
+  function updateSpectatorClocks() {
+    const whiteToMove = !!gameFen && gameFen.includes(' w ');
+    if (clockTopLabel) clockTopLabel.textContent = 'Чёрные' + (blackName ? ' (' + blackName + ')' : '');
+    if (clockBottomLabel) clockBottomLabel.textContent = 'Белые' + (whiteName ? ' (' + whiteName + ')' : '');
+    if (gameYourSideEl) gameYourSideEl.textContent = 'Вы смотрите партию';
+    if (clockTop) {
+      clockTop.textContent = formatClock(blackRemainingMs);
+      clockTop.classList.toggle('low-time', blackRemainingMs < 20000 && blackRemainingMs > 0);
+      clockTop.classList.toggle('our-turn', !whiteToMove && !gameResult);
+    }
+    if (clockBottom) {
+      clockBottom.textContent = formatClock(whiteRemainingMs);
+      clockBottom.classList.toggle('low-time', whiteRemainingMs < 20000 && whiteRemainingMs > 0);
+      clockBottom.classList.toggle('our-turn', whiteToMove && !gameResult);
+    }
+  }
+
   function tickClocks() {
     if (gameResult) return;
     const now = Date.now();
@@ -180,7 +250,7 @@
     if (!fen) return;
     const turn = fen.includes(' w ') ? 'white' : 'black';
     const isOurTurn = (turn === 'white' && myColor === 'white') || (turn === 'black' && myColor === 'black');
-    if (lastClockTick > 0 && isOurTurn) {
+    if (lastClockTick > 0 && (isOurTurn || spectating)) {
       const elapsed = Math.min(now - lastClockTick, 1000);
       if (turn === 'white') whiteRemainingMs = Math.max(0, whiteRemainingMs - elapsed);
       else blackRemainingMs = Math.max(0, blackRemainingMs - elapsed);
@@ -271,6 +341,7 @@
           draggedSquare = null;
         });
         if (lastMove && (lastMove.from === sq || lastMove.to === sq)) div.classList.add('last-move');
+        if (premove && (premove.from === sq || premove.to === sq)) div.classList.add('premove');
         if (selectedSquare === sq) div.classList.add('selected');
         if (legalTargets.indexOf(sq) !== -1) div.classList.add('legal');
         if (window.Chess && (piece === 'K' || piece === 'k')) {
@@ -297,19 +368,48 @@
     }
   }
 
+  function isOurTurn() {
+    var turn = gameFen.split(' ')[1];
+    return (turn === 'w' && myColor === 'white') || (turn === 'b' && myColor === 'black');
+  }
+
+  /**
+   * Позиция для выбора хода: текущая, а в ход соперника — она же с нашей очередью хода
+   * (для премува; точная легальность проверяется сервером после ответа соперника).
+   */
+  function moveChess() {
+    if (isOurTurn()) return new Chess(gameFen);
+    var parts = gameFen.split(' ');
+    parts[1] = myColor === 'white' ? 'w' : 'b';
+    parts[3] = '-';
+    return new Chess(parts.join(' '));
+  }
+
+  /** Ход в свою очередь — make_move, в очередь соперника — premove. */
+  function sendMove(from, to, promotion) {
+    var type = isOurTurn() ? 'make_move' : 'premove';
+    premove = type === 'premove' ? { from: from, to: to } : null;
+    ws.send(JSON.stringify({ type: type, game_id: currentGameId, from: from, to: to, promotion: promotion }));
+  }
+
+  function cancelPremove() {
+    if (!premove) return;
+    premove = null;
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: 'premove', game_id: currentGameId, from: null, to: null }));
+    }
+  }
+
   function doMoveFromTo(fromSq, toSq) {
-    if (!currentGameId || !gameFen || gameResult) return;
+    if (!currentGameId || !gameFen || gameResult || spectating) return;
     try {
-      var c = new Chess(gameFen);
+      var c = moveChess();
     } catch (e) { return; }
-    var turn = c.turn();
-    var ourTurn = (turn === 'w' && myColor === 'white') || (turn === 'b' && myColor === 'black');
-    if (!ourTurn) return;
     var moves = c.moves({ square: fromSq, verbose: true });
     var move = moves && moves.find(function (m) { return m.to === toSq; });
     if (!move) return;
     var promotion = (move.flags || '').indexOf('p') !== -1 ? 'q' : null;
-    ws.send(JSON.stringify({ type: 'make_move', game_id: currentGameId, from: fromSq, to: toSq, promotion: promotion }));
+    sendMove(fromSq, toSq, promotion);
     selectedSquare = null;
     legalTargets = [];
     renderBoard();
@@ -320,16 +420,20 @@
       console.log('[PhoneChess] onSquareClick early return: no game/fen/result');
       return;
     }
+    if (spectating) return;
+    if (premove && !selectedSquare) {
+      // Повторное касание в ход соперника отменяет премув
+      cancelPremove();
+      renderBoard();
+      return;
+    }
     try {
-      var c = new Chess(gameFen);
+      var c = moveChess();
     } catch (e) {
       console.error('[PhoneChess] onSquareClick Chess error', e);
       return;
     }
-    var turn = c.turn();
-    var isWhite = turn === 'w';
-    var ourTurn = (isWhite && myColor === 'white') || (!isWhite && myColor === 'black');
-    if (!ourTurn) return;
+    var isWhite = c.turn() === 'w';
     var piece = c.get(sq);
     var pieceColor = piece && typeof piece === 'object' ? piece.color : null;
     if (selectedSquare) {
@@ -339,7 +443,7 @@
         var moves = c.moves({ square: from, verbose: true });
         var move = moves && moves.find(function (m) { return m.to === sq; });
         if (move && (move.flags || '').indexOf('p') !== -1) promotion = 'q';
-        ws.send(JSON.stringify({ type: 'make_move', game_id: currentGameId, from: from, to: sq, promotion: promotion }));
+        sendMove(from, sq, promotion);
         selectedSquare = null;
         legalTargets = [];
         renderBoard();
@@ -371,6 +475,37 @@
     moveListEl.innerHTML = html || '—';
   }
 
+  /** Подписка на партию: сервер пришлёт только ходы после тех, что уже есть (game_delta). */
+  function subscribeGame() {
+    if (!currentGameId || !ws || ws.readyState !== WebSocket.OPEN) return;
+    if (spectating) {
+      // Зритель получает снимок заново: watch_game повторно не занимает место в канале
+      watchGame(currentGameId);
+      return;
+    }
+    ws.send(JSON.stringify({ type: 'subscribe_game', game_id: currentGameId, since: gameMoves.length }));
+  }
+
+  function applyGameDelta(data) {
+    gameMoves = gameMoves.slice(0, data.since).concat(data.moves || []);
+    applyGameState(Object.assign({}, data, { moves: gameMoves }));
+  }
+
+  function applyGameUpdate(data) {
+    if (data.game_id && data.game_id !== currentGameId) return;
+    if (data.seq != null) {
+      if (data.seq <= gameSeq) return;
+      // Ход соперника и сработавший премув приходят одним обновлением: seq вырос на 2
+      var step = data.premove && !data.premove.rejected ? 2 : 1;
+      if (data.seq > gameSeq + step) {
+        console.warn('[PhoneChess] game_update gap', gameSeq, data.seq);
+        subscribeGame();
+        return;
+      }
+    }
+    applyGameState(data);
+  }
+
   function applyGameState(data) {
     console.log('[PhoneChess] applyGameState', { hasFen: !!data.fen, moves: data.moves?.length, result: data.result });
     gameFen = data.fen || gameFen;
@@ -378,32 +513,48 @@
     blackRemainingMs = data.black_remaining_ms != null ? data.black_remaining_ms : blackRemainingMs;
     if (data.moves) gameMoves = data.moves;
     if (data.result !== undefined) gameResult = data.result;
+    if (data.seq != null) gameSeq = data.seq;
     if (data.san && data.move_time_ms !== undefined) {
       gameMoves = gameMoves.concat([{ san: data.san, time_ms: data.move_time_ms }]);
     }
     if (data.from && data.to) lastMove = { from: data.from, to: data.to };
+    if (data.premove && data.premove.san) {
+      gameMoves = gameMoves.concat([{ san: data.premove.san, time_ms: data.premove.move_time_ms }]);
+      lastMove = { from: data.premove.from, to: data.premove.to };
+    }
+    // Премув сработал, отклонён или сервер успел принять его как обычный ход
+    if (data.premove || gameResult || (data.san && !isOurTurn())) premove = null;
     updateClocksDisplay();
     startClockTicker();
     renderBoard();
     renderMoveList();
     if (gameResult && gameInfo) {
       const r = gameResult === '1-0' ? 'Белые выиграли' : gameResult === '0-1' ? 'Чёрные выиграли' : 'Ничья';
-      gameInfo.textContent = gameInfo.textContent + ' — ' + r;
+      const mine = data.ratings && myColor && !spectating ? data.ratings[myColor] : null;
+      const change = mine ? ' (рейтинг ' + mine.rating + ', ' + (mine.delta >= 0 ? '+' : '') + mine.delta + ')' : '';
+      gameInfo.textContent = gameInfo.textContent + ' — ' + r + change;
     }
   }
 
   function enterGame(msg) {
     console.log('[PhoneChess] enterGame', { game_id: msg.game_id, color: msg.color, hasFen: !!msg.fen });
+    if (spectating && ws && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: 'unwatch_game', game_id: currentGameId }));
+    }
+    spectating = false;
+    if (btnResign) btnResign.style.display = '';
     currentGameId = msg.game_id;
     myColor = msg.color;
     gameFen = msg.fen;
     whiteRemainingMs = msg.white_remaining_ms != null ? msg.white_remaining_ms : 0;
     blackRemainingMs = msg.black_remaining_ms != null ? msg.black_remaining_ms : 0;
     gameMoves = [];
+    gameSeq = 0;
     gameResult = null;
     selectedSquare = null;
     legalTargets = [];
     lastMove = null;
+    premove = null;
     boardFlipped = false;
     if (resignConfirmTimeout) clearTimeout(resignConfirmTimeout);
     resignConfirming = false;
@@ -414,9 +565,32 @@
     startClockTicker();
     renderBoard();
     renderMoveList();
-    if (ws && ws.readyState === WebSocket.OPEN) {
-      ws.send(JSON.stringify({ type: 'subscribe_game', game_id: currentGameId }));
+    subscribeGame();
+  }
+
+  /** Открыть чужую партию для просмотра (ответ spectate на watch_game). */
+  function enterSpectate(msg) {
+    if (spectating && msg.game_id === currentGameId) {
+      applyGameState(msg);
+      return;
     }
+    spectating = true;
+    currentGameId = msg.game_id;
+    myColor = null;
+    whiteName = msg.white_username || '';
+    blackName = msg.black_username || '';
+    gameMoves = [];
+    gameSeq = 0;
+    gameResult = null;
+    selectedSquare = null;
+    legalTargets = [];
+    lastMove = null;
+    premove = null;
+    boardFlipped = false;
+    if (btnResign) btnResign.style.display = 'none';
+    if (gameInfo) gameInfo.textContent = (whiteName || 'Белые') + ' vs ' + (blackName || 'Чёрные') + ' (' + (msg.time_control || '') + ')';
+    showScreen('game-screen');
+    applyGameState(msg);
   }
 
   function connect() {
@@ -433,6 +607,7 @@
         var payload = { type: 'auth', init_data: initData || '' };
         var debugUid = getDebugUid ? getDebugUid() : null;
         if (debugUid != null) payload.debug_uid = debugUid;
+        if (resumeToken) payload.resume_token = resumeToken;
         ws.send(JSON.stringify(payload));
       } catch (e) {
         ws.send(JSON.stringify({ type: 'auth', init_data: '', debug_uid: 0 }));
@@ -442,12 +617,22 @@
     ws.onmessage = function (event) {
       try {
         const msg = JSON.parse(event.data);
-        if (msg.type === 'queue_counts') {
+        if (msg.type === 'ping') {
+          // Сервер меряет задержку и отключает молчащих: отвечать сразу
+          ws.send(JSON.stringify({ type: 'pong' }));
+        } else if (msg.type === 'session') {
+          resumeToken = msg.resume_token || null;
+          sessionResumed = !!(msg.resumed && msg.complete);
+        } else if (msg.type === 'queue_counts') {
           if (reconnectTimer) {
             clearInterval(reconnectTimer);
             reconnectTimer = null;
+            // После переподключения докачать пропущенные ходы текущей партии
+            // (если сессия не возобновилась целиком)
+            if (!sessionResumed) subscribeGame();
           }
           renderLobbyButtons(msg.counts);
+          if (!wsStatus.classList.contains('connected')) requestTopGames();
           setWsStatus('Подключено', 'connected');
         } else if (msg.type === 'matched') {
           currentQueue = null;
@@ -455,8 +640,17 @@
         } else if (msg.type === 'game_state') {
           console.log('[PhoneChess] WS game_state received');
           applyGameState(msg);
+        } else if (msg.type === 'game_delta') {
+          applyGameDelta(msg);
         } else if (msg.type === 'game_update') {
-          applyGameState(msg);
+          applyGameUpdate(msg);
+        } else if (msg.type === 'top_games') {
+          renderTopGames(msg.games);
+        } else if (msg.type === 'spectate') {
+          enterSpectate(msg);
+        } else if (msg.type === 'watch_rejected') {
+          console.warn('[PhoneChess] watch rejected', msg.reason);
+          requestTopGames();
         }
       } catch (e) {
         console.warn('ws message parse', e);
@@ -484,8 +678,14 @@
   btnBackGame.addEventListener('click', function () {
     if (clockInterval) clearInterval(clockInterval);
     clockInterval = null;
+    if (spectating && ws && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: 'unwatch_game', game_id: currentGameId }));
+    }
+    spectating = false;
+    if (btnResign) btnResign.style.display = '';
     currentGameId = null;
     showScreen('lobby-screen');
+    requestTopGames();
   });
   if (btnFlipBoard) {
     btnFlipBoard.addEventListener('click', function () {
@@ -522,5 +722,7 @@
   }
 
   renderLobbyButtons({});
+  renderTopGames([]);
+  setInterval(requestTopGames, TOP_GAMES_REFRESH_MS);
   connect();
 })();